@@ -1,136 +1,144 @@
 #!/usr/bin/env python3
 """
-Add new hikes from a Strava export folder without duplicates.
-Usage: python3 scripts/add_new_hikes.py <path_to_export_folder>
+Add new hikes from a Strava export folder or ZIP without duplicates.
+Usage: python3 scripts/add_new_hikes.py <path_to_export_folder_or_zip>
+
+A ZIP is read in place: only activities.csv and the new hikes' GPS files
+are decompressed, straight into data/activities.
 """
 
-import csv
 import os
-import shutil
 import sys
 
+from hike_db import HikeDB, export_pending
+from ingest_export import INGEST_MANIFEST, IngestManifest, iter_hikes, open_export
+
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
-HIKING_CSV = os.path.join(DATA_DIR, 'hiking_activities.csv')
-TRAIL_NAMES_CSV = os.path.join(DATA_DIR, 'trail_names.csv')
 ACTIVITIES_DIR = os.path.join(DATA_DIR, 'activities')
 
 
-def load_existing_ids():
-    with open(HIKING_CSV, newline='') as f:
-        reader = csv.DictReader(f)
-        return {row['Activity ID'] for row in reader}
-
-
-def load_new_hikes(export_dir):
-    csv_path = os.path.join(export_dir, 'activities.csv')
-    with open(csv_path, newline='') as f:
-        reader = csv.DictReader(f)
-        hikes = [row for row in reader if 'hike' in row['Activity Type'].lower()]
-    return hikes
-
-
-def next_hike_number():
-    with open(TRAIL_NAMES_CSV, newline='') as f:
-        rows = list(csv.DictReader(f))
-    return max(int(r['Hike_Number']) for r in rows) + 1
-
-
-def append_to_hiking_csv(new_hikes):
-    with open(HIKING_CSV, newline='') as f:
-        fieldnames = csv.DictReader(f).fieldnames
-    with open(HIKING_CSV, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-        for hike in new_hikes:
-            writer.writerow(hike)
-
-
-def append_to_trail_names(new_hikes, start_number):
-    fieldnames = ['Hike_Number', 'Activity_ID', 'Date', 'Original_Name',
-                  'Trail_Name', 'Distance_km', 'Location', 'Notes', 'Blog_URL']
-    with open(TRAIL_NAMES_CSV, 'a', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        for i, hike in enumerate(new_hikes):
-            dist_m = float(hike['Distance']) if hike['Distance'] else 0
-            dist_km = round(dist_m / 1000, 1)
-            # Parse date - take just the date portion
-            date_raw = hike['Activity Date']
-            date_short = date_raw[:12].strip().rstrip(',')
-            writer.writerow({
-                'Hike_Number': start_number + i,
-                'Activity_ID': hike['Activity ID'],
-                'Date': date_short,
-                'Original_Name': hike['Activity Name'],
-                'Trail_Name': '',
-                'Distance_km': dist_km,
-                'Location': '',
-                'Notes': '',
-                'Blog_URL': '',
-            })
-
-
-def copy_gps_files(new_hikes, export_dir):
+def load_new_hikes(export, existing_ids):
+    """Stream the export's activities.csv, returning hikes not already added"""
+    with export.open_csv() as f:
+        rows = iter_hikes(f)
+        header = next(rows)
+        # Duplicate columns keep the last value, as with csv.DictReader
+        hikes = [dict(zip(header, row)) for row in rows]
+    new_hikes = [h for h in hikes if h['Activity ID'] not in existing_ids]
+    return len(hikes), new_hikes
+
+
+def hiking_rows(new_hikes, export):
+    """The export's raw CSV rows for new_hikes, in the same order"""
+    # Copy the export's raw rows: activities.csv has two 'Distance' columns
+    # (km, then meters) and a DictWriter would write the meters into both
+    new_ids = {hike['Activity ID'] for hike in new_hikes}
+    with export.open_csv() as f:
+        rows = iter_hikes(f)
+        id_column = next(rows).index('Activity ID')
+        rows = {row[id_column]: row for row in rows if row[id_column] in new_ids}
+    return [rows[hike['Activity ID']] for hike in new_hikes]
+
+
+def trail_rows(new_hikes):
+    """trail_names.csv rows (without Hike_Number) for new_hikes"""
+    trails = []
+    for hike in new_hikes:
+        dist_m = float(hike['Distance']) if hike['Distance'] else 0
+        dist_km = round(dist_m / 1000, 1)
+        # Parse date - take just the date portion
+        date_raw = hike['Activity Date']
+        date_short = date_raw[:12].strip().rstrip(',')
+        trails.append({
+            'Activity_ID': hike['Activity ID'],
+            'Date': date_short,
+            'Original_Name': hike['Activity Name'],
+            'Trail_Name': '',
+            'Distance_km': str(dist_km),
+            'Location': '',
+            'Notes': '',
+            'Blog_URL': '',
+        })
+    return trails
+
+
+def copy_gps_files(new_hikes, export):
+    """Link, copy or extract the new hikes' GPS files into data/activities"""
+    manifest = IngestManifest(os.path.join(DATA_DIR, INGEST_MANIFEST))
     copied = 0
     missing = 0
     for hike in new_hikes:
-        fname = os.path.basename(hike['Filename'])
-        src = os.path.join(export_dir, fname)
-        dst = os.path.join(ACTIVITIES_DIR, fname)
-        if os.path.exists(src):
-            shutil.copy2(src, dst)
-            copied += 1
-        else:
-            print(f'  WARNING: GPS file not found: {fname}')
+        if not hike['Filename']:
+            continue
+        if export.ingest(manifest, hike['Filename'], ACTIVITIES_DIR) == 'missing':
+            print(f'  WARNING: GPS file not found: {os.path.basename(hike["Filename"])}')
             missing += 1
+        else:
+            copied += 1
+    manifest.save()
     return copied, missing
 
 
-def main():
-    if len(sys.argv) < 2:
-        print('Usage: python3 scripts/add_new_hikes.py <path_to_export_folder>')
-        sys.exit(1)
-
-    export_dir = sys.argv[1]
-    if not os.path.isdir(export_dir):
-        print(f'ERROR: Directory not found: {export_dir}')
-        sys.exit(1)
-
-    print('=' * 60)
-    print('ADDING NEW HIKES (deduplicated)')
-    print('=' * 60)
+def add_hikes_from_export(export):
+    """Append the export's new hikes to the CSVs and bring in their GPS files
 
-    existing_ids = load_existing_ids()
+    Returns the number of hikes added.
+    """
+    db = HikeDB(DATA_DIR)
+    existing_ids = db.activity_ids()
     print(f'Existing hikes: {len(existing_ids)}')
 
-    all_hikes = load_new_hikes(export_dir)
-    new_hikes = [h for h in all_hikes if h['Activity ID'] not in existing_ids]
-    print(f'Hikes in export: {len(all_hikes)}')
+    export_count, new_hikes = load_new_hikes(export, existing_ids)
+    print(f'Hikes in export: {export_count}')
     print(f'New hikes to add: {len(new_hikes)}')
 
     if not new_hikes:
         print('Nothing to do — map is already up to date.')
-        return
+        db.close()
+        return 0
 
     # Sort new hikes chronologically so numbering is in order
     new_hikes.sort(key=lambda h: h['Activity Date'])
 
-    start_num = next_hike_number()
-    print(f'\nAssigning hike numbers {start_num}–{start_num + len(new_hikes) - 1}')
+    # Rows and hike numbers are added in one transaction
+    print('\nAdding to hiking_activities.csv and trail_names.csv...')
+    start_num = db.add_hikes(hiking_rows(new_hikes, export), trail_rows(new_hikes))
+    db.close()
+    print(f'Assigned hike numbers {start_num}–{start_num + len(new_hikes) - 1}')
 
     print('\nNew hikes:')
     for i, h in enumerate(new_hikes):
         dist_km = round(float(h['Distance']) / 1000, 1)
         print(f'  #{start_num + i}: {h["Activity Date"][:15]} | {h["Activity Name"]} | {dist_km} km')
 
-    print('\nAppending to hiking_activities.csv...')
-    append_to_hiking_csv(new_hikes)
-
-    print('Appending to trail_names.csv...')
-    append_to_trail_names(new_hikes, start_num)
-
     print('Copying GPS files...')
-    copied, missing = copy_gps_files(new_hikes, export_dir)
+    copied, missing = copy_gps_files(new_hikes, export)
     print(f'  Copied: {copied}, Missing: {missing}')
+    return len(new_hikes)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: python3 scripts/add_new_hikes.py <path_to_export_folder_or_zip>')
+        sys.exit(1)
+
+    export_path = sys.argv[1]
+
+    print('=' * 60)
+    print('ADDING NEW HIKES (deduplicated)')
+    print('=' * 60)
+
+    try:
+        with open_export(export_path) as export:
+            added = add_hikes_from_export(export)
+    except FileNotFoundError as e:
+        print(f'ERROR: {e}')
+        sys.exit(1)
+    if not added:
+        return
+    # Write both CSVs now rather than leaving it to the map build
+    export_pending(DATA_DIR)
 
     print('\nRegenerating map...')
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -139,7 +147,7 @@ def main():
     plot_hikes.create_summary_stats(DATA_DIR)
 
     print('\n' + '=' * 60)
-    print(f'DONE! Added {len(new_hikes)} new hikes.')
+    print(f'DONE! Added {added} new hikes.')
     print(f'Map saved to: {map_path}')
     print('=' * 60)
 
@@ -1,188 +1,442 @@
 #!/usr/bin/env python3
 """
-Auto-name unnamed hikes using GPS midpoint + Overpass API (trail names)
-with Nominatim fallback (park/nature area names).
+Auto-name unnamed hikes by the trail their whole GPS track follows
+(Overpass API trail geometry) with Nominatim fallback (park/nature area names).
 
 Usage:
     python3 scripts/auto_name_hikes.py          # preview only
     python3 scripts/auto_name_hikes.py --apply  # write to trail_names.csv
+    python3 scripts/auto_name_hikes.py --batch  # one Overpass query per region
+    python3 scripts/auto_name_hikes.py --osm trails.geojson  # offline, from an OSM extract
+
+Responses are cached per geohash cell in data/.geocode_cache.sqlite, so
+nearby hikes share them (--no-cache to bypass).
+OVERPASS_URL / NOMINATIM_URL in the environment point the script at another
+server, e.g. scripts/replay_server.py for offline runs.
 """
 
-import csv
-import gzip
+import argparse
+import asyncio
+import itertools
 import json
 import os
-import sys
+import random
 import time
+import urllib.error
 import urllib.parse
 import urllib.request
-from datetime import datetime
+
+import numpy as np
+
+from geocode_cache import GeocodeCache, geohash_bounds, geohash_cells
+from hike_db import HikeDB
+from osm_trails import MATCH_DISTANCE_M, TrailIndex, load_extract
+from rate_limit import TokenBucket
+from track_store import open_store
 
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
-TRAIL_NAMES_CSV = os.path.join(DATA_DIR, 'trail_names.csv')
-HIKING_CSV = os.path.join(DATA_DIR, 'hiking_activities.csv')
-ACTIVITIES_DIR = os.path.join(DATA_DIR, 'activities')
+GEOCODE_CACHE_PATH = os.path.join(DATA_DIR, '.geocode_cache.sqlite')
 
-OVERPASS_URL = 'https://overpass-api.de/api/interpreter'
-NOMINATIM_URL = 'https://nominatim.openstreetmap.org/reverse'
+OVERPASS_URL = os.environ.get('OVERPASS_URL', 'https://overpass-api.de/api/interpreter')
+NOMINATIM_URL = os.environ.get('NOMINATIM_URL', 'https://nominatim.openstreetmap.org/reverse')
 USER_AGENT = 'tourwithmark-hiking-map/1.0 (contact via tourwithmark.com)'
 
+# Requests per second (and burst) for each service; Nominatim allows 1/s
+RATE_LIMITS = {
+    'overpass': TokenBucket(rate=2.0, capacity=2),
+    'nominatim': TokenBucket(rate=0.9, capacity=1),
+}
+RETRY_STATUSES = {429, 502, 503, 504}
+MAX_RETRIES = 4
+BACKOFF_BASE_S = 2.0
+
+
+def _open_json(req, timeout):
+    with urllib.request.urlopen(req, timeout=timeout) as r:
+        return json.loads(r.read())
+
+
+async def request_json(service, req, timeout):
+    """Fetch and parse a JSON response within the service's rate limit.
+
+    Overload responses (429/5xx) are retried with exponential backoff, or
+    after Retry-After when the server sends one; the whole service is
+    paused meanwhile. Other errors raise.
+    """
+    limiter = RATE_LIMITS[service]
+    for attempt in itertools.count():
+        await limiter.acquire()
+        try:
+            return await asyncio.to_thread(_open_json, req, timeout)
+        except urllib.error.HTTPError as e:
+            if e.code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                raise
+            retry_after = (e.headers.get('Retry-After') or '') if e.headers else ''
+            delay = (float(retry_after) if retry_after.isdigit()
+                     else BACKOFF_BASE_S * 2 ** attempt * random.uniform(1.0, 1.5))
+            limiter.defer(delay)
+
 
 # ---------------------------------------------------------------------------
-# GPS parsing
+# GPS tracks
 # ---------------------------------------------------------------------------
 
-def get_midpoint_coords(activity_id, filename):
+def get_midpoint_coords(store, activity_id):
     """Return (lat, lon) at the midpoint of the track."""
-    fname = os.path.basename(filename)
-    path = os.path.join(ACTIVITIES_DIR, fname)
-    if not os.path.exists(path):
+    track = store.track(activity_id)
+    if track is None or not len(track['lat']):
         return None
-    try:
-        points = []
-        if path.endswith('.gpx'):
-            import gpxpy
-            with open(path) as f:
-                gpx = gpxpy.parse(f)
-            for track in gpx.tracks:
-                for seg in track.segments:
-                    for p in seg.points:
-                        points.append((p.latitude, p.longitude))
-        elif path.endswith('.fit.gz'):
-            from fitparse import FitFile
-            with gzip.open(path, 'rb') as gz:
-                fit = FitFile(gz.read())
-            for record in fit.get_messages('record'):
-                vals = {d.name: d.value for d in record}
-                if vals.get('position_lat') and vals.get('position_long'):
-                    lat = vals['position_lat'] * (180 / 2**31)
-                    lon = vals['position_long'] * (180 / 2**31)
-                    points.append((lat, lon))
-        if points:
-            mid = points[len(points) // 2]
-            return mid
-    except Exception as e:
-        pass
-    return None
+    return midpoint(track)
+
+
+def midpoint(track):
+    """Return (lat, lon) of the middle point of a stored track."""
+    mid = len(track['lat']) // 2
+    return float(track['lat'][mid]), float(track['lon'][mid])
+
+
+def track_bbox(tracks, pad_m):
+    """Return (south, west, north, east) around tracks, padded by pad_m meters."""
+    lats = np.concatenate([t['lat'] for t in tracks])
+    lons = np.concatenate([t['lon'] for t in tracks])
+    pad_lat = pad_m / 111320.0
+    pad_lon = pad_lat / max(np.cos(np.radians(np.abs(lats).max())), 0.01)
+    return (float(lats.min() - pad_lat), float(lons.min() - pad_lon),
+            float(lats.max() + pad_lat), float(lons.max() + pad_lon))
 
 
 # ---------------------------------------------------------------------------
-# Overpass API — find named trails within radius
+# Overpass API — named trails with geometry in a bounding box
 # ---------------------------------------------------------------------------
 
-def query_overpass_trails(lat, lon, radius=500):
-    """Return list of nearby named hiking/foot paths, best match first."""
+async def fetch_overpass_bbox(south, west, north, east):
+    """Return named trails with geometry in a bounding box (raises on errors).
+
+    Each trail is {'name': ..., 'lines': [[[lat, lon], ...], ...]}.
+    """
     query = f"""
-[out:json][timeout:10];
+[out:json][timeout:90][bbox:{south},{west},{north},{east}];
 (
-  way["highway"~"path|footway|track"]["name"](around:{radius},{lat},{lon});
-  relation["route"="hiking"]["name"](around:{radius},{lat},{lon});
+  way["highway"~"path|footway|track"]["name"];
+  relation["route"="hiking"]["name"];
 );
-out tags;
+out tags geom;
 """
     data = urllib.parse.urlencode({'data': query}).encode()
     req = urllib.request.Request(OVERPASS_URL, data=data,
                                   headers={'User-Agent': USER_AGENT})
+    result = await request_json('overpass', req, timeout=120)
+    trails = []
+    for el in result.get('elements', []):
+        name = el.get('tags', {}).get('name', '').strip()
+        if not name:
+            continue
+        if el['type'] == 'way':
+            geometries = [el.get('geometry', [])]
+        else:
+            geometries = [m.get('geometry', []) for m in el.get('members', [])]
+        lines = [[[p['lat'], p['lon']] for p in geom if p] for geom in geometries]
+        lines = [line for line in lines if line]
+        if lines:
+            trails.append({'name': name, 'lines': lines})
+    return trails
+
+
+# With a cache, Overpass responses are cached per geohash cell of this
+# precision (~5 km x 5 km), so hikes in the same area share them
+OVERPASS_CELL_PRECISION = 5
+
+# Cells being fetched right now: {cell: task resolving to {cell: trails}}
+_cell_fetches = {}
+
+
+def _touches(trail, bounds):
+    """Whether any segment of a trail may cross bounds (south, west, north, east)
+
+    Compares segment bounding boxes, so it never misses a trail but can
+    keep one that passes just outside a corner; matching scores trails
+    by distance anyway.
+    """
+    south, west, north, east = bounds
+    for line in trail['lines']:
+        points = np.asarray(line, dtype=np.float64)
+        a, b = (points[:-1], points[1:]) if len(points) > 1 else (points, points)
+        lat_low, lat_high = np.minimum(a[:, 0], b[:, 0]), np.maximum(a[:, 0], b[:, 0])
+        lon_low, lon_high = np.minimum(a[:, 1], b[:, 1]), np.maximum(a[:, 1], b[:, 1])
+        if np.any((lat_low <= north) & (lat_high >= south) &
+                  (lon_low <= east) & (lon_high >= west)):
+            return True
+    return False
+
+
+async def fetch_overpass_cells(cells, cache):
+    """Fetch the trails of geohash cells in one Overpass query and cache them per cell.
+
+    Returns {cell: trails} (raises on errors, caching nothing).
+    """
+    bounds = [geohash_bounds(cell) for cell in cells]
+    trails = await fetch_overpass_bbox(min(b[0] for b in bounds), min(b[1] for b in bounds),
+                                       max(b[2] for b in bounds), max(b[3] for b in bounds))
+    by_cell = {cell: [trail for trail in trails if _touches(trail, cell_bounds)]
+               for cell, cell_bounds in zip(cells, bounds)}
+    for cell, cell_trails in by_cell.items():
+        cache.put('overpass_cell', cell, 0, cell_trails)
+    return by_cell
+
+
+async def query_overpass_bbox(bbox, cache=None):
+    """Return named trails in bbox (south, west, north, east), [] on errors.
+
+    With a cache, the bbox is snapped outward to the geohash cells
+    covering it. Cached cells cost nothing; the rest are fetched in a
+    single Overpass query (or awaited, if another hike is already
+    fetching them), so a lookup never sends more than one request.
+    """
     try:
-        with urllib.request.urlopen(req, timeout=15) as r:
-            result = json.loads(r.read())
-        names = []
-        for el in result.get('elements', []):
-            name = el.get('tags', {}).get('name', '').strip()
-            if name and name not in names:
-                names.append(name)
-        return names
+        if cache is None:
+            return await fetch_overpass_bbox(*bbox)
+        found = {}
+        missing = []
+        for cell in geohash_cells(bbox, OVERPASS_CELL_PRECISION):
+            cell_trails = cache.get('overpass_cell', cell)
+            if cell_trails is None:
+                missing.append(cell)
+            else:
+                found[cell] = cell_trails
+        tasks = {_cell_fetches[cell] for cell in missing if cell in _cell_fetches}
+        to_fetch = [cell for cell in missing if cell not in _cell_fetches]
+        if to_fetch:
+            task = asyncio.ensure_future(fetch_overpass_cells(to_fetch, cache))
+            _cell_fetches.update((cell, task) for cell in to_fetch)
+            task.add_done_callback(lambda _: [_cell_fetches.pop(cell, None) for cell in to_fetch])
+            tasks.add(task)
+        for by_cell in await asyncio.gather(*tasks):
+            found.update((cell, by_cell[cell]) for cell in missing if cell in by_cell)
     except Exception:
         return []
+    # A trail crossing a cell border is cached in each cell it touches
+    trails = {}
+    for trail in itertools.chain.from_iterable(found.values()):
+        trails.setdefault(json.dumps(trail, sort_keys=True), trail)
+    return list(trails.values())
+
+
+# ---------------------------------------------------------------------------
+# Whole-track matching — score every trail by how much of the track follows it
+# ---------------------------------------------------------------------------
+
+# Minimum overlap for a trail match: this many meters of the track, or
+# this share of it, must run along the trail
+MIN_OVERLAP_M = 200.0
+MIN_OVERLAP_FRACTION = 0.2
+
+
+def best_trail(ranked, source):
+    """Return (name, source) for the top of a ranked match, or (None, None) if too weak."""
+    if ranked:
+        name, overlap, fraction = ranked[0]
+        if overlap >= MIN_OVERLAP_M or fraction >= MIN_OVERLAP_FRACTION:
+            return name, f'trail ({source}, {overlap / 1000:.1f} km / {fraction:.0%} of track)'
+    return None, None
+
+
+async def match_track(track, cache=None):
+    """Rank the named trails a track runs along, best first.
+
+    One Overpass query fetches the trails around the whole track; the
+    track is then resampled and scored locally. Returns
+    [(name, overlap_m, fraction)], fraction being the share of the track
+    on that trail.
+    """
+    trails = await query_overpass_bbox(track_bbox([track], MATCH_DISTANCE_M), cache)
+    return TrailIndex(trails).match(track['lat'], track['lon'])
+
+
+# ---------------------------------------------------------------------------
+# Overpass batch mode — one bounding-box query per region, matched locally
+# ---------------------------------------------------------------------------
+
+BATCH_CELL_DEG = 0.25  # Hikes are grouped into regions of this many degrees
+
+
+def group_by_region(coords, cell_deg=BATCH_CELL_DEG):
+    """Group {key: (lat, lon)} into {region: [key, ...]} by grid cell"""
+    regions = {}
+    for key, (lat, lon) in coords.items():
+        cell = (int(np.floor(lat / cell_deg)), int(np.floor(lon / cell_deg)))
+        regions.setdefault(cell, []).append(key)
+    return regions
+
+
+async def suggest_names_batch(tracks, trail_only=False, cache=None):
+    """Return {key: (suggested_name, source)} for {key: track}.
+
+    One Overpass query per region (none if its cells are cached) covers
+    every hike in it; each track is then matched against the region's
+    trails locally. Nominatim is only asked (per hike) when no trail
+    matches and trail_only is off.
+    Regions are fetched concurrently, within the rate limits.
+    """
+    results = {}
+    regions = group_by_region({key: midpoint(track) for key, track in tracks.items()})
+
+    async def suggest_region(keys):
+        trails = await query_overpass_bbox(
+            track_bbox([tracks[k] for k in keys], MATCH_DISTANCE_M), cache)
+        index = TrailIndex(trails)
+        fallback = []
+        for key in keys:
+            ranked = index.match(tracks[key]['lat'], tracks[key]['lon'])
+            name, source = best_trail(ranked, 'Overpass batch')
+            if name:
+                results[key] = (name, source)
+            elif trail_only:
+                results[key] = (None, 'no trail found')
+            else:
+                fallback.append(key)
+        noms = await asyncio.gather(*(query_nominatim(*midpoint(tracks[key]), cache)
+                                      for key in fallback))
+        for key, nom in zip(fallback, noms):
+            results[key] = (nom, 'area (Nominatim)') if nom else (None, 'no result')
+        print(f'  Region done: {len(keys)} hikes', flush=True)
+
+    await asyncio.gather(*(suggest_region(keys) for keys in regions.values()))
+    return results
 
 
 # ---------------------------------------------------------------------------
 # Nominatim — park / nature area fallback
 # ---------------------------------------------------------------------------
 
-def query_nominatim(lat, lon):
-    """Return a park/nature area name near the coordinates."""
+async def fetch_nominatim(lat, lon):
+    """Return a park/nature area name near the coordinates (raises on errors)."""
     params = f'lat={lat}&lon={lon}&format=json&zoom=14&namedetails=1'
     url = f'{NOMINATIM_URL}?{params}'
     req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    data = await request_json('nominatim', req, timeout=10)
+    addr = data.get('address', {})
+    # Prefer leisure/nature/tourism over generic place names
+    for key in ['leisure', 'natural', 'tourism', 'park',
+                'suburb', 'village', 'town']:
+        if addr.get(key):
+            return addr[key]
+    # Fall back to the top-level name of the feature
+    return data.get('name') or None
+
+
+async def query_nominatim(lat, lon, cache=None):
+    """Return a park/nature area name near the coordinates."""
     try:
-        with urllib.request.urlopen(req, timeout=10) as r:
-            data = json.loads(r.read())
-        addr = data.get('address', {})
-        # Prefer leisure/nature/tourism over generic place names
-        for key in ['leisure', 'natural', 'tourism', 'park',
-                    'suburb', 'village', 'town']:
-            if addr.get(key):
-                return addr[key]
-        # Fall back to the top-level name of the feature
-        name = data.get('name', '')
-        if name:
-            return name
+        if cache is None:
+            return await fetch_nominatim(lat, lon)
+        return await cache.lookup_async('nominatim', lat, lon, 0, fetch_nominatim)
     except Exception:
-        pass
-    return None
+        return None
 
 
 # ---------------------------------------------------------------------------
 # Main logic
 # ---------------------------------------------------------------------------
 
-def suggest_name(lat, lon, trail_only=False):
-    """Return (suggested_name, source) for a coordinate."""
-    # 1. Try Overpass for trail names (500m radius first, then 1km)
-    for radius in (500, 1000):
-        trails = query_overpass_trails(lat, lon, radius)
-        if trails:
-            return trails[0], f'trail (Overpass, {radius}m)'
-        time.sleep(0.5)
+async def suggest_name(track, trail_only=False, cache=None):
+    """Return (suggested_name, source) for a stored track."""
+    # 1. The trail most of the track runs along (one Overpass query)
+    name, source = best_trail(await match_track(track, cache), 'Overpass')
+    if name:
+        return name, source
 
     if trail_only:
         return None, 'no trail found'
 
     # 2. Fall back to Nominatim park/area name
-    time.sleep(0.5)
-    nom = query_nominatim(lat, lon)
+    nom = await query_nominatim(*midpoint(track), cache)
     if nom:
         return nom, 'area (Nominatim)'
 
     return None, 'no result'
 
 
-def load_activity_filenames():
-    with open(HIKING_CSV, newline='') as f:
-        return {r['Activity ID']: r['Filename'] for r in csv.DictReader(f)}
+async def suggest_names(tracks, trail_only=False, cache=None):
+    """Return {key: (suggested_name, source)} for {key: track}.
 
+    Every hike is looked up concurrently; the per-service rate limits,
+    not network latency, bound the total time.
+    """
+    names = await asyncio.gather(*(suggest_name(track, trail_only, cache)
+                                   for track in tracks.values()))
+    return dict(zip(tracks, names))
 
-def load_trail_names():
-    with open(TRAIL_NAMES_CSV, newline='') as f:
-        return list(csv.DictReader(f))
 
+def suggest_name_offline(index, store, activity_id):
+    """Return (suggested_name, source) from the trail the whole track follows most."""
+    track = store.track(activity_id)
+    ranked = index.match(track['lat'], track['lon']) if track is not None else []
+    name, source = best_trail(ranked, 'OSM extract')
+    return (name, source) if name else (None, 'no trail found')
 
-def save_trail_names(rows):
-    fieldnames = ['Hike_Number', 'Activity_ID', 'Date', 'Original_Name',
-                  'Trail_Name', 'Distance_km', 'Location', 'Notes', 'Blog_URL']
-    with open(TRAIL_NAMES_CSV, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
-        writer.writeheader()
-        writer.writerows(rows)
+
+def load_activity_filenames(db):
+    return {r['Activity ID']: r['Filename'] for r in db.activities()}
 
 
 def main():
-    apply = '--apply' in sys.argv
+    parser = argparse.ArgumentParser(description="Suggest names for unnamed hikes")
+    parser.add_argument('--apply', action='store_true',
+                        help="Write suggestions to trail_names.csv (trail names only)")
+    parser.add_argument('--trail-only', action='store_true',
+                        help="Don't fall back to Nominatim park/area names")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Bypass the geocode cache")
+    parser.add_argument('--batch', action='store_true',
+                        help="One Overpass query per region instead of per hike")
+    parser.add_argument('--osm', metavar='EXTRACT',
+                        help="Match tracks offline against an OSM extract (.geojson or .osm.pbf)")
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help="Processes used to decode new tracks (default: all cores)")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    apply = args.apply
 
     print('=' * 60)
     print('AUTO-NAMING HIKES')
     print(f'Mode: {"APPLY (will write changes)" if apply else "PREVIEW (dry run)"}')
     print('=' * 60)
 
-    trails = load_trail_names()
-    activities = load_activity_filenames()
+    db = HikeDB(DATA_DIR)
+    trails = db.trails()
+    activities = load_activity_filenames(db)
+    store = open_store(DATA_DIR, args.jobs)
+    cache = None if args.no_cache else GeocodeCache(GEOCODE_CACHE_PATH)
 
     unnamed = [t for t in trails if not t['Trail_Name'].strip()]
     print(f'Unnamed hikes: {len(unnamed)} / {len(trails)}')
     print()
 
+    trail_only = args.trail_only or apply  # apply mode always uses trail-only
+    index = None
+    if args.osm:
+        index = TrailIndex(load_extract(args.osm))
+        print(f'Loaded {len(index.names)} named trails ({len(index.owners)} segments) '
+              f'from {args.osm}')
+        print()
+    online = None
+    if index is None:
+        tracks = {t['Activity_ID']: store.track(t['Activity_ID'])
+                  for t in unnamed if activities.get(t['Activity_ID'])}
+        tracks = {aid: track for aid, track in tracks.items()
+                  if track is not None and len(track['lat'])}
+        start = time.monotonic()
+        if args.batch:
+            print(f'Batch mode: querying Overpass by region for {len(tracks)} hikes')
+            online = asyncio.run(suggest_names_batch(tracks, trail_only=trail_only, cache=cache))
+        else:
+            print(f'Looking up {len(tracks)} hikes concurrently')
+            online = asyncio.run(suggest_names(tracks, trail_only=trail_only, cache=cache))
+        print(f'Lookups finished in {time.monotonic() - start:.1f}s')
+        print()
+
     suggestions = []
 
     for i, trail in enumerate(unnamed):
@@ -198,15 +452,14 @@ def main():
             print('no filename, skipping')
             continue
 
-        coords = get_midpoint_coords(aid, fname)
-        if not coords:
+        if not get_midpoint_coords(store, aid):
             print('no GPS data, skipping')
             continue
 
-        lat, lon = coords
-        trail_only = '--trail-only' in sys.argv or apply  # apply mode always uses trail-only
-        name, source = suggest_name(lat, lon, trail_only=trail_only)
-        time.sleep(1.1)  # Nominatim rate limit
+        if index is not None:
+            name, source = suggest_name_offline(index, store, aid)
+        else:
+            name, source = online[aid]
 
         if name:
             print(f'→ "{name}"  [{source}]')
@@ -216,6 +469,8 @@ def main():
 
     print()
     print(f'Suggestions found: {len(suggestions)} / {len(unnamed)}')
+    if cache is not None:
+        print(f'Geocode cache: {cache.hits} hits, {cache.misses} misses')
 
     if not suggestions:
         print('Nothing to update.')
@@ -227,14 +482,15 @@ def main():
         print(f'  #{trail["Hike_Number"]:>3} {trail["Date"]:<15} {trail["Original_Name"]:<35} → {name}')
 
     if apply:
-        # Build a lookup of suggestions
-        suggestion_map = {t['Hike_Number']: name for t, name in suggestions}
-        updated = 0
-        for row in trails:
-            if row['Hike_Number'] in suggestion_map and not row['Trail_Name'].strip():
-                row['Trail_Name'] = suggestion_map[row['Hike_Number']]
-                updated += 1
-        save_trail_names(trails)
+        # Only fill names that are still empty: another run or a hand
+        # edit of trail_names.csv may have named a hike meanwhile
+        with db.transaction():
+            db.sync()
+            still_unnamed = {t['Hike_Number']: name for t, name in suggestions
+                             if not (db.trail(t['Hike_Number']) or {}).get('Trail_Name', '').strip()}
+            updated = db.update_trails({number: {'Trail_Name': name}
+                                        for number, name in still_unnamed.items()})
+        db.flush()
         print(f'\n✅ Updated {updated} hike names in trail_names.csv')
     else:
         print()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Index of blog posts and the hiking map links injected into them
+One pass over tours/*/index.qmd and everything/*/index.qmd records each
+post's path, mtime and the link blocks it already carries. Blocks are
+wrapped in stable markers,
+
+    <!-- hiking-map-link hike=87 -->
+    <div ...>...</div>
+    <!-- /hiking-map-link -->
+
+so adding and removing them is exact: removing a block restores the text
+it was inserted into, and a post whose blocks already match is never
+rewritten. Blocks injected before the markers existed are recognised by
+their styling plus their link to a hike on the map, and replaced.
+"""
+
+import json
+import os
+import re
+from urllib.parse import urlsplit
+
+POST_SECTIONS = ('tours', 'everything')
+INDEX_VERSION = 1
+BLOG_INDEX = '.blog_index.json'  # Cache of index_posts() in data/
+
+LINK_START = '<!-- hiking-map-link hike={} -->'
+LINK_END = '<!-- /hiking-map-link -->'
+LINK_BLOCK_RE = re.compile(r'\n<!-- hiking-map-link hike=(\d+) -->\n.*?\n<!-- /hiking-map-link -->\n',
+                           re.DOTALL)
+# Unmarked blocks written by earlier versions of add_hiking_map_links.py: the
+# styled div holding a link to a hike on the map and its "View Hike" text.
+# Other divs with the same styling are the author's and are left alone.
+_IN_DIV = r'(?:(?!</div>).)*?'
+LEGACY_BLOCK_RE = re.compile(r'<div style="background-color: #f0f8ff;[^>]*>' + _IN_DIV +
+                             r'href="/hiking_map\.html#\d+"' + _IN_DIV +
+                             r'on the Interactive Hiking Map' + _IN_DIV + r'</div>\s*', re.DOTALL)
+
+
+def create_hiking_map_link(hike_number, trail_name):
+    """Create the hiking map link HTML/Markdown"""
+    link_text = f"View Hike #{hike_number}: {trail_name} on the Interactive Hiking Map"
+
+    # Create a styled link block
+    link_html = f'''<div style="background-color: #f0f8ff; border: 2px solid #007bff; border-radius: 8px; padding: 15px; margin: 20px 0; text-align: center;">
+  <p style="margin: 0; font-size: 16px;">
+    🥾 <a href="/hiking_map.html#{hike_number}" target="_blank" style="color: #007bff; text-decoration: none; font-weight: bold;">
+      {link_text}
+    </a> 🗺️
+  </p>
+</div>'''
+    return link_html
+
+
+def link_block(hike_number, trail_name):
+    """The marked block for one hike, as inserted (leading blank line included)"""
+    return (f"\n{LINK_START.format(hike_number)}\n"
+            f"{create_hiking_map_link(hike_number, trail_name)}\n{LINK_END}\n")
+
+
+def find_links(content):
+    """Return (blocks, legacy): the marked blocks in order, and the number of unmarked ones"""
+    blocks = [m.group(0) for m in LINK_BLOCK_RE.finditer(content)]
+    legacy = len(LEGACY_BLOCK_RE.findall(LINK_BLOCK_RE.sub('', content)))
+    return blocks, legacy
+
+
+def strip_links(content):
+    """Remove every hiking map link block, marked or legacy"""
+    return LEGACY_BLOCK_RE.sub('', LINK_BLOCK_RE.sub('', content))
+
+
+def _insert_position(content):
+    """Offset after the last image, or else the last non-heading content line"""
+    lines = content.splitlines(keepends=True)
+    for i in range(len(lines) - 1, -1, -1):
+        line = lines[i].strip()
+        if line.startswith('![') or line.startswith('<img') or (line and not line.startswith('#')):
+            return sum(len(l) for l in lines[:i + 1])
+    return len(content)
+
+
+def set_links(content, blocks):
+    """Return content carrying exactly blocks (link_block strings), in that order"""
+    content = strip_links(content)
+    if not blocks:
+        return content
+    position = _insert_position(content)
+    return content[:position] + ''.join(blocks) + content[position:]
+
+
+def post_key_from_url(blog_url):
+    """'tours/<slug>' (or 'everything/<slug>') for a blog post URL, or None"""
+    parts = urlsplit(blog_url).path.strip('/').split('/')
+    if len(parts) >= 2 and parts[-2] in POST_SECTIONS:
+        return f"{parts[-2]}/{parts[-1]}"
+    return None
+
+
+def index_posts(base_dir, cache_path=None):
+    """Return {post_key: {'path', 'mtime_ns', 'size', 'blocks', 'legacy'}}
+
+    Posts whose size and mtime match the cache at cache_path are not
+    re-read. The cache is updated when given.
+    """
+    cached = {}
+    if cache_path:
+        try:
+            with open(cache_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == INDEX_VERSION:
+                cached = data['posts']
+        except (OSError, ValueError):
+            pass
+
+    posts = {}
+    for section in POST_SECTIONS:
+        section_dir = os.path.join(base_dir, section)
+        if not os.path.isdir(section_dir):
+            continue
+        for entry in os.scandir(section_dir):
+            path = os.path.join(entry.path, 'index.qmd')
+            try:
+                st = os.stat(path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            key = f"{section}/{entry.name}"
+            post = cached.get(key)
+            if not post or post['mtime_ns'] != st.st_mtime_ns or post['size'] != st.st_size:
+                with open(path, 'r', encoding='utf-8') as f:
+                    blocks, legacy = find_links(f.read())
+                post = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size,
+                        'blocks': blocks, 'legacy': legacy}
+            posts[key] = dict(post, path=path)
+
+    if cache_path:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': INDEX_VERSION,
+                       'posts': {k: {f: v for f, v in p.items() if f != 'path'}
+                                 for k, p in posts.items()}}, f)
+        os.replace(tmp_path, cache_path)
+    return posts
+
+
+def desired_links(trails):
+    """{post_key: [block, ...]} for trail rows (dicts) with a Blog_URL
+
+    Unknown URLs are returned separately as a list.
+    """
+    desired = {}
+    unresolved = []
+    for row in trails:
+        blog_url = row.get('Blog_URL', '')
+        if not blog_url:
+            continue
+        key = post_key_from_url(blog_url)
+        if key is None:
+            unresolved.append(blog_url)
+            continue
+        # Use trail name if available, otherwise use original name
+        display_name = row.get('Trail_Name') or row.get('Original_Name', 'Unknown Trail')
+        desired.setdefault(key, []).append((int(row['Hike_Number']), display_name))
+    return ({key: [link_block(n, name) for n, name in sorted(links)]
+             for key, links in desired.items()}, unresolved)
+
+
+def needs_update(post, blocks):
+    """True if the post's link blocks differ from blocks"""
+    return post['blocks'] != blocks or post['legacy'] > 0
+
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Build manifest for incremental map rebuilds
+Records, per activity, a hash of everything that ends up on the map (the
+source file's content hash from the track store, the CSV rows, settings)
+and the generated map fragment. A rebuild only regenerates fragments whose
+inputs changed.
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 2
+
+
+def hash_fields(fields):
+    """Stable hash of a JSON-serialisable value (e.g. a CSV row)"""
+    material = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class BuildManifest:
+    """Per-activity record of input hashes and generated fragments"""
+
+    def __init__(self, path):
+        self.path = path
+        self.hikes = {}
+        self.reused = 0
+        self.rebuilt = 0
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.hikes = data.get('hikes', {})
+        except (OSError, ValueError):
+            pass
+
+    def get(self, activity_id, key):
+        """Return the stored fragment for activity_id if it was built from key
+
+        The caller counts it with reuse() once it actually keeps it.
+        """
+        entry = self.hikes.get(activity_id)
+        if entry and entry['key'] == key:
+            return entry['fragment']
+        return None
+
+    def reuse(self):
+        self.reused += 1
+
+    def put(self, activity_id, key, fragment):
+        self.hikes[activity_id] = {'key': key, 'fragment': fragment}
+        self.rebuilt += 1
+
+    def prune(self, activity_ids):
+        """Forget activities that are no longer in the build"""
+        activity_ids = set(activity_ids)
+        self.hikes = {k: v for k, v in self.hikes.items() if k in activity_ids}
+
+    def save(self):
+        """Write the manifest atomically"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'hikes': self.hikes},
+                      f, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
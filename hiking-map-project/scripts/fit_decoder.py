@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Streaming FIT decoder that only extracts track data
+Reads definition messages and unpacks just the position, timestamp, altitude
+and heart-rate fields of 'record' messages into typed arrays, without
+building a Python object per field like fitparse does.
+"""
+
+import gzip
+import struct
+from array import array
+
+SEMICIRCLES_TO_DEGREES = 180.0 / 2**31
+FIT_EPOCH_OFFSET = 631065600  # Seconds between 1970-01-01 and 1989-12-31
+
+RECORD_MESG_NUM = 20
+TIMESTAMP_FIELD = 253
+
+# record field number -> output column
+RECORD_FIELDS = {
+    0: 'lat',                # position_lat (semicircles)
+    1: 'lon',                # position_long (semicircles)
+    2: 'altitude',           # altitude (scale 5, offset 500)
+    3: 'heart_rate',         # heart_rate (bpm)
+    78: 'enhanced_altitude', # enhanced_altitude (scale 5, offset 500)
+    TIMESTAMP_FIELD: 'time', # timestamp (seconds since FIT epoch)
+}
+
+# FIT base type number -> (struct code, invalid value)
+BASE_TYPES = {
+    0x00: ('B', 0xFF),                # enum
+    0x01: ('b', 0x7F),                # sint8
+    0x02: ('B', 0xFF),                # uint8
+    0x03: ('h', 0x7FFF),              # sint16
+    0x04: ('H', 0xFFFF),              # uint16
+    0x05: ('i', 0x7FFFFFFF),          # sint32
+    0x06: ('I', 0xFFFFFFFF),          # uint32
+    0x0A: ('B', 0x00),                # uint8z
+    0x0B: ('H', 0x0000),              # uint16z
+    0x0C: ('I', 0x00000000),          # uint32z
+    0x0E: ('q', 0x7FFFFFFFFFFFFFFF),  # sint64
+    0x0F: ('Q', 0xFFFFFFFFFFFFFFFF),  # uint64
+    0x10: ('Q', 0x0000000000000000),  # uint64z
+}
+
+CHUNK_SIZE = 64 * 1024
+
+
+class FitDecodeError(Exception):
+    """Raised when a file is not a valid FIT stream"""
+
+
+class _StreamBuffer:
+    """Reads a binary stream in fixed-size chunks and hands out byte slices"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buf = b''
+        self.pos = 0
+        self.consumed = 0  # Bytes handed out so far
+
+    def read(self, n):
+        if len(self.buf) - self.pos < n:
+            self.buf = self.buf[self.pos:]
+            self.pos = 0
+            while len(self.buf) < n:
+                chunk = self.stream.read(max(CHUNK_SIZE, n))
+                if not chunk:
+                    raise FitDecodeError("Unexpected end of file")
+                self.buf += chunk
+        start = self.pos
+        self.pos += n
+        self.consumed += n
+        return self.buf, start
+
+    def peek(self):
+        """Return the next byte without consuming it (call after at_eof)"""
+        return self.buf[self.pos]
+
+    def at_eof(self):
+        if self.pos < len(self.buf):
+            return False
+        self.buf = self.stream.read(CHUNK_SIZE)
+        self.pos = 0
+        return not self.buf
+
+
+def open_fit(filepath):
+    """Open a .fit or .fit.gz file as a binary stream"""
+    if filepath.endswith('.gz'):
+        return gzip.open(filepath, 'rb')
+    return open(filepath, 'rb')
+
+
+def _field_layout(fields, endian, columns):
+    """Build a struct that unpacks only the wanted fields of a message
+
+    Returns (struct, [(column, invalid_value), ...]) where fields not in
+    columns are skipped as padding bytes.
+    """
+    fmt = [endian]
+    wanted = []
+    for field_num, size, base_type in fields:
+        column = columns.get(field_num)
+        type_info = BASE_TYPES.get(base_type & 0x1F)
+        if column and type_info and struct.calcsize(type_info[0]) == size:
+            fmt.append(type_info[0])
+            wanted.append((column, type_info[1]))
+        else:
+            fmt.append(f'{size}x')
+    return struct.Struct(''.join(fmt)), wanted
+
+
+def _new_track():
+    return {
+        'lat': array('i'),
+        'lon': array('i'),
+        'time': array('q'),
+        'altitude': array('d'),
+        'heart_rate': array('B'),
+    }
+
+
+def decode_fit(source):
+    """Decode record messages from a FIT file path or binary stream
+
+    Returns a dict of typed arrays, one entry per record that has a
+    position: 'lat'/'lon' (int32 semicircles), 'time' (Unix seconds, 0 if
+    missing), 'altitude' (meters, NaN if missing) and 'heart_rate' (bpm,
+    0 if missing). Records with a missing or zero position are skipped,
+    matching what plot_hikes and auto_name_hikes kept from fitparse.
+    """
+    if isinstance(source, str):
+        with open_fit(source) as f:
+            return decode_fit(f)
+
+    track = _new_track()
+    reader = _StreamBuffer(source)
+    _decode_stream(reader, track)
+    # A FIT file may contain several chained FIT streams
+    while not reader.at_eof() and reader.peek() in (12, 14):
+        _decode_stream(reader, track)
+    return track
+
+
+def _decode_stream(reader, track):
+    """Decode one FIT stream (header, records, CRC) into track"""
+    buf, pos = reader.read(1)
+    header_size = buf[pos]
+    if header_size not in (12, 14):
+        raise FitDecodeError(f"Invalid FIT header size {header_size}")
+    buf, pos = reader.read(header_size - 1)
+    data_size, = struct.unpack_from('<I', buf, pos + 3)
+    if buf[pos + 7:pos + 11] != b'.FIT':
+        raise FitDecodeError("Missing .FIT signature")
+
+    lats, lons = track['lat'], track['lon']
+    times, alts, hrs = track['time'], track['altitude'], track['heart_rate']
+    nan = float('nan')
+
+    # local message type -> (size, record struct, record columns, timestamp struct)
+    definitions = {}
+    last_timestamp = 0
+    end = reader.consumed + data_size
+
+    while reader.consumed < end:
+        buf, pos = reader.read(1)
+        header = buf[pos]
+
+        time_offset = None
+        if header & 0x80:
+            # Compressed timestamp header, always a data message
+            local_type = (header >> 5) & 0x3
+            time_offset = header & 0x1F
+        elif header & 0x40:
+            # Definition message
+            local_type = header & 0x0F
+            buf, pos = reader.read(5)
+            endian = '>' if buf[pos + 1] else '<'
+            global_num, = struct.unpack_from(endian + 'H', buf, pos + 2)
+            num_fields = buf[pos + 4]
+            buf, pos = reader.read(num_fields * 3)
+            fields = [tuple(buf[pos + i * 3:pos + i * 3 + 3]) for i in range(num_fields)]
+            size = sum(field_size for _, field_size, _ in fields)
+            if header & 0x20:
+                # Developer fields are counted in the size but never decoded
+                buf, pos = reader.read(1)
+                num_dev = buf[pos]
+                buf, pos = reader.read(num_dev * 3)
+                size += sum(buf[pos + i * 3 + 1] for i in range(num_dev))
+            layout, wanted, ts_layout = None, None, None
+            if global_num == RECORD_MESG_NUM:
+                layout, wanted = _field_layout(fields, endian, RECORD_FIELDS)
+            elif any(num == TIMESTAMP_FIELD for num, _, _ in fields):
+                # Other messages still move the clock used by compressed headers
+                ts_layout, ts_wanted = _field_layout(fields, endian, {TIMESTAMP_FIELD: 'time'})
+                if not ts_wanted:
+                    ts_layout = None
+            definitions[local_type] = (size, layout, wanted, ts_layout)
+            continue
+        else:
+            local_type = header & 0x0F
+
+        try:
+            size, layout, wanted, ts_layout = definitions[local_type]
+        except KeyError:
+            raise FitDecodeError(f"Data message for undefined local type {local_type}")
+        buf, pos = reader.read(size)
+
+        if layout is None:
+            if ts_layout is not None:
+                value, = ts_layout.unpack_from(buf, pos)
+                if value != 0xFFFFFFFF:
+                    last_timestamp = value
+            elif time_offset is not None:
+                last_timestamp = _apply_time_offset(last_timestamp, time_offset)
+            continue
+
+        values = {'time': None}
+        for (column, invalid), value in zip(wanted, layout.unpack_from(buf, pos)):
+            values[column] = None if value == invalid else value
+
+        if values['time'] is not None:
+            last_timestamp = values['time']
+        elif time_offset is not None:
+            last_timestamp = _apply_time_offset(last_timestamp, time_offset)
+            values['time'] = last_timestamp
+
+        lat = values.get('lat')
+        lon = values.get('lon')
+        if not lat or not lon:
+            continue
+
+        lats.append(lat)
+        lons.append(lon)
+        timestamp = values['time']
+        times.append(timestamp + FIT_EPOCH_OFFSET if timestamp is not None else 0)
+        altitude = values.get('enhanced_altitude')
+        if altitude is None:
+            altitude = values.get('altitude')
+        alts.append(altitude / 5.0 - 500.0 if altitude is not None else nan)
+        hrs.append(values.get('heart_rate') or 0)
+
+    # Skip the trailing file CRC
+    reader.read(2)
+
+
+def _apply_time_offset(last_timestamp, time_offset):
+    """Resolve a 5-bit compressed timestamp offset against the last timestamp"""
+    timestamp = (last_timestamp & ~0x1F) + time_offset
+    if time_offset < (last_timestamp & 0x1F):
+        timestamp += 0x20
+    return timestamp
+
+
+def read_positions(source):
+    """Return [(lat, lon), ...] in degrees for every record with a position"""
+    track = decode_fit(source)
+    return [(lat * SEMICIRCLES_TO_DEGREES, lon * SEMICIRCLES_TO_DEGREES)
+            for lat, lon in zip(track['lat'], track['lon'])]
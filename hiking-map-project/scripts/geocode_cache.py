@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of Overpass/Nominatim responses
+Responses are stored in SQLite keyed by service, geohash cell and search
+radius. Lookups are snapped to the cell center, so every point in a cell
+(re-runs, or another hike starting nearby) gets the same cached answer.
+Entries older than the TTL are refetched.
+"""
+
+import asyncio
+import json
+import sqlite3
+import time
+
+GEOHASH_PRECISION = 7  # ~150 m x 150 m cells
+DEFAULT_TTL_S = 90 * 24 * 3600  # 90 days
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_MISSING = object()
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Return the geohash of a coordinate"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def geohash_bounds(cell):
+    """Return the (south, west, north, east) bounds of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in cell:
+        value = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def geohash_center(cell):
+    """Return the (lat, lon) center of a geohash cell"""
+    south, west, north, east = geohash_bounds(cell)
+    return (south + north) / 2, (west + east) / 2
+
+
+def geohash_cells(bbox, precision=GEOHASH_PRECISION):
+    """Return the geohash cells covering bbox (south, west, north, east)"""
+    lat_bits = 5 * precision // 2
+    height = 180.0 / (1 << lat_bits)
+    width = 360.0 / (1 << (5 * precision - lat_bits))
+    south, west, north, east = bbox
+
+    def span(low, high, origin, size, count):
+        first = min(max(int((low - origin) // size), 0), count - 1)
+        last = min(max(int((high - origin) // size), 0), count - 1)
+        return [origin + (i + 0.5) * size for i in range(first, last + 1)]
+
+    return [geohash_encode(lat, lon, precision)
+            for lat in span(south, north, -90.0, height, 1 << lat_bits)
+            for lon in span(west, east, -180.0, width, 1 << (5 * precision - lat_bits))]
+
+
+class GeocodeCache:
+    """SQLite-backed, TTL-expiring cache of geocoding responses"""
+
+    def __init__(self, path, ttl=DEFAULT_TTL_S, precision=GEOHASH_PRECISION):
+        self.path = path
+        self.ttl = ttl
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                service TEXT NOT NULL,
+                cell TEXT NOT NULL,
+                radius INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (service, cell, radius)
+            )
+        """)
+        self.conn.commit()
+
+    def cell_for(self, lat, lon):
+        """Return (cell, center_lat, center_lon) for a coordinate"""
+        cell = geohash_encode(lat, lon, self.precision)
+        return (cell,) + geohash_center(cell)
+
+    def get(self, service, cell, radius=0, default=None):
+        """Return the cached response, or default if missing or expired"""
+        row = self.conn.execute(
+            "SELECT response, fetched_at FROM responses "
+            "WHERE service = ? AND cell = ? AND radius = ?",
+            (service, cell, radius)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, service, cell, radius, response):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+            (service, cell, radius, json.dumps(response), time.time()))
+        self.conn.commit()
+
+    def lookup(self, service, lat, lon, radius, fetch):
+        """Return the response for the cell around (lat, lon)
+
+        On a miss, fetch(center_lat, center_lon) is called and its result
+        stored. If fetch raises, nothing is stored and the error propagates.
+        """
+        cell, center_lat, center_lon = self.cell_for(lat, lon)
+        response = self.get(service, cell, radius, _MISSING)
+        if response is _MISSING:
+            response = fetch(center_lat, center_lon)
+            self.put(service, cell, radius, response)
+        return response
+
+    async def lookup_async(self, service, lat, lon, radius, fetch):
+        """lookup() for coroutine fetch functions, called from the event loop
+
+        Concurrent misses on the same cell share a single fetch, so hikes
+        starting at the same trailhead cost one request.
+        """
+        cell, center_lat, center_lon = self.cell_for(lat, lon)
+        key = (service, cell, radius)
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await pending
+        response = self.get(service, cell, radius, _MISSING)
+        if response is not _MISSING:
+            return response
+        pending = asyncio.ensure_future(fetch(center_lat, center_lon))
+        self._pending[key] = pending
+        try:
+            response = await pending
+        finally:
+            del self._pending[key]
+        self.put(service, cell, radius, response)
+        return response
+
+    def purge_expired(self):
+        """Delete expired entries, returning how many were removed"""
+        cursor = self.conn.execute("DELETE FROM responses WHERE fetched_at < ?",
+                                   (time.time() - self.ttl,))
+        self.conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self.conn.close()
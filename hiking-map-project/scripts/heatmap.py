@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Pre-rendered heatmap tiles of every recorded GPS point
+Every point of every hike in the track store (the full-resolution tracks,
+not the simplified ones on the map) is counted per pixel of 256 px tiles
+for zooms MIN_ZOOM to MAX_ZOOM, and the counts are drawn as log-scaled
+density into a z/x/y PNG tile pyramid. plot_hikes.py --heatmap adds it to
+the map as a TileLayer.
+
+Density is scaled against a fixed saturation count per zoom, so a tile
+depends only on the points inside it. A manifest records the tiles each
+activity touches, and an update re-renders only the tiles touched by new,
+changed or removed activities. Tiles are rendered and written on a process
+pool; PNGs are encoded here with zlib, so no imaging library is needed.
+
+Usage:
+    python3 scripts/heatmap.py              # update hiking-map-project/heatmap/
+    python3 scripts/heatmap.py --rebuild    # re-render every tile
+"""
+
+import argparse
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from track_store import TrackStore, open_store
+from vector_tiles import EXTENT, project
+
+MIN_ZOOM = 3
+MAX_ZOOM = 14
+TILE_SIZE = 256
+SATURATION = 200       # Points per pixel drawn at full intensity at MAX_ZOOM, doubling per zoom out
+HEATMAP_DIR = 'heatmap'
+MANIFEST = '.manifest.json'
+MANIFEST_VERSION = 1
+BATCH_TILES = 64       # Tiles per rendering task
+
+# Color ramp as (density, RGBA) stops, transparent where nobody walked
+COLOR_STOPS = (
+    (0.0, (0, 64, 255, 0)),
+    (0.1, (0, 96, 255, 140)),
+    (0.35, (0, 220, 255, 190)),
+    (0.6, (255, 240, 0, 220)),
+    (0.85, (255, 96, 0, 240)),
+    (1.0, (255, 255, 255, 255)),
+)
+
+
+def _color_table():
+    """256-entry RGBA lookup table interpolated from COLOR_STOPS"""
+    levels = np.linspace(0.0, 1.0, 256)
+    stops = [stop for stop, _ in COLOR_STOPS]
+    return np.stack([np.interp(levels, stops, [color[c] for _, color in COLOR_STOPS])
+                     for c in range(4)], axis=1).round().astype(np.uint8)
+
+
+COLOR_TABLE = _color_table()
+
+
+def encode_png(rgba):
+    """PNG file bytes of an (height, width, 4) uint8 RGBA array"""
+    height, width, _ = rgba.shape
+    # Each scanline starts with its filter type, 0 (none)
+    raw = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    raw[:, 1:] = rgba.reshape(height, -1)
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data)))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)) +
+            chunk(b'IEND', b''))
+
+
+def render_tile(counts, zoom):
+    """RGBA image of a (TILE_SIZE, TILE_SIZE) array of point counts"""
+    saturation = SATURATION * 2.0 ** (MAX_ZOOM - zoom)
+    density = np.log1p(counts) / np.log1p(saturation)
+    levels = np.clip(np.ceil(density * 255), 0, 255).astype(np.intp)
+    return COLOR_TABLE[levels]
+
+
+def pixels(points, zoom):
+    """World pixel coordinates (x, y) of [lat, lon] points at zoom"""
+    return np.floor(project(points, zoom) * (TILE_SIZE / EXTENT)).astype(np.int64)
+
+
+def activity_tiles(segments, zoom=MAX_ZOOM):
+    """Sorted [[x, y], ...] of the tiles at zoom holding any of a track's points"""
+    if not segments:
+        return []
+    tiles = np.unique(pixels(np.concatenate(segments), zoom) // TILE_SIZE, axis=0)
+    return tiles.tolist()
+
+
+def tile_counts(points, zoom, tiles):
+    """{(x, y): (TILE_SIZE, TILE_SIZE) point counts} for the wanted tiles at zoom"""
+    side = 1 << zoom
+    px = pixels(points, zoom)
+    keys = (px[:, 0] // TILE_SIZE) * side + px[:, 1] // TILE_SIZE
+    wanted = np.array([x * side + y for x, y in tiles], dtype=np.int64)
+    keep = np.isin(keys, wanted)
+    keys, px = keys[keep], px[keep] % TILE_SIZE
+    order = np.argsort(keys, kind='stable')
+    keys, cells = keys[order], (px[order, 1] * TILE_SIZE + px[order, 0])
+    counts = {}
+    bounds = np.flatnonzero(np.diff(keys)) + 1
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(keys)]):
+        if start == end:
+            continue
+        key = int(keys[start])
+        counts[(key // side, key % side)] = np.bincount(
+            cells[start:end], minlength=TILE_SIZE * TILE_SIZE).reshape(TILE_SIZE, TILE_SIZE)
+    return counts
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _render_batch(task):
+    """Render and write one batch of tiles at one zoom (runs in a worker process)
+
+    Tiles left without points are deleted. Returns (written, removed).
+    """
+    store_dir, out_dir, zoom, tiles, activity_ids = task
+    store = TrackStore(store_dir)
+    segments = [segment for activity_id in activity_ids
+                for segment in store.positions(activity_id) or []]
+    counts = tile_counts(np.concatenate(segments), zoom, tiles) if segments else {}
+    written = removed = 0
+    for x, y in tiles:
+        path = os.path.join(out_dir, str(zoom), str(x), f"{y}.png")
+        if (x, y) in counts:
+            _write(path, encode_png(render_tile(counts[(x, y)], zoom)))
+            written += 1
+        elif os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return written, removed
+
+
+def _clear_tiles(out_dir):
+    """Delete every tile of the pyramid in out_dir; returns how many"""
+    removed = 0
+    for zoom in os.listdir(out_dir) if os.path.isdir(out_dir) else []:
+        zoom_dir = os.path.join(out_dir, zoom)
+        if not zoom.isdigit() or not os.path.isdir(zoom_dir):
+            continue
+        for x in os.listdir(zoom_dir):
+            x_dir = os.path.join(zoom_dir, x)
+            if not x.isdigit() or not os.path.isdir(x_dir):
+                continue
+            for name in os.listdir(x_dir):
+                if name.endswith('.png'):
+                    os.remove(os.path.join(x_dir, name))
+                    removed += 1
+            if not os.listdir(x_dir):
+                os.rmdir(x_dir)
+        if not os.listdir(zoom_dir):
+            os.rmdir(zoom_dir)
+    return removed
+
+
+def _settings():
+    """Settings that change every tile, so a change re-renders the pyramid"""
+    return {'zooms': [MIN_ZOOM, MAX_ZOOM], 'tile_size': TILE_SIZE, 'saturation': SATURATION,
+            'colors': [[stop, list(color)] for stop, color in COLOR_STOPS]}
+
+
+def update_heatmap(store, activity_ids, out_dir, jobs=None, rebuild=False):
+    """Bring the tile pyramid in out_dir up to date with activity_ids' tracks
+
+    Returns {'activities': changed or removed, 'written': tiles, 'removed': tiles}.
+    """
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    previous = {}
+    try:
+        with open(manifest_path, 'r') as f:
+            data = json.load(f)
+        if data.get('version') == MANIFEST_VERSION and data.get('settings') == _settings():
+            previous = data['activities']
+    except (OSError, ValueError):
+        pass
+    if rebuild:
+        previous = {}
+    # Without a usable manifest nothing says which old tiles are stale,
+    # e.g. those of activities removed since, so start from an empty pyramid
+    cleared = 0 if previous else _clear_tiles(out_dir)
+
+    # Tiles at MAX_ZOOM touched by an activity before or after this update
+    current = {}
+    dirty = set()
+    changed = 0
+    for activity_id in activity_ids:
+        source = store.source_hash(activity_id)
+        entry = previous.get(activity_id)
+        if entry and entry['source'] == source:
+            current[activity_id] = entry
+            continue
+        entry = {'source': source, 'tiles': activity_tiles(store.positions(activity_id) or [])}
+        current[activity_id] = entry
+        dirty.update(map(tuple, entry['tiles']))
+        if activity_id in previous:
+            dirty.update(map(tuple, previous[activity_id]['tiles']))
+        changed += 1
+    for activity_id in set(previous) - set(current):
+        dirty.update(map(tuple, previous[activity_id]['tiles']))
+        changed += 1
+
+    # Each dirty tile dirties its ancestors; a batch of tiles is rendered
+    # from the activities with points in any of them
+    tasks = []
+    for zoom in range(MAX_ZOOM, MIN_ZOOM - 1, -1):
+        shift = MAX_ZOOM - zoom
+        tiles = sorted({(x >> shift, y >> shift) for x, y in dirty})
+        owners = {}
+        for activity_id, entry in current.items():
+            for x, y in entry['tiles']:
+                owners.setdefault((x >> shift, y >> shift), set()).add(activity_id)
+        for start in range(0, len(tiles), BATCH_TILES):
+            batch = tiles[start:start + BATCH_TILES]
+            batch_ids = sorted(set().union(*(owners.get(tile, set()) for tile in batch)))
+            tasks.append((store.store_dir, out_dir, zoom, batch, batch_ids))
+
+    written, removed = 0, cleared
+    if tasks:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for w, r in pool.map(_render_batch, tasks):
+                written += w
+                removed += r
+
+    os.makedirs(out_dir, exist_ok=True)
+    _write(manifest_path, json.dumps({'version': MANIFEST_VERSION, 'settings': _settings(),
+                                      'activities': current}, separators=(',', ':')).encode())
+    return {'activities': changed, 'written': written, 'removed': removed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Render the heatmap tile pyramid of all hikes")
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help="Processes used to render tiles (default: all cores)")
+    parser.add_argument('--output', metavar='DIR',
+                        help=f"Tile directory (default: hiking-map-project/{HEATMAP_DIR}/)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Re-render every tile instead of only those touched by "
+                             "new or changed activities")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    project_dir = os.path.dirname(script_dir)
+    data_dir = os.path.join(project_dir, 'data')
+
+    store = open_store(data_dir, args.jobs)
+    out_dir = args.output or os.path.join(project_dir, HEATMAP_DIR)
+    stats = update_heatmap(store, sorted(store.activities), out_dir, args.jobs, args.rebuild)
+    print(f"Heatmap: {stats['activities']} activities changed, {stats['written']} tiles "
+          f"written, {stats['removed']} removed in {out_dir}")
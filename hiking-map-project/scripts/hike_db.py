@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Transactional store for trail_names.csv and hiking_activities.csv
+The two CSVs stay the format that is edited by hand, tracked in git and
+read by the map scripts; writers go through a SQLite database (WAL mode)
+in data/.hikes.sqlite instead of rewriting the files themselves. Updates
+are indexed and commit atomically, so a crash or two scripts running at
+once can't corrupt a file or lose each other's changes.
+
+An update only touches its rows in the database and records them as
+pending; the CSVs are not rewritten per update. flush() exports the CSVs
+that have pending rows, atomically. Every command that changes them
+flushes once before it exits, so a batch of updates (an interactive
+update_trail_names.py session, auto_name_hikes.py --apply) costs one
+export. plot_hikes.py and the scripts that read the CSVs (track_store.py,
+hike_stats.py) flush before reading too.
+
+A CSV whose size or mtime no longer matches the last import/export (it
+was edited by hand) is re-imported when the database is opened. Pending
+trail rows are kept over the hand-edited file, so a hand edit and an
+update to different hikes both survive; pending activity rows win over a
+hand-edited hiking_activities.csv, with a warning.
+
+Usage:
+    python3 scripts/hike_db.py           # import edited CSVs, export pending changes
+"""
+
+import csv
+import io
+import json
+import os
+import sqlite3
+import sys
+
+DB_FILENAME = '.hikes.sqlite'
+TRAIL_NAMES_CSV = 'trail_names.csv'
+HIKING_CSV = 'hiking_activities.csv'
+TRAIL_FIELDS = ['Hike_Number', 'Activity_ID', 'Date', 'Original_Name',
+                'Trail_Name', 'Distance_km', 'Location', 'Notes', 'Blog_URL']
+
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def write_if_changed(path, text):
+    """Atomically replace path with text unless it already holds exactly that"""
+    try:
+        with open(path, 'r', newline='') as f:
+            if f.read() == text:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', newline='') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+    return True
+
+
+class HikeDB:
+    """Trail names and activity rows, indexed by Hike_Number and Activity_ID"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.conn = sqlite3.connect(os.path.join(data_dir, DB_FILENAME), timeout=30,
+                                    isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS trails (
+                hike_number INTEGER PRIMARY KEY,
+                activity_id TEXT NOT NULL,
+                fields TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS trails_activity ON trails (activity_id);
+            CREATE TABLE IF NOT EXISTS activities (
+                position INTEGER PRIMARY KEY,
+                activity_id TEXT NOT NULL,
+                row TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS activities_id ON activities (activity_id);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pending (
+                csv TEXT NOT NULL,
+                key TEXT NOT NULL,
+                PRIMARY KEY (csv, key)
+            );
+        """)
+        self.sync()
+
+    def transaction(self):
+        """Context manager for one atomic write (BEGIN IMMEDIATE ... COMMIT)"""
+        return _Transaction(self.conn)
+
+    def _meta(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    def _path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    def _mark(self, name, keys):
+        """Record rows of CSV name (by hike number or activity ID) as not exported yet"""
+        self.conn.executemany("INSERT OR IGNORE INTO pending VALUES (?, ?)",
+                              ((name, str(key)) for key in keys))
+
+    def _pending_keys(self, name):
+        return [key for (key,) in self.conn.execute(
+            "SELECT key FROM pending WHERE csv = ?", (name,))]
+
+    def pending(self):
+        """Names of the CSVs with changes that are not exported yet"""
+        return sorted(name for (name,) in self.conn.execute("SELECT DISTINCT csv FROM pending"))
+
+    # -- CSV import/export ---------------------------------------------------
+
+    def sync(self):
+        """Re-import any CSV that changed since it was last imported or exported"""
+        with self.transaction():
+            for name, load in ((TRAIL_NAMES_CSV, self._import_trails),
+                               (HIKING_CSV, self._import_activities)):
+                stamp = _stamp(self._path(name))
+                if stamp is not None and stamp != self._meta(f'stamp:{name}'):
+                    with open(self._path(name), 'r', newline='') as f:
+                        load(csv.reader(f))
+                    self._set_meta(f'stamp:{name}', stamp)
+
+    def _import_trails(self, reader):
+        header = next(reader)
+        # Rows updated here since the last export win over the edited file
+        kept = [self.conn.execute("SELECT * FROM trails WHERE hike_number = ?",
+                                  (int(key),)).fetchone()
+                for key in self._pending_keys(TRAIL_NAMES_CSV)]
+        self.conn.execute("DELETE FROM trails")
+        self.conn.executemany(
+            "INSERT INTO trails VALUES (?, ?, ?)",
+            ((int(row['Hike_Number']), row['Activity_ID'], json.dumps(row))
+             for row in (dict(zip(header, values)) for values in reader)))
+        self.conn.executemany("INSERT OR REPLACE INTO trails VALUES (?, ?, ?)",
+                              [row for row in kept if row])
+
+    def _import_activities(self, reader, replace=False):
+        if not replace and self._pending_keys(HIKING_CSV):
+            print(f"Warning: {HIKING_CSV} was edited while the database had changes "
+                  f"that are not exported yet; keeping the database's rows", file=sys.stderr)
+            return
+        header = next(reader)
+        id_column = header.index('Activity ID')
+        self._set_meta('activities_header', header)
+        self.conn.execute("DELETE FROM activities")
+        self.conn.executemany(
+            "INSERT INTO activities (activity_id, row) VALUES (?, ?)",
+            ((row[id_column], json.dumps(row)) for row in reader))
+
+    def export_csv(self, names=(TRAIL_NAMES_CSV, HIKING_CSV)):
+        """Write CSVs atomically from the database; returns the names rewritten"""
+        written = []
+        with self.transaction():
+            for name in names:
+                rows = self._trail_rows() if name == TRAIL_NAMES_CSV else self._activity_rows()
+                if rows is None:
+                    continue
+                out = io.StringIO()
+                csv.writer(out).writerows(rows)
+                if write_if_changed(self._path(name), out.getvalue()):
+                    written.append(name)
+                self._set_meta(f'stamp:{name}', _stamp(self._path(name)))
+                self.conn.execute("DELETE FROM pending WHERE csv = ?", (name,))
+        return written
+
+    def flush(self):
+        """Export the CSVs that have pending changes; returns the names rewritten
+
+        Costs one query when nothing is pending.
+        """
+        pending = self.pending()
+        return self.export_csv(pending) if pending else []
+
+    def _trail_rows(self):
+        yield TRAIL_FIELDS
+        for trail in self.trails():
+            yield [trail.get(field, '') for field in TRAIL_FIELDS]
+
+    def _activity_rows(self):
+        header = self._meta('activities_header')
+        if header is None:
+            return None
+        return [header] + [json.loads(row) for (row,) in self.conn.execute(
+            "SELECT row FROM activities ORDER BY position")]
+
+    # -- Trail names -----------------------------------------------------------
+
+    def trails(self):
+        """All trail rows (dicts of CSV fields) in Hike_Number order"""
+        return [json.loads(fields) for (fields,) in self.conn.execute(
+            "SELECT fields FROM trails ORDER BY hike_number")]
+
+    def trail(self, hike_number):
+        """The trail row for a hike number, or None"""
+        row = self.conn.execute("SELECT fields FROM trails WHERE hike_number = ?",
+                                (int(hike_number),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def trail_for_activity(self, activity_id):
+        """The trail row for a Strava activity ID, or None"""
+        row = self.conn.execute("SELECT fields FROM trails WHERE activity_id = ?",
+                                (str(activity_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update_trails(self, updates):
+        """Apply {hike_number: {field: value}} in one transaction; returns rows updated"""
+        updated = 0
+        with self.transaction():
+            for hike_number, fields in updates.items():
+                trail = self.trail(hike_number)
+                if trail is None:
+                    continue
+                trail.update(fields)
+                self.conn.execute("UPDATE trails SET fields = ? WHERE hike_number = ?",
+                                  (json.dumps(trail), int(hike_number)))
+                self._mark(TRAIL_NAMES_CSV, [int(hike_number)])
+                updated += 1
+        return updated
+
+    def update_trail(self, hike_number, **fields):
+        """Update one hike's fields; False if there is no such hike"""
+        return self.update_trails({hike_number: fields}) == 1
+
+    def next_hike_number(self):
+        (last,) = self.conn.execute("SELECT MAX(hike_number) FROM trails").fetchone()
+        return (last or 0) + 1
+
+    # -- Activities ------------------------------------------------------------
+
+    def activity_ids(self):
+        return {activity_id for (activity_id,) in
+                self.conn.execute("SELECT activity_id FROM activities")}
+
+    def activities(self):
+        """Activity rows as dicts of hiking_activities.csv columns, in file order"""
+        header = self._meta('activities_header') or []
+        return [dict(zip(header, json.loads(row))) for (row,) in self.conn.execute(
+            "SELECT row FROM activities ORDER BY position")]
+
+    def add_hikes(self, activity_rows, trails):
+        """Append activity rows and their trail rows, numbering the trails
+
+        Hike numbers are assigned inside the transaction, so concurrent
+        runs can't hand out the same number. trails are dicts of
+        TRAIL_FIELDS without Hike_Number. Returns the first number used.
+        """
+        with self.transaction():
+            header = self._meta('activities_header')
+            id_column = header.index('Activity ID')
+            activity_rows = list(activity_rows)
+            self.conn.executemany(
+                "INSERT INTO activities (activity_id, row) VALUES (?, ?)",
+                ((row[id_column], json.dumps(row)) for row in activity_rows))
+            self._mark(HIKING_CSV, (row[id_column] for row in activity_rows))
+            start = self.next_hike_number()
+            for number, trail in enumerate(trails, start):
+                trail = dict(trail, Hike_Number=str(number))
+                self.conn.execute("INSERT INTO trails VALUES (?, ?, ?)",
+                                  (number, trail['Activity_ID'], json.dumps(trail)))
+                self._mark(TRAIL_NAMES_CSV, [number])
+        return start
+
+    def replace_activities(self, header, rows):
+        """Make the activity table exactly header + rows (a full export sync)"""
+        with self.transaction():
+            rows = list(rows)
+            self._import_activities(iter([header] + rows), replace=True)
+            # The whole file is pending, not just rows that differ
+            self._mark(HIKING_CSV, ['*'])
+
+    def close(self):
+        self.conn.close()
+
+
+def export_pending(data_dir):
+    """Bring data_dir's CSVs up to date before reading them; returns the names rewritten"""
+    db = HikeDB(data_dir)
+    try:
+        return db.flush()
+    finally:
+        db.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE on entry, COMMIT or ROLLBACK on exit; nests as a no-op"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.outer = False
+
+    def __enter__(self):
+        if not self.conn.in_transaction:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.outer = True
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.outer:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    db = HikeDB(os.path.join(os.path.dirname(script_dir), 'data'))
+    written = db.flush()
+    print(f"{len(db.trails())} trails, {len(db.activity_ids())} activities; "
+          f"rewrote {', '.join(written) if written else 'nothing'}")
+    db.close()
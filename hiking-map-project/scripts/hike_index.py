@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Spatial index of all hikes for viewport and "hikes near me" queries
+Each simplified track is cut into pieces of SEGMENT_POINTS points, and the
+pieces' bounding boxes are packed into a static R-tree (spatial_index.STRTree)
+whose leaves point back at their hike. A hike's bounding box is the union
+of its pieces, so the same tree answers "which hikes cross this viewport"
+without a diagonal hike matching every view its bounding box touches.
+
+plot_hikes.py ships the packed leaves with the map, where the page rebuilds
+the upper levels, and saves them to data/.hike_index.json for the Python
+API here. Distances are to the nearest piece's bounding box, so they are
+accurate to the size of a piece (typically a few hundred meters).
+
+Usage:
+    python3 scripts/hike_index.py --near LAT LON KM
+    python3 scripts/hike_index.py --bbox SOUTH WEST NORTH EAST
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from simplify import EARTH_RADIUS_M
+from spatial_index import DEFAULT_NODE_SIZE, STRTree
+
+SEGMENT_POINTS = 32  # Track points per indexed piece; neighbouring pieces share a point
+HIKE_INDEX = '.hike_index.json'
+INDEX_VERSION = 1
+
+KM_PER_DEG = np.radians(1.0) * EARTH_RADIUS_M / 1000
+
+
+def track_segments(points, size=SEGMENT_POINTS):
+    """Bounding boxes [min_lon, min_lat, max_lon, max_lat] of a track's pieces
+
+    points are [lat, lon]; consecutive pieces share their end point so no
+    stretch of track between two pieces is left out.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    boxes = []
+    for start in range(0, max(len(points) - 1, 1), size - 1):
+        piece = points[start:start + size]
+        boxes.append([piece[:, 1].min(), piece[:, 0].min(), piece[:, 1].max(), piece[:, 0].max()])
+    return [[round(float(v), 5) for v in box] for box in boxes]
+
+
+class HikeIndex:
+    """Packed R-tree over track pieces, answering queries with hike positions"""
+
+    def __init__(self, segments, node_size=DEFAULT_NODE_SIZE):
+        """segments[i] is the list of piece boxes of hike i (see track_segments)"""
+        counts = [len(boxes) for boxes in segments]
+        self.items = np.repeat(np.arange(len(segments)), counts)
+        self.boxes = np.array([box for hike_boxes in segments for box in hike_boxes],
+                              dtype=np.float64).reshape(-1, 4)
+        self.tree = STRTree(self.boxes, node_size)
+
+    def query(self, south, west, north, east):
+        """Positions of the hikes with track inside the box, in ascending order"""
+        return np.unique(self.items[self.tree.query(west, south, east, north)])
+
+    def near(self, lat, lon, km):
+        """[(position, distance_km)] of hikes within km of (lat, lon), nearest first"""
+        dlat = km / KM_PER_DEG
+        dlon = dlat / max(np.cos(np.radians(lat)), 0.01)
+        found = self.tree.query(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        if not len(found):
+            return []
+        boxes = self.boxes[found]
+        # Distance to each piece's box in a local equirectangular projection
+        dx = np.maximum.reduce([boxes[:, 0] - lon, np.zeros(len(boxes)), lon - boxes[:, 2]])
+        dy = np.maximum.reduce([boxes[:, 1] - lat, np.zeros(len(boxes)), lat - boxes[:, 3]])
+        dist = KM_PER_DEG * np.hypot(dy, dx * np.cos(np.radians(lat)))
+        nearest = {}
+        for hike, d in zip(self.items[found].tolist(), dist.tolist()):
+            if d <= km and d < nearest.get(hike, np.inf):
+                nearest[hike] = d
+        return sorted(nearest.items(), key=lambda item: (item[1], item[0]))
+
+    def packed(self):
+        """Leaf boxes in packed order and the hike position of each leaf
+
+        This is everything needed to rebuild the tree: parent levels are
+        the bounds of each run of node_size consecutive entries.
+        """
+        return {'nodeSize': self.tree.node_size,
+                'boxes': self.tree.levels[0].tolist(),
+                'items': self.items[self.tree.order].tolist()}
+
+
+def save_index(path, index, hikes):
+    """Write the packed index and the hikes it refers to (dicts, by position)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'hikes': hikes, **index.packed()},
+                  f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_index(path):
+    """Return (HikeIndex, hikes) as written by save_index"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data.get('version') != INDEX_VERSION:
+        raise ValueError(f"{path} was written by another version; rebuild the map")
+    segments = [[] for _ in data['hikes']]
+    for box, item in zip(data['boxes'], data['items']):
+        segments[item].append(box)
+    return HikeIndex(segments, data['nodeSize']), data['hikes']
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query the spatial index of all hikes "
+                                                 "(written by plot_hikes.py)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--near', nargs=3, type=float, metavar=('LAT', 'LON', 'KM'),
+                       help="Hikes within KM of a point, nearest first")
+    group.add_argument('--bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                       help="Hikes whose track crosses a box")
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    index_path = os.path.join(os.path.dirname(script_dir), 'data', HIKE_INDEX)
+    try:
+        index, hikes = load_index(index_path)
+    except FileNotFoundError:
+        raise SystemExit(f"No hike index at {index_path}; run plot_hikes.py first")
+
+    if args.near:
+        results = index.near(*args.near)
+        for position, km in results:
+            print(f"{km:6.2f} km  {hikes[position]['name']}")
+    else:
+        results = index.query(*args.bbox)
+        for position in results:
+            print(hikes[position]['name'])
+    print(f"{len(results)} hikes")
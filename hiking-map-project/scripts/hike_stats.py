@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Vectorized hiking statistics
+Computes distance (haversine), smoothed elevation gain/loss, moving time
+and pace for every activity at once from the track store's columns, and
+rolls them up per year, month and region into hiking_stats.json.
+
+Usage:
+    python3 scripts/hike_stats.py
+"""
+
+import csv
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from hike_db import export_pending
+from simplify import EARTH_RADIUS_M
+from track_store import open_store
+
+# Centered moving-average windows (in points) applied before summing steps
+# and climbs, so GPS/barometer jitter doesn't count as distance or gain
+POSITION_SMOOTHING_POINTS = 5
+ELEVATION_SMOOTHING_POINTS = 31
+
+# A step counts as moving when it is at least this fast and the gap since
+# the previous point is short enough not to be a pause in recording
+MOVING_SPEED_MS = 0.3
+MAX_MOVING_GAP_S = 30
+
+# Region of hikes without a Location in trail_names.csv: a grid cell of
+# this many degrees around the track's start
+REGION_CELL_DEG = 1.0
+
+DATE_FORMAT = '%b %d, %Y, %I:%M:%S %p'  # Strava export, e.g. "Nov 25, 2021, 6:34:22 PM"
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between arrays of points in degrees"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _step_distances(lat, lon):
+    """Haversine distance from each point to the next, in meters
+
+    Same as haversine() on consecutive points, but converts and takes the
+    cosine of every latitude once instead of twice.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    cos_lat = np.cos(lat)
+    a = (np.sin(np.diff(lat) / 2) ** 2 +
+         cos_lat[:-1] * cos_lat[1:] * np.sin(np.diff(lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+def _group_sums(values, starts, ends):
+    """Sum values over each [start, end) row range"""
+    totals = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return totals[ends] - totals[starts]
+
+
+def _window_bounds(group_starts, group_ends, window):
+    """[lo, hi) row range of a centered window that stays within each row's group"""
+    rows = np.arange(len(group_starts))
+    lo = np.maximum(rows - window // 2, group_starts)
+    hi = np.minimum(rows + window // 2 + 1, group_ends)
+    return lo, hi
+
+
+def _smooth(values, lo, hi):
+    """Moving average of values over the [lo, hi) window of each row
+
+    NaNs are ignored; rows with no valid value in their window stay NaN.
+    """
+    valid = ~np.isnan(values)
+    if valid.all():
+        sums = np.concatenate(([0.0], np.cumsum(values)))
+        return (sums[hi] - sums[lo]) / (hi - lo)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(valid)))
+    n = counts[hi] - counts[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 0, (sums[hi] - sums[lo]) / n, np.nan)
+
+
+def track_stats(store):
+    """Per-activity statistics for every activity in the store
+
+    Returns {activity_id: {'distance_m', 'elevation_gain_m', 'elevation_loss_m',
+    'moving_time_s', 'elapsed_time_s', 'start': [lat, lon] or None}}.
+    Everything is computed on the store's whole columns in one pass.
+    """
+    columns = store.columns()
+    lat = np.asarray(columns['lat'])
+    lon = np.asarray(columns['lon'])
+    elevation = np.asarray(columns['elevation'], dtype=np.float64)
+    times = np.asarray(columns['time'])
+
+    ids = list(store.activities)
+    entries = [store.activities[activity_id] for activity_id in ids]
+    starts = np.array([entry['start'] for entry in entries], dtype=np.int64)
+    counts = np.array([entry['count'] for entry in entries], dtype=np.int64)
+    ends = starts + counts
+
+    # Rows that begin an activity or a GPX segment have no step before them
+    first = np.zeros(len(lat), dtype=bool)
+    first[starts[counts > 0]] = True
+    for entry in entries:
+        first[[entry['start'] + offset for offset in entry['segments']]] = True
+
+    # Segment range of every row, so smoothing never crosses a boundary
+    segment_starts = np.maximum.accumulate(np.where(first, np.arange(len(lat)), 0))
+    segment_ends = np.empty(len(lat), dtype=np.int64)
+    boundaries = np.append(np.flatnonzero(first), len(lat))
+    segment_ends[boundaries[0]:] = np.repeat(boundaries[1:], np.diff(boundaries))
+
+    lo, hi = _window_bounds(segment_starts, segment_ends, POSITION_SMOOTHING_POINTS)
+    step = np.zeros(len(lat))
+    step[1:] = _step_distances(_smooth(lat, lo, hi), _smooth(lon, lo, hi))
+    step[first] = 0.0
+
+    dt = np.zeros(len(lat))
+    dt[1:] = np.diff(times)
+    timed = (times > 0) & ~first
+    timed[1:] &= times[:-1] > 0
+    dt[~timed] = 0.0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        speed = np.where(dt > 0, step / dt, 0.0)
+    moving = (dt > 0) & (dt <= MAX_MOVING_GAP_S) & (speed >= MOVING_SPEED_MS)
+
+    # Smooth elevation within each segment, then sum the climbs and descents
+    smoothed = _smooth(elevation,
+                       *_window_bounds(segment_starts, segment_ends, ELEVATION_SMOOTHING_POINTS))
+    climb = np.zeros(len(lat))
+    climb[1:] = np.diff(smoothed)
+    climb[first | np.isnan(climb)] = 0.0
+
+    distance = _group_sums(step, starts, ends)
+    gain = _group_sums(np.maximum(climb, 0.0), starts, ends)
+    loss = _group_sums(np.maximum(-climb, 0.0), starts, ends)
+    moving_time = _group_sums(np.where(moving, dt, 0.0), starts, ends)
+    elapsed_time = _group_sums(dt, starts, ends)
+
+    stats = {}
+    for i, activity_id in enumerate(ids):
+        has_track = counts[i] > 0
+        stats[activity_id] = {
+            'distance_m': float(distance[i]),
+            'elevation_gain_m': float(gain[i]),
+            'elevation_loss_m': float(loss[i]),
+            'moving_time_s': float(moving_time[i]),
+            'elapsed_time_s': float(elapsed_time[i]),
+            'start': [float(lat[starts[i]]), float(lon[starts[i]])] if has_track else None,
+        }
+    return stats
+
+
+def _csv_float(row, column):
+    try:
+        return float(row.get(column) or 0.0)
+    except ValueError:
+        return 0.0
+
+
+def _region_for(location, start):
+    """Location from trail_names.csv, else the grid cell around the start"""
+    if location:
+        return location
+    if not start:
+        return 'Unknown'
+    lat = np.floor(start[0] / REGION_CELL_DEG) * REGION_CELL_DEG
+    lon = np.floor(start[1] / REGION_CELL_DEG) * REGION_CELL_DEG
+    return f"{abs(lat):g}°{'N' if lat >= 0 else 'S'} {abs(lon):g}°{'E' if lon >= 0 else 'W'}"
+
+
+def _rollup(hikes):
+    """Totals and averages for a group of hikes"""
+    distance_km = sum(hike['distance_km'] for hike in hikes)
+    moving_h = sum(hike['moving_time_s'] for hike in hikes) / 3600.0
+    return {
+        'Hikes': len(hikes),
+        'Distance (km)': round(distance_km, 1),
+        'Elevation Gain (m)': round(sum(hike['elevation_gain_m'] for hike in hikes)),
+        'Elevation Loss (m)': round(sum(hike['elevation_loss_m'] for hike in hikes)),
+        'Moving Time (h)': round(moving_h, 1),
+        'Pace (min/km)': round(moving_h * 60.0 / distance_km, 1) if distance_km else None,
+    }
+
+
+def compute_stats(data_dir, store=None):
+    """Statistics for every activity in hiking_activities.csv plus rollups
+
+    Track-based numbers are used whenever an activity has GPS data; others
+    fall back to the CSV's distance, elevation and moving-time columns.
+    """
+    export_pending(data_dir)
+    store = store or open_store(data_dir)
+    per_track = track_stats(store)
+
+    locations = {}
+    trail_names_path = os.path.join(data_dir, 'trail_names.csv')
+    if os.path.exists(trail_names_path):
+        with open(trail_names_path, 'r', newline='') as f:
+            locations = {row['Activity_ID']: row.get('Location', '').strip()
+                         for row in csv.DictReader(f)}
+
+    hikes = []
+    with open(os.path.join(data_dir, 'hiking_activities.csv'), 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            activity_id = row['Activity ID']
+            track = per_track.get(activity_id)
+            if track and track['distance_m'] > 0:
+                distance_m = track['distance_m']
+                gain, loss = track['elevation_gain_m'], track['elevation_loss_m']
+                moving_s = track['moving_time_s']
+            else:
+                # The export has two 'Distance' columns, km then meters, and
+                # DictReader keeps the last one. The km column can't be trusted,
+                # rows appended by older add_new_hikes hold meters there too.
+                distance_m = _csv_float(row, 'Distance')
+                gain, loss = _csv_float(row, 'Elevation Gain'), _csv_float(row, 'Elevation Loss')
+                moving_s = _csv_float(row, 'Moving Time')
+            hikes.append({
+                'date': datetime.strptime(row['Activity Date'], DATE_FORMAT),
+                'region': _region_for(locations.get(activity_id), track and track['start']),
+                'distance_km': distance_m / 1000.0,
+                'elevation_gain_m': gain,
+                'elevation_loss_m': loss,
+                'moving_time_s': moving_s,
+            })
+
+    if not hikes:
+        return {'Total Hikes': 0}
+
+    totals = _rollup(hikes)
+    stats = {
+        'Total Hikes': totals['Hikes'],
+        'Total Distance (km)': totals['Distance (km)'],
+        'Average Distance (km)': round(totals['Distance (km)'] / len(hikes), 1),
+        'Longest Hike (km)': round(max(hike['distance_km'] for hike in hikes), 1),
+        'Total Elevation Gain (m)': totals['Elevation Gain (m)'],
+        'Total Elevation Loss (m)': totals['Elevation Loss (m)'],
+        'Total Moving Time (h)': totals['Moving Time (h)'],
+        'Average Pace (min/km)': totals['Pace (min/km)'],
+        'Date Range': f"{min(hike['date'] for hike in hikes).strftime('%Y-%m-%d')} to "
+                      f"{max(hike['date'] for hike in hikes).strftime('%Y-%m-%d')}",
+    }
+    for label, key in (('By Year', lambda hike: hike['date'].strftime('%Y')),
+                       ('By Month', lambda hike: hike['date'].strftime('%Y-%m')),
+                       ('By Region', lambda hike: hike['region'])):
+        groups = {}
+        for hike in hikes:
+            groups.setdefault(key(hike), []).append(hike)
+        stats[label] = {name: _rollup(groups[name]) for name in sorted(groups)}
+    return stats
+
+
+if __name__ == "__main__":
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), 'data')
+
+    stats = compute_stats(data_dir)
+    stats_path = os.path.join(os.path.dirname(data_dir), 'hiking_stats.json')
+    with open(stats_path, 'w') as f:
+        json.dump(stats, f, indent=2, ensure_ascii=False)
+    print(f"Statistics saved to: {stats_path}")
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Streaming, deduplicating ingest of a Strava export
+Reads the export's activities.csv row by row, keeps the hikes, and brings
+their GPS files into data/activities. New files are hard-linked from the
+export (reflinked or copied where a link isn't possible); files already
+ingested are recognised by a manifest of source stats and SHA-256 hashes,
+so re-running against the same export is just a pass of os.stat calls.
+
+The export can also be the ZIP Strava sends, read in place: only
+activities.csv and the hikes' GPS members are decompressed, straight into
+data/activities, and unchanged members are recognised by the size and
+CRC-32 in the ZIP's central directory without reading them.
+
+Usage:
+    python3 scripts/ingest_export.py <path_to_export_folder_or_zip>
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import zipfile
+import zlib
+from contextlib import contextmanager
+
+from hike_db import HIKING_CSV, HikeDB
+from track_cache import hash_file
+
+HIKE_TYPE = 'hike'  # Matched case-insensitively against Activity Type
+INGEST_MANIFEST = '.ingest_manifest.json'
+
+FICLONE = 0x40049409  # Linux ioctl that makes dst share src's extents
+CHUNK_SIZE = 1024 * 1024
+
+
+def iter_hikes(csv_file, activity_type=HIKE_TYPE):
+    """Yield raw rows of an open activities.csv whose Activity Type contains activity_type
+
+    The header row is yielded first. Rows are kept as lists because the
+    export has duplicate column names (two 'Distance' columns, km then
+    meters) that a DictReader/DictWriter round trip would corrupt.
+    """
+    reader = csv.reader(csv_file)
+    header = next(reader)
+    yield header
+    type_column = header.index('Activity Type')
+    for row in reader:
+        if len(row) > type_column and activity_type in row[type_column].lower():
+            yield row
+
+
+def find_gps_file(export_dir, filename):
+    """Return the path of an activity file in the export, or None
+
+    Filename is relative to the export root ('activities/123.fit.gz');
+    exports flattened into one folder are found by basename.
+    """
+    for path in (os.path.join(export_dir, filename),
+                 os.path.join(export_dir, os.path.basename(filename))):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def _reflink(src, dst):
+    import fcntl  # Not available on Windows
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+    shutil.copystat(src, dst)
+
+
+def link_or_copy(src, dst):
+    """Put src's content at dst without copying data where the filesystem allows
+
+    Tries a hard link, then a reflink, then a plain copy. dst is replaced
+    atomically. Returns 'linked', 'reflinked' or 'copied'.
+    """
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(src, tmp_path)
+        method = 'linked'
+    except OSError:
+        try:
+            _reflink(src, tmp_path)
+            method = 'reflinked'
+        except (OSError, ImportError):
+            shutil.copy2(src, tmp_path)
+            method = 'copied'
+    os.replace(tmp_path, dst)
+    return method
+
+
+def _stamp(st):
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _zip_stamp(info):
+    return ['crc32', info.file_size, info.CRC]
+
+
+def _crc32_file(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+class IngestManifest:
+    """Per-file record of source/destination stats and content hash"""
+
+    def __init__(self, path):
+        self.path = path
+        self.files = {}
+        try:
+            with open(path, 'r') as f:
+                self.files = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def unchanged(self, name, source, dst_path):
+        """True if the source stamp and destination stat are as recorded"""
+        entry = self.files.get(name)
+        if entry is None or entry['source'] != source:
+            return False
+        try:
+            return entry['dest'] == _stamp(os.stat(dst_path))
+        except FileNotFoundError:
+            return False
+
+    def record(self, name, source, dst_path, sha256):
+        self.files[name] = {'source': source,
+                            'dest': _stamp(os.stat(dst_path)),
+                            'sha256': sha256}
+
+    def save(self):
+        """Write the manifest atomically"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.files, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def ingest_gps_file(manifest, src, activities_dir):
+    """Bring one export file into activities_dir, returning what was done
+
+    'unchanged' costs two stats. Otherwise the source is hashed, and the
+    destination is only rewritten if its content differs.
+    """
+    name = os.path.basename(src)
+    dst = os.path.join(activities_dir, name)
+    source = _stamp(os.stat(src))
+    if manifest.unchanged(name, source, dst):
+        return 'unchanged'
+    sha256 = hash_file(src)
+    entry = manifest.files.get(name)
+    if os.path.exists(dst):
+        known = entry is not None and entry['dest'] == _stamp(os.stat(dst))
+        if (entry['sha256'] if known else hash_file(dst)) == sha256:
+            # Same content, e.g. the export was re-extracted with new mtimes
+            manifest.record(name, source, dst, sha256)
+            return 'unchanged'
+    action = link_or_copy(src, dst)
+    manifest.record(name, source, dst, sha256)
+    return action
+
+
+def ingest_zip_member(manifest, zf, info, activities_dir):
+    """Bring one GPS member of an export ZIP into activities_dir
+
+    Unchanged members are recognised from the ZIP directory alone. Others
+    are decompressed straight to their destination (hashing on the way),
+    unless the file already there has the member's CRC.
+    """
+    name = os.path.basename(info.filename)
+    dst = os.path.join(activities_dir, name)
+    source = _zip_stamp(info)
+    if manifest.unchanged(name, source, dst):
+        return 'unchanged'
+    if (os.path.exists(dst) and os.path.getsize(dst) == info.file_size
+            and _crc32_file(dst) == info.CRC):
+        manifest.record(name, source, dst, hash_file(dst))
+        return 'unchanged'
+    digest = hashlib.sha256()
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    with zf.open(info) as src, open(tmp_path, 'wb') as out:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    os.replace(tmp_path, dst)
+    manifest.record(name, source, dst, digest.hexdigest())
+    return 'extracted'
+
+
+class ExportFolder:
+    """An unpacked Strava export"""
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isfile(os.path.join(path, 'activities.csv')):
+            raise FileNotFoundError(f"Could not find {os.path.join(path, 'activities.csv')}")
+
+    def open_csv(self):
+        return open(os.path.join(self.path, 'activities.csv'), 'r', newline='')
+
+    def ingest(self, manifest, filename, activities_dir):
+        """Ingest the GPS file named in the CSV; 'missing' if it isn't there"""
+        src = find_gps_file(self.path, filename)
+        if src is None:
+            return 'missing'
+        return ingest_gps_file(manifest, src, activities_dir)
+
+    def close(self):
+        pass
+
+
+class ExportZip:
+    """A Strava export ZIP, read in place without extracting it"""
+
+    def __init__(self, path):
+        self.zf = zipfile.ZipFile(path)
+        self.members = {info.filename: info for info in self.zf.infolist()
+                        if not info.is_dir()}
+        # activities.csv may sit under a top-level folder; take the shallowest
+        csv_names = [n for n in self.members
+                     if n == 'activities.csv' or n.endswith('/activities.csv')]
+        if not csv_names:
+            self.zf.close()
+            raise FileNotFoundError(f"No activities.csv in {path}")
+        csv_name = min(csv_names, key=len)
+        self.csv_info = self.members[csv_name]
+        self.prefix = csv_name[:-len('activities.csv')]
+        self.by_basename = {os.path.basename(n): info for n, info in self.members.items()}
+
+    def open_csv(self):
+        return io.TextIOWrapper(self.zf.open(self.csv_info), encoding='utf-8', newline='')
+
+    def ingest(self, manifest, filename, activities_dir):
+        """Ingest the GPS member named in the CSV; 'missing' if it isn't there"""
+        info = (self.members.get(self.prefix + filename)
+                or self.by_basename.get(os.path.basename(filename)))
+        if info is None:
+            return 'missing'
+        return ingest_zip_member(manifest, self.zf, info, activities_dir)
+
+    def close(self):
+        self.zf.close()
+
+
+@contextmanager
+def open_export(path):
+    """Open a Strava export folder or ZIP (raises FileNotFoundError)"""
+    if os.path.isdir(path):
+        export = ExportFolder(path)
+    elif zipfile.is_zipfile(path):
+        export = ExportZip(path)
+    else:
+        raise FileNotFoundError(f"Not a Strava export folder or ZIP: {path}")
+    try:
+        yield export
+    finally:
+        export.close()
+
+
+def ingest_export(export_path, data_dir):
+    """Sync data_dir's hiking CSV and GPS files with a Strava export folder or ZIP
+
+    hiking_activities.csv becomes the export's hike rows (through HikeDB,
+    written only if they changed); GPS files of those hikes are linked in or copied as
+    needed. Files of hikes no longer in the export are left in place.
+    Returns a dict of counts.
+    """
+    activities_dir = os.path.join(data_dir, 'activities')
+    os.makedirs(activities_dir, exist_ok=True)
+    manifest = IngestManifest(os.path.join(data_dir, INGEST_MANIFEST))
+    counts = {'hikes': 0, 'unchanged': 0, 'linked': 0, 'reflinked': 0,
+              'copied': 0, 'extracted': 0, 'missing': 0, 'no_file': 0}
+
+    hike_rows = []
+    with open_export(export_path) as export, export.open_csv() as f:
+        rows = iter_hikes(f)
+        header = next(rows)
+        filename_column = header.index('Filename')
+        for row in rows:
+            hike_rows.append(row)
+            counts['hikes'] += 1
+            filename = row[filename_column] if len(row) > filename_column else ''
+            if not filename:
+                counts['no_file'] += 1
+                continue
+            action = export.ingest(manifest, filename, activities_dir)
+            if action == 'missing':
+                print(f"  Warning: Could not find {filename}")
+            counts[action] += 1
+
+    db = HikeDB(data_dir)
+    db.replace_activities(header, hike_rows)
+    # A full replacement, so export it now rather than on the next build
+    counts['csv_changed'] = HIKING_CSV in db.flush()
+    db.close()
+    manifest.save()
+    return counts
+
+
+def print_counts(counts):
+    print(f"Hikes in export: {counts['hikes']}"
+          f"{' (hiking_activities.csv updated)' if counts['csv_changed'] else ''}")
+    done = [f"{counts[k]} {k}" for k in ('linked', 'reflinked', 'copied', 'extracted') if counts[k]]
+    print(f"GPS files: {', '.join([str(counts['unchanged']) + ' unchanged'] + done)}")
+    if counts['missing']:
+        print(f"Missing {counts['missing']} files (this is normal for very old activities)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('Usage: python3 scripts/ingest_export.py <path_to_export_folder_or_zip>')
+        sys.exit(1)
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), 'data')
+    try:
+        counts = ingest_export(sys.argv[1], data_dir)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}")
+        sys.exit(1)
+    print_counts(counts)
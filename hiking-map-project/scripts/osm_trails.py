@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Offline trail matching against an OSM extract
+Loads named trails from a GeoJSON (or, with pyosmium installed, .osm.pbf)
+extract, indexes their segments in a packed R-tree and names a track by
+the trails it runs along, scored by overlap length over the whole track.
+"""
+
+import json
+
+import numpy as np
+
+from simplify import EARTH_RADIUS_M, to_local_meters
+from spatial_index import STRTree
+
+TRAIL_HIGHWAYS = {'path', 'footway', 'track'}
+
+MATCH_DISTANCE_M = 25.0  # Track samples this close to a trail count as on it
+SAMPLE_SPACING_M = 20.0  # Tracks are resampled at this spacing before matching
+CHUNK_SAMPLES = 32       # Samples per R-tree query
+
+_METERS_PER_DEG = np.radians(1.0) * EARTH_RADIUS_M
+
+
+def _is_trail(tags):
+    return bool(tags.get('name')) and (tags.get('highway') in TRAIL_HIGHWAYS or
+                                       tags.get('route') == 'hiking')
+
+
+def load_geojson(path):
+    """Return named trails from a GeoJSON extract as [{'name', 'lines'}]
+
+    Features need a name and highway=path|footway|track or route=hiking,
+    either as properties or under properties['tags'] (osmtogeojson style).
+    Lines are lists of [lat, lon].
+    """
+    with open(path, 'r') as f:
+        data = json.load(f)
+    trails = []
+    for feature in data.get('features', []):
+        props = feature.get('properties') or {}
+        tags = props.get('tags', props)
+        geometry = feature.get('geometry') or {}
+        if not _is_trail(tags):
+            continue
+        if geometry.get('type') == 'LineString':
+            parts = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            parts = geometry['coordinates']
+        else:
+            continue
+        lines = [[[lat, lon] for lon, lat, *_ in part] for part in parts if len(part) > 1]
+        if lines:
+            trails.append({'name': tags['name'].strip(), 'lines': lines})
+    return trails
+
+
+def load_pbf(path):
+    """Return named trails from an .osm.pbf extract (needs pyosmium)
+
+    Ways of route=hiking relations take the relation's name as well as
+    their own.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise ImportError("Reading .osm.pbf extracts needs pyosmium "
+                          "(pip install osmium), or convert the extract to GeoJSON")
+
+    class RouteHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.way_routes = {}
+
+        def relation(self, r):
+            if r.tags.get('route') == 'hiking' and r.tags.get('name'):
+                for member in r.members:
+                    if member.type == 'w':
+                        self.way_routes.setdefault(member.ref, []).append(r.tags['name'])
+
+    class WayHandler(osmium.SimpleHandler):
+        def __init__(self, way_routes):
+            super().__init__()
+            self.way_routes = way_routes
+            self.trails = []
+
+        def way(self, w):
+            names = list(self.way_routes.get(w.id, []))
+            if _is_trail({'name': w.tags.get('name'), 'highway': w.tags.get('highway')}):
+                names.append(w.tags['name'])
+            if not names:
+                return
+            line = [[n.lat, n.lon] for n in w.nodes if n.location.valid()]
+            if len(line) > 1:
+                for name in names:
+                    self.trails.append({'name': name.strip(), 'lines': [line]})
+
+    routes = RouteHandler()
+    routes.apply_file(path)
+    ways = WayHandler(routes.way_routes)
+    ways.apply_file(path, locations=True)
+    return ways.trails
+
+
+def load_extract(path):
+    """Load named trails from a .geojson/.json or .osm.pbf extract"""
+    if path.endswith('.pbf'):
+        return load_pbf(path)
+    return load_geojson(path)
+
+
+def resample(lat, lon, spacing=SAMPLE_SPACING_M):
+    """Resample a track at fixed distances along it
+
+    Returns (samples, weights): (k, 2) [lat, lon] points and the length of
+    track in meters each sample stands for.
+    """
+    latlon = np.column_stack((lat, lon)).astype(np.float64)
+    if len(latlon) < 2:
+        return latlon, np.zeros(len(latlon))
+    xy = to_local_meters(latlon)
+    along = np.concatenate(([0.0], np.cumsum(np.hypot(*np.diff(xy, axis=0).T))))
+    total = along[-1]
+    if total <= 0:
+        return latlon[:1], np.zeros(1)
+    targets = np.arange(spacing / 2, total, spacing)
+    if not len(targets):
+        targets = np.array([total / 2])
+    samples = np.column_stack((np.interp(targets, along, latlon[:, 0]),
+                               np.interp(targets, along, latlon[:, 1])))
+    weights = np.full(len(targets), spacing)
+    weights[-1] = total - spacing * (len(targets) - 1)
+    return samples, weights
+
+
+class TrailIndex:
+    """Packed R-tree over the segments of named trails"""
+
+    def __init__(self, trails):
+        self.names = sorted({trail['name'] for trail in trails})
+        name_ids = {name: i for i, name in enumerate(self.names)}
+        segments = []
+        owners = []
+        for trail in trails:
+            for line in trail['lines']:
+                pts = np.asarray(line, dtype=np.float64)
+                segments.append(np.hstack((pts[:-1], pts[1:])))
+                owners.append(np.full(len(pts) - 1, name_ids[trail['name']]))
+        # segments are [lat1, lon1, lat2, lon2]
+        self.segments = np.vstack(segments) if segments else np.empty((0, 4))
+        self.owners = np.concatenate(owners) if owners else np.empty(0, dtype=np.int64)
+        seg_lengths = np.hypot(
+            (self.segments[:, 2] - self.segments[:, 0]) * _METERS_PER_DEG,
+            (self.segments[:, 3] - self.segments[:, 1]) * _METERS_PER_DEG *
+            np.cos(np.radians(self.segments[:, 0])))
+        self.lengths = np.bincount(self.owners, seg_lengths, minlength=len(self.names))
+        boxes = np.column_stack((np.minimum(self.segments[:, 1], self.segments[:, 3]),
+                                 np.minimum(self.segments[:, 0], self.segments[:, 2]),
+                                 np.maximum(self.segments[:, 1], self.segments[:, 3]),
+                                 np.maximum(self.segments[:, 0], self.segments[:, 2])))
+        self.tree = STRTree(boxes)
+
+    def _distances(self, samples, candidates):
+        """(samples, candidates) distances in meters from samples to segments"""
+        seg = self.segments[candidates]
+        lat0 = samples[:, 0].mean()
+        scale_lon = _METERS_PER_DEG * np.cos(np.radians(lat0))
+        # Local meters relative to each sample
+        ay = (seg[None, :, 0] - samples[:, None, 0]) * _METERS_PER_DEG
+        ax = (seg[None, :, 1] - samples[:, None, 1]) * scale_lon
+        by = (seg[None, :, 2] - samples[:, None, 0]) * _METERS_PER_DEG
+        bx = (seg[None, :, 3] - samples[:, None, 1]) * scale_lon
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = np.clip(np.where(length_sq > 0, -(ax * dx + ay * dy) / length_sq, 0.0), 0.0, 1.0)
+        return np.hypot(ax + t * dx, ay + t * dy)
+
+    def match(self, lat, lon, max_distance=MATCH_DISTANCE_M):
+        """Rank trails by how much of the track runs along them
+
+        A sample of the resampled track counts towards every trail that has
+        a segment within max_distance of it, so a route relation and the
+        ways it follows both get the full overlap. Returns
+        [(name, overlap_m, fraction)] sorted by overlap, where fraction is
+        the share of the track length. Trails with the same overlap (to
+        within one sample) are ranked by how much of the trail itself the
+        track covers, so a local loop beats a long-distance route along it.
+        """
+        samples, weights = resample(lat, lon)
+        total = weights.sum()
+        if not len(self.owners) or total <= 0:
+            return []
+        overlap = np.zeros(len(self.names))
+        pad_lat = max_distance / _METERS_PER_DEG
+        for start in range(0, len(samples), CHUNK_SAMPLES):
+            chunk = samples[start:start + CHUNK_SAMPLES]
+            pad_lon = pad_lat / max(np.cos(np.radians(np.abs(chunk[:, 0]).max())), 0.01)
+            candidates = self.tree.query(chunk[:, 1].min() - pad_lon, chunk[:, 0].min() - pad_lat,
+                                         chunk[:, 1].max() + pad_lon, chunk[:, 0].max() + pad_lat)
+            if not len(candidates):
+                continue
+            sample_idx, candidate_idx = np.nonzero(
+                self._distances(chunk, candidates) <= max_distance)
+            # Count each (sample, trail) pair once however many segments are close
+            pairs = np.unique(sample_idx * len(self.names) + self.owners[candidates[candidate_idx]])
+            np.add.at(overlap, pairs % len(self.names),
+                      weights[start:start + CHUNK_SAMPLES][pairs // len(self.names)])
+        coverage = overlap / np.maximum(self.lengths, 1.0)
+        ranked = np.lexsort((-coverage, -np.round(overlap / SAMPLE_SPACING_M)))
+        return [(self.names[i], float(overlap[i]), float(overlap[i] / total))
+                for i in ranked if overlap[i] > 0]
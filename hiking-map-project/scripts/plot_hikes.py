@@ -5,107 +5,289 @@ Creates an interactive map with all hiking routes
 """
 
 import os
-import gzip
-import gpxpy
+import argparse
 import folium
 from folium import plugins
 import pandas as pd
 import csv
 from datetime import datetime
-from fitparse import FitFile
 import json
+import numpy as np
 from folium import Element
+from branca.element import MacroElement
+from jinja2 import Template
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from track_cache import TrackCache
+from build_manifest import BuildManifest, hash_fields
+from heatmap import (HEATMAP_DIR, MAX_ZOOM as HEATMAP_MAX_ZOOM, MIN_ZOOM as HEATMAP_MIN_ZOOM,
+                     update_heatmap)
+from hike_db import export_pending
+from hike_index import HIKE_INDEX, KM_PER_DEG, HikeIndex, save_index, track_segments
+from hike_stats import compute_stats
+from simplify import DEFAULT_DECIMATION_FACTOR, SIMPLIFIERS, simplify_track
+from track_store import open_store
+from vector_tiles import MIN_ZOOM as TILES_MIN_ZOOM, PMTILES_NAME, build_pmtiles
 
+# Bump when simplification changes what it returns, so cached tracks are rebuilt
+PARSER_VERSION = 4
+DEFAULT_SIMPLIFY = 'rdp'
+DEFAULT_TOLERANCE_M = 3.0  # Max distance (m) a simplified track strays from the GPS fix
 
-def parse_gpx_file(filepath):
-    """Parse GPX file and extract coordinates with decimation to reduce file size"""
+# Level-of-detail pyramid as (min zoom, tolerance in m), coarsest first. The
+# coarsest level is painted initially, the page swaps levels on zoom and uses
+# the full --tolerance track from LOD_DETAIL_ZOOM up.
+LOD_LEVELS = ((0, 80.0), (11, 20.0), (13, 6.0))
+LOD_DETAIL_ZOOM = 15
+
+# In split output mode tracks are only fetched from this zoom level up
+SPLIT_TRACK_MIN_ZOOM = 9
+
+# Start markers: 'cluster' draws every start on one canvas, merging starts
+# closer than START_CLUSTER_PX; 'icons' adds a Font Awesome marker per hike
+MARKER_MODES = ('cluster', 'icons')
+DEFAULT_MARKERS = 'cluster'
+START_CLUSTER_PX = 48
+
+
+def _cache_settings(method, tolerance):
+    """Settings that affect simplified output and therefore the cache key"""
+    return {'simplify': method, 'tolerance': tolerance,
+            'lod': [list(level) for level in LOD_LEVELS]}
+
+
+def simplify_segments(segments, method=DEFAULT_SIMPLIFY, tolerance=DEFAULT_TOLERANCE_M):
+    """Simplify a track's segments (safe to run in a worker process)
+    
+    segments are (n, 2) [lat, lon] arrays as returned by TrackStore.positions.
+    Returns {'points': [[lat, lon], ...], 'points_in': raw point count,
+    'lods': [points per LOD_LEVELS entry coarser than tolerance]}
+    """
+    # Round to 5 decimals (~1 m), the precision of the encoded polylines
+    segments = [np.round(segment, 5) for segment in segments]
+    
+    # Simplify each segment on its own so segment endpoints are always kept
+    simplified = [simplify_track(segment, method, tolerance) for segment in segments]
+    points = np.concatenate(simplified).tolist() if simplified else []
+    
+    # Coarser levels are derived from the simplified track, not the raw one
+    lod_method = method if method in SIMPLIFIERS else DEFAULT_SIMPLIFY
+    lods = []
+    for _, lod_tolerance in LOD_LEVELS:
+        if simplified and (lod_tolerance > tolerance or method == 'decimate'):
+            lods.append(np.concatenate([simplify_track(segment, lod_method, lod_tolerance)
+                                        for segment in simplified]).tolist())
+    return {'points': points, 'points_in': sum(len(segment) for segment in segments),
+            'lods': lods}
+
+
+def simplify_tracks(store, activity_ids, cache=None, jobs=None,
+                    method=DEFAULT_SIMPLIFY, tolerance=DEFAULT_TOLERANCE_M):
+    """Simplify the stored tracks of many activities, in parallel when jobs != 1
+    
+    Results are returned in the same order as activity_ids so hike colors and
+    numbering stay stable. A track that fails to simplify yields None on its own.
+    """
+    results = [None] * len(activity_ids)
+    keys = {}
+    pending = []
+    settings = _cache_settings(method, tolerance)
+    
+    # Serve cache hits in this process, only misses go to the pool
+    for i, activity_id in enumerate(activity_ids):
+        if cache is not None:
+            keys[i] = cache.key_for(store.activities[activity_id]['file'], PARSER_VERSION,
+                                    settings, store.source_hash(activity_id))
+            track = cache.get(keys[i])
+            if track is not None:
+                results[i] = track
+                continue
+        pending.append(i)
+    
+    def save(i, track):
+        results[i] = track
+        if cache is not None:
+            cache.put(keys[i], track)
+    
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(pending) <= 1:
+        for i in pending:
+            save(i, simplify_segments(store.positions(activity_ids[i]), method, tolerance))
+        return results
+    
+    with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as pool:
+        futures = {pool.submit(simplify_segments, store.positions(activity_ids[i]),
+                               method, tolerance): i
+                   for i in pending}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                save(i, future.result())
+            except Exception as e:
+                print(f"Error simplifying activity {activity_ids[i]}: {e}")
+    return results
+
+
+def encode_polyline(points, precision=5):
+    """Encode [lat, lon] points in Google's encoded polyline format
+    
+    Coordinates become fixed-point integers (E5 by default), delta-encoded
+    against the previous point, zigzag-mapped and written as 5-bit varint
+    chunks in printable ASCII. Lossless for points rounded to `precision`.
+    """
+    factor = 10 ** precision
+    chars = []
+    prev_lat = prev_lon = 0
+    for lat, lon in points:
+        ilat = round(lat * factor)
+        ilon = round(lon * factor)
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else delta << 1
+            while value >= 0x20:
+                chars.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            chars.append(chr(value + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return ''.join(chars)
+
+
+# Color palette for trails - using vibrant hex colors for lines
+TRAIL_COLORS = ['#FF0000', '#0066FF', '#00AA00', '#9900FF', '#FF6600', '#CC0000',
+                '#FF3366', '#00CCCC', '#0033CC', '#006600', '#FF00FF', 
+                '#6600CC', '#FFAA00', '#FF0099', '#0099FF', '#33CC33', 
+                '#CC00CC', '#FF3300', '#009999']
+
+# Marker colors - must be from Leaflet.awesome-markers' allowed list
+MARKER_COLORS = ['red', 'blue', 'green', 'purple', 'orange', 'darkred',
+                 'lightred', 'cadetblue', 'darkblue', 'darkgreen', 'pink',
+                 'darkpurple', 'orange', 'lightblue', 'lightgreen',
+                 'red', 'purple', 'blue', 'green']
+
+# Bump when the shape of a hike fragment changes, so stored ones are rebuilt
+FRAGMENT_VERSION = 3
+
+
+class HikeLayer(MacroElement):
+    """Adds every hike in the page's `hikes` array to the map once it exists"""
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            hikes.forEach(function(hike, i) { addHike({{ this._parent.get_name() }}, hike, i); });
+            addTrackTiles({{ this._parent.get_name() }});
+            addStarts({{ this._parent.get_name() }});
+        {% endmacro %}
+    """)
+
+
+def _to_js(value):
+    """Serialise value as a JS literal that is safe inside a <script> block"""
+    return json.dumps(value, separators=(',', ':')).replace('</', '<\\/')
+
+
+def _hike_title(record):
+    """'#87: Silver Steps Trail', as the page's templates show a hike"""
+    return f"#{record['number']}: {record['name']}" if record['number'] else record['name']
+
+
+def _hike_colors(idx):
+    """Trail and marker color for the hike at CSV index idx"""
+    return TRAIL_COLORS[idx % len(TRAIL_COLORS)], MARKER_COLORS[idx % len(MARKER_COLORS)]
+
+
+def _build_fragment(activity, track, idx, tracks_dir=None):
+    """Build the map fragment for one decoded hike
+    
+    The fragment's 'record' is what the page needs to draw the hike. With
+    tracks_dir (split output mode) the track levels are written to their own
+    file there and the record only carries its URL.
+    """
+    points = track['points']
+    trail_color, marker_color = _hike_colors(idx)
+    
+    # Format date and distance for display
+    # Parse date string and format to just show date without time
     try:
-        with open(filepath, 'r') as gpx_file:
-            gpx = gpxpy.parse(gpx_file)
-            points = []
-            decimation_factor = 10  # Keep every 10th point
-            point_counter = 0
-            
-            for track in gpx.tracks:
-                for segment in track.segments:
-                    segment_points = list(segment.points)
-                    # Always keep first point
-                    if segment_points:
-                        points.append([round(segment_points[0].latitude, 5), 
-                                     round(segment_points[0].longitude, 5)])
-                    
-                    # Keep every Nth point
-                    for i, point in enumerate(segment_points[1:-1], 1):
-                        if i % decimation_factor == 0:
-                            points.append([round(point.latitude, 5), 
-                                         round(point.longitude, 5)])
-                    
-                    # Always keep last point
-                    if len(segment_points) > 1:
-                        points.append([round(segment_points[-1].latitude, 5), 
-                                     round(segment_points[-1].longitude, 5)])
-            return points
-    except Exception as e:
-        print(f"Error parsing GPX {filepath}: {e}")
-        return []
-
-
-def parse_fit_file(filepath):
-    """Parse FIT file and extract coordinates with decimation to reduce file size"""
+        date_obj = pd.to_datetime(activity['date'])
+        formatted_date = date_obj.strftime('%B %d, %Y')  # e.g., "May 12, 2024"
+    except:
+        formatted_date = activity['date']  # fallback to original if parsing fails
+    
+    # Convert distance from meters to kilometers and round to 1 decimal place
     try:
-        # Handle .gz compressed files
-        if filepath.endswith('.gz'):
-            with gzip.open(filepath, 'rb') as f:
-                fitfile = FitFile(f.read())
-        else:
-            fitfile = FitFile(filepath)
-        
-        points = []
-        decimation_factor = 10  # Keep every 10th point
-        point_counter = 0
-        temp_points = []
-        
-        # First collect all points
-        for record in fitfile.get_messages('record'):
-            lat = None
-            lon = None
-            for data in record:
-                if data.name == 'position_lat' and data.value:
-                    lat = data.value * (180.0 / 2**31)
-                elif data.name == 'position_long' and data.value:
-                    lon = data.value * (180.0 / 2**31)
-            
-            if lat and lon:
-                temp_points.append([round(lat, 5), round(lon, 5)])
-        
-        # Now decimate the points
-        if temp_points:
-            # Always keep first point
-            points.append(temp_points[0])
-            
-            # Keep every Nth point
-            for i in range(1, len(temp_points) - 1):
-                if i % decimation_factor == 0:
-                    points.append(temp_points[i])
-            
-            # Always keep last point
-            if len(temp_points) > 1:
-                points.append(temp_points[-1])
-        
-        return points
-    except Exception as e:
-        print(f"Error parsing FIT {filepath}: {e}")
-        return []
+        distance_meters = float(activity['distance'])
+        distance_km = distance_meters / 1000.0
+        distance_rounded = round(distance_km, 1)
+    except:
+        distance_rounded = activity['distance']  # fallback to original if conversion fails
+    
+    # Calculate bounds for this hike
+    hike_bounds = [[min(p[0] for p in points), min(p[1] for p in points)],
+                  [max(p[0] for p in points), max(p[1] for p in points)]]
+    
+    # Detail levels, coarsest first, the last one is the full --tolerance track
+    lods = track.get('lods', [])
+    lod_zooms = [zoom for zoom, _ in LOD_LEVELS][:len(lods)] + [LOD_DETAIL_ZOOM]
+    levels = [[zoom, encode_polyline(level)] for zoom, level in zip(lod_zooms, lods + [points])]
+    
+    record = {
+        'number': activity['hike_number'],
+        'color': trail_color,
+        'markerColor': marker_color,
+        'start': points[0],
+        'bounds': hike_bounds,
+        # Popups and tooltips are rendered from these by the page's templates
+        'name': activity['trail_name'] or activity['name'],
+        'date': formatted_date,
+        'km': distance_rounded,
+    }
+    if activity.get('blog_url'):
+        record['blog'] = activity['blog_url']
+    
+    if tracks_dir:
+        # Write the track to its own file, the shell only keeps its bounds
+        track_file = f"{activity['id']}.json"
+        with open(os.path.join(tracks_dir, track_file), 'w') as f:
+            json.dump({'levels': levels}, f, separators=(',', ':'))
+        record['url'] = f"tracks/{track_file}"
+    else:
+        record['levels'] = levels
+    
+    return {
+        'activity_id': activity['id'],
+        'hike_number': activity['hike_number'],
+        'points_in': track['points_in'],
+        'points_out': len(points),
+        'segments': track_segments(points),
+        'record': record,
+    }
 
 
-def create_interactive_map(data_dir):
-    """Create interactive map with all hiking routes"""
+def create_interactive_map(data_dir, use_cache=True, jobs=None,
+                           simplify=DEFAULT_SIMPLIFY, tolerance=DEFAULT_TOLERANCE_M,
+                           split_dir=None, markers=DEFAULT_MARKERS, vector_tiles=False,
+                           heatmap=False):
+    """Create interactive map with all hiking routes
     
+    With split_dir, writes a light HTML shell holding only start markers and
+    bounding boxes to split_dir/hiking_map.html, plus one track file per hike
+    under split_dir/tracks/ that the page fetches when the hike comes into view.
+    With vector_tiles, every track is tiled into a PMTiles archive next to the
+    page instead, which the page reads with HTTP range requests. With heatmap,
+    the heatmap tile pyramid next to the page is brought up to date and added
+    as a layer. markers is one of MARKER_MODES.
+    """
+    
+    # Write back trail and activity changes made since the last build
+    written = export_pending(data_dir)
+    if written:
+        print(f"Exported {', '.join(written)}")
+
     # Read hiking activities CSV
     csv_path = os.path.join(data_dir, 'hiking_activities.csv')
     activities_dir = os.path.join(data_dir, 'activities')
     trail_names_path = os.path.join(data_dir, 'trail_names.csv')
     
+    # Simplified tracks are cached on disk so unchanged ones aren't recomputed
+    cache = TrackCache(os.path.join(data_dir, '.track_cache')) if use_cache else None
+    
     # Read trail names mapping if it exists
     trail_mapping = {}
     if os.path.exists(trail_names_path):
@@ -169,25 +351,30 @@ def create_interactive_map(data_dir):
     
     # Keep only OpenStreetMap to reduce file size
     
+    # Per-hike fragments are kept in a build manifest so a rebuild only
+    # regenerates hikes whose GPS file or CSV rows changed
+    manifest = BuildManifest(os.path.join(data_dir, '.build_manifest.json')) if use_cache else None
+    fragment_settings = {
+        'fragment': FRAGMENT_VERSION,
+        'parser': PARSER_VERSION,
+        'cache': _cache_settings(simplify, tolerance),
+        'split': bool(split_dir),
+    }
+    
     # Track statistics
-    total_tracks = 0
     failed_tracks = 0
-    all_points = []
-    markers_data = []  # Store marker data for zoom functionality
-    
-    # Color palette for trails - using vibrant hex colors for lines
-    trail_colors = ['#FF0000', '#0066FF', '#00AA00', '#9900FF', '#FF6600', '#CC0000',
-                    '#FF3366', '#00CCCC', '#0033CC', '#006600', '#FF00FF', 
-                    '#6600CC', '#FFAA00', '#FF0099', '#0099FF', '#33CC33', 
-                    '#CC00CC', '#FF3300', '#009999']
-    
-    # Marker colors - must be from folium's allowed list
-    marker_colors = ['red', 'blue', 'green', 'purple', 'orange', 'darkred',
-                     'lightred', 'cadetblue', 'darkblue', 'darkgreen', 'pink',
-                     'darkpurple', 'orange', 'lightblue', 'lightgreen',
-                     'red', 'purple', 'blue', 'green']
-    
-    # Process each activity
+    fragments = {}  # CSV index -> fragment, so hikes keep CSV order
+    
+    tracks_dir = None
+    if split_dir:
+        tracks_dir = os.path.join(split_dir, 'tracks')
+        os.makedirs(tracks_dir, exist_ok=True)
+    
+    # Decode new or changed GPS files into the track store
+    store = open_store(data_dir, jobs)
+    
+    # Collect the stored track for each activity, keeping the CSV index for colors
+    to_simplify = []
     for idx, activity in enumerate(activities):
         if not activity['filename']:
             continue
@@ -197,91 +384,86 @@ def create_interactive_map(data_dir):
             print(f"File not found: {filepath}")
             failed_tracks += 1
             continue
+        if activity['id'] not in store:
+            failed_tracks += 1
+            continue
         
-        # Parse file based on extension
-        points = []
-        if filepath.endswith('.gpx'):
-            points = parse_gpx_file(filepath)
-        elif filepath.endswith('.fit.gz') or filepath.endswith('.fit'):
-            points = parse_fit_file(filepath)
+        if manifest is None:
+            to_simplify.append((idx, activity, None))
+            continue
         
-        if points:
-            total_tracks += 1
-            all_points.extend(points)
-            
-            # Create polyline for this hike
-            trail_color = trail_colors[idx % len(trail_colors)]
-            marker_color = marker_colors[idx % len(marker_colors)]
-            
-            # Format date and distance for display
-            # Parse date string and format to just show date without time
-            try:
-                date_obj = pd.to_datetime(activity['date'])
-                formatted_date = date_obj.strftime('%B %d, %Y')  # e.g., "May 12, 2024"
-            except:
-                formatted_date = activity['date']  # fallback to original if parsing fails
-            
-            # Convert distance from meters to kilometers and round to 1 decimal place
-            try:
-                distance_meters = float(activity['distance'])
-                distance_km = distance_meters / 1000.0
-                distance_rounded = round(distance_km, 1)
-            except:
-                distance_rounded = activity['distance']  # fallback to original if conversion fails
-            
-            # Create blog link HTML if URL exists
-            blog_link_html = ""
-            if activity.get('blog_url'):
-                blog_link_html = f"<br><a href='{activity['blog_url']}' target='_blank' style='display: inline-block; margin-top: 8px; padding: 6px 12px; background-color: #007bff; color: white; text-decoration: none; border-radius: 4px; font-size: 13px;'>📖 Read Blog Post</a>"
-            
-            # Add the track to map (single line with stroke for visibility)
-            folium.PolyLine(
-                points,
-                color=trail_color,
-                weight=4,
-                opacity=0.9,
-                popup=folium.Popup(
-                    f"<b>{activity['display_name']}</b><br>"
-                    f"Date: {formatted_date}<br>"
-                    f"Distance: {distance_rounded} km"
-                    f"{blog_link_html}",
-                    max_width=300
-                ),
-                tooltip=f"{activity['display_name']}"
-            ).add_to(base_map)
-            
-            # Add start marker for each hike
-            if points:
-                # Calculate bounds for this hike
-                hike_bounds = [[min(p[0] for p in points), min(p[1] for p in points)],
-                              [max(p[0] for p in points), max(p[1] for p in points)]]
-                
-                # Create marker popup with blog link if available
-                marker_popup_html = f"<b>{activity['display_name']}</b>"
-                if activity.get('blog_url'):
-                    marker_popup_html += f"<br><a href='{activity['blog_url']}' target='_blank' style='display: inline-block; margin-top: 8px; padding: 6px 12px; background-color: #007bff; color: white; text-decoration: none; border-radius: 4px; font-size: 13px;'>📖 Read Blog Post</a>"
-                
-                marker = folium.Marker(
-                    points[0],
-                    popup=folium.Popup(marker_popup_html, max_width=300),
-                    tooltip=activity['display_name'],
-                    icon=folium.Icon(color=marker_color, icon='play', prefix='fa')
-                )
-                marker.add_to(base_map)
-                
-                # Store marker data for zoom functionality
-                markers_data.append({
-                    'hike_number': activity['hike_number'],
-                    'location': points[0],
-                    'bounds': hike_bounds
-                })
+        # Reuse the stored fragment when nothing that feeds it has changed
+        key = hash_fields({
+            'source': store.source_hash(activity['id']),
+            'row': activity,
+            'colors': _hike_colors(idx),
+            'settings': fragment_settings,
+        })
+        fragment = manifest.get(activity['id'], key)
+        if fragment and fragment['record'] and tracks_dir and not os.path.exists(
+                os.path.join(tracks_dir, f"{activity['id']}.json")):
+            fragment = None
+        if fragment:
+            fragments[idx] = fragment
+            manifest.reuse()
+        else:
+            to_simplify.append((idx, activity, key))
+    
+    # Simplify new or changed tracks (in parallel), results come back in CSV order
+    simplified = simplify_tracks(store, [activity['id'] for _, activity, _ in to_simplify],
+                                 cache, jobs, simplify, tolerance)
+    
+    # Build fragments for each simplified activity
+    for (idx, activity, key), track in zip(to_simplify, simplified):
+        if track is None:
+            failed_tracks += 1
+            continue
+        if track['points']:
+            fragment = _build_fragment(activity, track, idx, tracks_dir)
+            print(f"  {activity['display_name']}: {fragment['points_in']} -> "
+                  f"{fragment['points_out']} points "
+                  f"({fragment['points_out'] / fragment['points_in']:.1%})")
+        else:
+            # Activities without GPS (e.g. indoor) are remembered so they aren't re-read
+            fragment = {'activity_id': activity['id'], 'hike_number': activity['hike_number'],
+                        'points_in': 0, 'points_out': 0, 'record': None}
+        fragments[idx] = fragment
+        if manifest is not None:
+            manifest.put(activity['id'], key, fragment)
+    
+    if manifest is not None:
+        manifest.prune([activity['id'] for activity in activities])
+        manifest.save()
+    
+    hikes = [fragments[idx] for idx in sorted(fragments) if fragments[idx]['record']]
+    total_tracks = len(hikes)
+    points_in_total = sum(hike['points_in'] for hike in hikes)
+    points_out_total = sum(hike['points_out'] for hike in hikes)
     
     # Adjust map bounds to show all tracks
-    if all_points:
-        bounds = [[min(p[0] for p in all_points), min(p[1] for p in all_points)],
-                  [max(p[0] for p in all_points), max(p[1] for p in all_points)]]
+    if hikes:
+        hike_bounds = [hike['record']['bounds'] for hike in hikes]
+        bounds = [[min(b[0][0] for b in hike_bounds), min(b[0][1] for b in hike_bounds)],
+                  [max(b[1][0] for b in hike_bounds), max(b[1][1] for b in hike_bounds)]]
         base_map.fit_bounds(bounds)
     
+    # Tracks and start markers are added from the hikes array once the map exists
+    base_map.add_child(HikeLayer())
+    
+    # Heatmap of every GPS point, pre-rendered tiles (see heatmap.py)
+    if heatmap and hikes:
+        folium.TileLayer(
+            tiles=f"{HEATMAP_DIR}/{{z}}/{{x}}/{{y}}.png",
+            attr='Hike heatmap',
+            name='Heatmap',
+            overlay=True,
+            show=False,
+            opacity=0.8,
+            min_native_zoom=HEATMAP_MIN_ZOOM,
+            max_native_zoom=HEATMAP_MAX_ZOOM,
+            bounds=bounds,
+        ).add_to(base_map)
+    
     # Add layer control
     folium.LayerControl().add_to(base_map)
     
@@ -295,23 +477,745 @@ def create_interactive_map(data_dir):
     minimap = plugins.MiniMap(toggle_display=True)
     base_map.add_child(minimap)
     
-    # Build JavaScript data object for hike navigation
-    hike_data_js = "var hikeData = {"
-    for marker in markers_data:
-        if marker['hike_number']:  # Only add if there's a hike number
-            hike_data_js += f"""
-    '{marker['hike_number']}': {{
-        location: [{marker['location'][0]}, {marker['location'][1]}],
-        bounds: [[{marker['bounds'][0][0]}, {marker['bounds'][0][1]}], 
-                 [{marker['bounds'][1][0]}, {marker['bounds'][1][1]}]]
-    }},"""
-    hike_data_js = hike_data_js.rstrip(',') + "\n};"
+    # Spatial index over pieces of every track, shipped packed with the page
+    # and saved for hike_index.py queries
+    hike_index = HikeIndex([hike['segments'] for hike in hikes])
+    save_index(os.path.join(data_dir, HIKE_INDEX), hike_index,
+               [{'activity_id': hike['activity_id'], 'number': hike['hike_number'],
+                 'name': _hike_title(hike['record']), 'start': hike['record']['start']}
+                for hike in hikes])
+    packed = hike_index.packed()
+    index_js = _to_js({
+        'nodeSize': packed['nodeSize'],
+        # Leaf boxes as [min lat, min lon], [max lat, max lon] point pairs
+        'boxes': encode_polyline([point for box in packed['boxes']
+                                  for point in ([box[1], box[0]], [box[3], box[2]])]),
+        'items': packed['items'],
+    })
+    # Start points go in one encoded array; marker colors are only needed for icons
+    starts_js = _to_js(encode_polyline([hike['record']['start'] for hike in hikes]))
+    page_fields = ('start', 'markerColor') if markers == 'cluster' else ('start',)
+    if vector_tiles:
+        # Tracks are drawn from the tile archive
+        page_fields += ('levels', 'url')
+    tiles_url_js = _to_js(PMTILES_NAME if vector_tiles else None)
+    hikes_js = "var hikes = [\n" + ",\n".join(
+        _to_js({k: v for k, v in hike['record'].items() if k not in page_fields})
+        for hike in hikes) + "\n];"
     
     # Add custom JavaScript for zoom-on-click and URL anchor functionality
     zoom_script = f"""
     <script>
-    // Store hike data for anchor navigation
-    {hike_data_js}
+    // Decode a Google encoded polyline (E5, delta + zigzag varint) into [lat, lon] pairs
+    function decodePolyline(str) {{
+        var points = [], index = 0, lat = 0, lon = 0;
+        while (index < str.length) {{
+            var deltas = [0, 0];
+            for (var d = 0; d < 2; d++) {{
+                var shift = 0, result = 0, b;
+                do {{
+                    b = str.charCodeAt(index++) - 63;
+                    result |= (b & 0x1f) << shift;
+                    shift += 5;
+                }} while (b >= 0x20);
+                deltas[d] = (result & 1) ? ~(result >> 1) : (result >> 1);
+            }}
+            lat += deltas[0];
+            lon += deltas[1];
+            points.push([lat / 1e5, lon / 1e5]);
+        }}
+        return points;
+    }}
+    
+    // One record per hike: colors, bounds, the fields its popups show and
+    // either its encoded detail levels (coarsest first) or, in split mode,
+    // the URL of its track file
+    {hikes_js}
+    
+    // Popup and tooltip templates, filled in from a hike's record when shown
+    function hikeTitle(hike) {{
+        return hike.number ? '#' + hike.number + ': ' + hike.name : hike.name;
+    }}
+    
+    function blogLink(hike) {{
+        return hike.blog ? '<br><a class="hike-blog-link" href="' + hike.blog +
+                           '" target="_blank">📖 Read Blog Post</a>' : '';
+    }}
+    
+    function trackPopup(hike) {{
+        return '<b>' + hikeTitle(hike) + '</b><br>Date: ' + hike.date +
+               '<br>Distance: ' + hike.km + ' km' + blogLink(hike);
+    }}
+    
+    function startPopup(hike) {{
+        return '<b>' + hikeTitle(hike) + '</b>' + blogLink(hike);
+    }}
+    
+    // Packed R-tree over pieces of every track (see hike_index.py). Only the
+    // leaves are shipped; each level above holds the bounds of nodeSize
+    // consecutive entries of the one below. Boxes are [minLon, minLat, maxLon, maxLat].
+    function HikeIndex(data) {{
+        var coords = decodePolyline(data.boxes), leaves = [];
+        for (var i = 0; i < coords.length; i += 2) {{
+            leaves.push([coords[i][1], coords[i][0], coords[i + 1][1], coords[i + 1][0]]);
+        }}
+        this.nodeSize = data.nodeSize;
+        this.items = data.items;
+        this.levels = [leaves];
+        while (this.levels[this.levels.length - 1].length > 1) {{
+            var below = this.levels[this.levels.length - 1], level = [];
+            for (var start = 0; start < below.length; start += this.nodeSize) {{
+                var box = below[start].slice();
+                for (var j = start + 1; j < Math.min(start + this.nodeSize, below.length); j++) {{
+                    box[0] = Math.min(box[0], below[j][0]);
+                    box[1] = Math.min(box[1], below[j][1]);
+                    box[2] = Math.max(box[2], below[j][2]);
+                    box[3] = Math.max(box[3], below[j][3]);
+                }}
+                level.push(box);
+            }}
+            this.levels.push(level);
+        }}
+    }}
+    
+    // Leaves whose box intersects the query box, descending level by level
+    HikeIndex.prototype.searchLeaves = function(minLon, minLat, maxLon, maxLat) {{
+        var top = this.levels.length - 1, nodes = [];
+        if (!this.levels[0].length) return nodes;
+        for (var i = 0; i < this.levels[top].length; i++) nodes.push(i);
+        for (var depth = top; depth >= 0; depth--) {{
+            var level = this.levels[depth], next = [];
+            for (var k = 0; k < nodes.length; k++) {{
+                var b = level[nodes[k]];
+                if (b[0] > maxLon || b[2] < minLon || b[1] > maxLat || b[3] < minLat) continue;
+                if (!depth) {{
+                    next.push(nodes[k]);
+                    continue;
+                }}
+                var end = Math.min((nodes[k] + 1) * this.nodeSize, this.levels[depth - 1].length);
+                for (var c = nodes[k] * this.nodeSize; c < end; c++) next.push(c);
+            }}
+            nodes = next;
+        }}
+        return nodes;
+    }};
+    
+    // Positions in `hikes` of the hikes whose track crosses a LatLngBounds
+    HikeIndex.prototype.search = function(bounds) {{
+        var seen = {{}}, found = [];
+        this.searchLeaves(bounds.getWest(), bounds.getSouth(),
+                          bounds.getEast(), bounds.getNorth()).forEach(function(leaf) {{
+            var item = this.items[leaf];
+            if (!seen[item]) {{
+                seen[item] = true;
+                found.push(item);
+            }}
+        }}, this);
+        return found;
+    }};
+    
+    // [{{hike, km}}] of hikes within km of a point, nearest first. Distances
+    // are to the nearest indexed piece of track, good to a few hundred meters.
+    HikeIndex.prototype.near = function(lat, lon, km) {{
+        var kmPerDeg = {KM_PER_DEG:.4f}, cosLat = Math.cos(lat * Math.PI / 180);
+        var dLat = km / kmPerDeg, dLon = dLat / Math.max(cosLat, 0.01), nearest = {{}};
+        this.searchLeaves(lon - dLon, lat - dLat, lon + dLon, lat + dLat).forEach(function(leaf) {{
+            var b = this.levels[0][leaf], item = this.items[leaf];
+            var dx = Math.max(b[0] - lon, 0, lon - b[2]) * cosLat;
+            var dy = Math.max(b[1] - lat, 0, lat - b[3]);
+            var d = kmPerDeg * Math.sqrt(dx * dx + dy * dy);
+            if (d <= km && !(nearest[item] <= d)) nearest[item] = d;
+        }}, this);
+        return Object.keys(nearest).map(function(item) {{
+            return {{hike: hikes[item], km: nearest[item]}};
+        }}).sort(function(a, b) {{ return a.km - b.km; }});
+    }};
+    
+    var hikeIndex = new HikeIndex({index_js});
+    
+    // Hikes whose track crosses the map's current view
+    function hikesInView(map) {{
+        return hikeIndex.search(map.getBounds()).map(function(i) {{ return hikes[i]; }});
+    }}
+    
+    // Hikes within km of a point (e.g. the reader's location), nearest first
+    function hikesNear(lat, lon, km) {{
+        return hikeIndex.near(lat, lon, km);
+    }}
+    
+    // Detail levels of each track on the map, by position in `hikes`
+    var trackLods = [];
+    
+    // Start point of each hike, by position in `hikes`
+    var starts = decodePolyline({starts_js});
+    
+    // How start points are drawn ('cluster' or 'icons'), and positions by hike number
+    var startMode = '{markers}';
+    var hikePositions = {{}};
+    
+    // Add a track polyline painted with its coarsest level
+    function addTrackPolyline(map, i, levels) {{
+        var hike = hikes[i];
+        levels[0][1] = decodePolyline(levels[0][1]);
+        var polyline = L.polyline(levels[0][1], {{
+            color: hike.color, weight: 4, opacity: 0.9
+        }});
+        polyline.bindPopup(function() {{ return trackPopup(hike); }}, {{maxWidth: 300}});
+        polyline.bindTooltip(function() {{ return hikeTitle(hike); }}, {{sticky: true}});
+        polyline.addTo(map);
+        trackLods[i] = {{polyline: polyline, levels: levels, current: 0}};
+        return polyline;
+    }}
+    
+    // Zoom in on a clicked start point
+    function zoomToStart(map, latlng) {{
+        // Get current zoom level
+        var currentZoom = map.getZoom();
+        var targetZoom = 14;  // Target zoom level for detail view
+        
+        // Only zoom in if we're not already at or beyond target zoom
+        if (currentZoom < targetZoom) {{
+            map.setView(latlng, targetZoom, {{
+                animate: true,
+                duration: 0.5
+            }});
+        }} else {{
+            // If already zoomed in, just center on the marker
+            map.panTo(latlng, {{
+                animate: true,
+                duration: 0.5
+            }});
+        }}
+    }}
+    
+    // A hike's name, linked to its anchor when it has a number
+    function hikeLink(i) {{
+        var hike = hikes[i];
+        return hike.number ? '<a href="#' + hike.number + '">' + hikeTitle(hike) + '</a>' : hikeTitle(hike);
+    }}
+    
+    // Start points of every hike drawn on one canvas, with starts closer than
+    // {START_CLUSTER_PX}px merged into numbered clusters. Nothing is added to the DOM
+    // per hike: tooltips and popups are built when a start is hovered or clicked.
+    var StartLayer = L.Layer.extend({{
+        onAdd: function(map) {{
+            this._drawn = [];
+            this._canvas = L.DomUtil.create('canvas', 'leaflet-zoom-hide');
+            this._canvas.style.pointerEvents = 'none';
+            map.getPane('markerPane').appendChild(this._canvas);
+            map.on('moveend zoomend resize', this._redraw, this);
+            map.on('click', this._onClick, this);
+            map.on('mousemove', this._onMouseMove, this);
+            this._redraw();
+        }},
+        
+        onRemove: function(map) {{
+            L.DomUtil.remove(this._canvas);
+            map.off('moveend zoomend resize', this._redraw, this);
+            map.off('click', this._onClick, this);
+            map.off('mousemove', this._onMouseMove, this);
+        }},
+        
+        // Group the starts in view by grid cell in world pixels at the
+        // current zoom, so clusters don't change while panning
+        _cluster: function() {{
+            var map = this._map, zoom = map.getZoom(), view = map.getBounds().pad(0.1);
+            var cells = {{}}, clusters = [];
+            for (var i = 0; i < starts.length; i++) {{
+                if (!view.contains(starts[i])) continue;
+                var p = map.project(starts[i], zoom);
+                var key = Math.floor(p.x / {START_CLUSTER_PX}) + ':' + Math.floor(p.y / {START_CLUSTER_PX});
+                var cluster = cells[key];
+                if (!cluster) {{
+                    cluster = cells[key] = {{hikes: [], x: 0, y: 0}};
+                    clusters.push(cluster);
+                }}
+                cluster.hikes.push(i);
+                cluster.x += p.x;
+                cluster.y += p.y;
+            }}
+            return clusters;
+        }},
+        
+        _redraw: function() {{
+            var map = this._map, size = map.getSize(), ratio = window.devicePixelRatio || 1;
+            var canvas = this._canvas, ctx = canvas.getContext('2d');
+            L.DomUtil.setPosition(canvas, map.containerPointToLayerPoint([0, 0]));
+            canvas.width = size.x * ratio;
+            canvas.height = size.y * ratio;
+            canvas.style.width = size.x + 'px';
+            canvas.style.height = size.y + 'px';
+            ctx.scale(ratio, ratio);
+            var origin = map.getPixelBounds().min, zoom = map.getZoom();
+            this._drawn = this._cluster().map(function(cluster) {{
+                var count = cluster.hikes.length;
+                var center = L.point(cluster.x / count, cluster.y / count);
+                var p = center.subtract(origin);
+                var r = count === 1 ? 7 : Math.min(12 + 2 * Math.log2(count), 22);
+                ctx.beginPath();
+                ctx.arc(p.x, p.y, r, 0, 2 * Math.PI);
+                ctx.fillStyle = count === 1 ? hikes[cluster.hikes[0]].color : 'rgba(0, 102, 255, 0.85)';
+                ctx.fill();
+                ctx.lineWidth = 2;
+                ctx.strokeStyle = 'white';
+                ctx.stroke();
+                if (count > 1) {{
+                    ctx.fillStyle = 'white';
+                    ctx.font = 'bold 12px sans-serif';
+                    ctx.textAlign = 'center';
+                    ctx.textBaseline = 'middle';
+                    ctx.fillText(count, p.x, p.y);
+                }}
+                return {{x: p.x, y: p.y, r: r, hikes: cluster.hikes,
+                         latlng: map.unproject(center, zoom)}};
+            }});
+        }},
+        
+        // The drawn start or cluster under a mouse event, if any
+        _hit: function(e) {{
+            for (var k = this._drawn.length - 1; k >= 0; k--) {{
+                var d = this._drawn[k];
+                var dx = e.containerPoint.x - d.x, dy = e.containerPoint.y - d.y;
+                if (dx * dx + dy * dy <= (d.r + 3) * (d.r + 3)) return d;
+            }}
+            return null;
+        }},
+        
+        _onMouseMove: function(e) {{
+            var d = this._hit(e), map = this._map;
+            map.getContainer().style.cursor = d ? 'pointer' : '';
+            if (d === this._hover) return;
+            this._hover = d;
+            if (this._tooltip) map.closeTooltip(this._tooltip);
+            this._tooltip = null;
+            if (d) {{
+                this._tooltip = L.tooltip({{direction: 'top', offset: [0, -d.r]}})
+                    .setLatLng(d.latlng)
+                    .setContent(d.hikes.length === 1 ? hikeTitle(hikes[d.hikes[0]])
+                                                     : d.hikes.length + ' hikes');
+                map.openTooltip(this._tooltip);
+            }}
+        }},
+        
+        _onClick: function(e) {{
+            var d = this._hit(e), map = this._map;
+            if (!d) return;
+            if (d.hikes.length === 1) {{
+                this.openPopup(d.hikes[0]);
+                zoomToStart(map, starts[d.hikes[0]]);
+                return;
+            }}
+            // Zoom in until the cluster splits; starts that never split
+            // (the same trailhead) are listed in a popup instead
+            var bounds = L.latLngBounds(d.hikes.map(function(i) {{ return starts[i]; }}));
+            if (map.getBoundsZoom(bounds) > map.getZoom()) {{
+                map.fitBounds(bounds, {{padding: [60, 60]}});
+                return;
+            }}
+            L.popup({{maxWidth: 300}})
+                .setLatLng(d.latlng)
+                .setContent(d.hikes.map(hikeLink).join('<br>'))
+                .openOn(map);
+        }},
+        
+        // Open the start popup of the hike at position i in `hikes`
+        openPopup: function(i) {{
+            L.popup({{maxWidth: 300, offset: [0, -5]}})
+                .setLatLng(starts[i])
+                .setContent(startPopup(hikes[i]))
+                .openOn(this._map);
+        }}
+    }});
+    
+    // Start markers in 'icons' mode, by position in `hikes`
+    var hikeMarkers = [];
+    var startLayer = null;
+    
+    // Add one hike's track unless it is fetched later, and its icon in 'icons' mode
+    function addHike(map, hike, i) {{
+        if (hike.levels) {{
+            addTrackPolyline(map, i, hike.levels);
+        }}
+        if (hike.number) hikePositions[hike.number] = i;
+        if (startMode !== 'icons') return;
+        var marker = L.marker(starts[i], {{
+            icon: L.AwesomeMarkers.icon({{
+                icon: 'play', prefix: 'fa', markerColor: hike.markerColor,
+                iconColor: 'white', extraClasses: 'fa-rotate-0'
+            }})
+        }});
+        marker.bindPopup(function() {{ return startPopup(hike); }}, {{maxWidth: 300}});
+        marker.bindTooltip(function() {{ return hikeTitle(hike); }}, {{sticky: true}});
+        marker.on('click', function(e) {{
+            zoomToStart(map, e.latlng);
+            // Prevent event from bubbling (which could cause zoom out)
+            L.DomEvent.stopPropagation(e);
+        }});
+        marker.addTo(map);
+        hikeMarkers[i] = marker;
+    }}
+    
+    // Add the clustered start layer once every hike is on the map
+    function addStarts(map) {{
+        if (startMode === 'cluster') startLayer = new StartLayer().addTo(map);
+    }}
+    
+    // Open the start popup of the hike at position i in `hikes`
+    function openStartPopup(i) {{
+        if (startLayer) {{
+            startLayer.openPopup(i);
+        }} else {{
+            hikeMarkers[i].openPopup();
+        }}
+    }}
+    
+    // Vector tiles of every track (--vector-tiles): a PMTiles archive next to
+    // the page, read with HTTP range requests. null when tracks are in `hikes`.
+    var trackTilesUrl = {tiles_url_js};
+    
+    // Protobuf varint at pos.i (advancing it); exact up to 2^53
+    function readVarint(bytes, pos) {{
+        var value = 0, scale = 1, b;
+        do {{
+            b = bytes[pos.i++];
+            value += (b & 0x7f) * scale;
+            scale *= 128;
+        }} while (b & 0x80);
+        return value;
+    }}
+    
+    function skipField(bytes, pos, wireType) {{
+        if (wireType === 0) readVarint(bytes, pos);
+        else if (wireType === 1) pos.i += 8;
+        else if (wireType === 2) pos.i += readVarint(bytes, pos);
+        else if (wireType === 5) pos.i += 4;
+    }}
+    
+    function gunzip(buf) {{
+        var stream = new Blob([buf]).stream().pipeThrough(new DecompressionStream('gzip'));
+        return new Response(stream).arrayBuffer();
+    }}
+    
+    // PMTiles tile ID: tiles of lower zooms first, then the Hilbert index
+    function tileId(z, x, y) {{
+        var id = (Math.pow(4, z) - 1) / 3;
+        for (var s = Math.pow(2, z - 1); s >= 1; s /= 2) {{
+            var rx = (x & s) ? 1 : 0, ry = (y & s) ? 1 : 0;
+            id += s * s * ((3 * rx) ^ ry);
+            if (!ry) {{
+                if (rx) {{
+                    x = s - 1 - x;
+                    y = s - 1 - y;
+                }}
+                var t = x;
+                x = y;
+                y = t;
+            }}
+            x &= s - 1;
+            y &= s - 1;
+        }}
+        return id;
+    }}
+    
+    // [{{tileId, offset, length, runLength}}]; runLength 0 points at a leaf directory
+    function parseDirectory(buf) {{
+        var bytes = new Uint8Array(buf), pos = {{i: 0}}, entries = [], id = 0, k;
+        var n = readVarint(bytes, pos);
+        for (k = 0; k < n; k++) {{
+            id += readVarint(bytes, pos);
+            entries.push({{tileId: id}});
+        }}
+        for (k = 0; k < n; k++) entries[k].runLength = readVarint(bytes, pos);
+        for (k = 0; k < n; k++) entries[k].length = readVarint(bytes, pos);
+        for (k = 0; k < n; k++) {{
+            var offset = readVarint(bytes, pos);
+            entries[k].offset = (offset === 0 && k > 0) ?
+                entries[k - 1].offset + entries[k - 1].length : offset - 1;
+        }}
+        return entries;
+    }}
+    
+    // Minimal PMTiles v3 reader: the header, directories and tiles are
+    // fetched with range requests, directories are kept once read
+    function PMTiles(url) {{
+        this.url = url;
+        this.leaves = {{}};
+        var self = this;
+        this.header = this._range(0, 16384).then(function(buf) {{
+            var view = new DataView(buf);
+            function u64(offset) {{
+                return view.getUint32(offset, true) + view.getUint32(offset + 4, true) * 4294967296;
+            }}
+            if (String.fromCharCode.apply(null, new Uint8Array(buf, 0, 7)) !== 'PMTiles' ||
+                    view.getUint8(7) !== 3) {{
+                throw new Error(url + ' is not a PMTiles v3 archive');
+            }}
+            var header = {{
+                leafOffset: u64(40), dataOffset: u64(56),
+                internalCompression: view.getUint8(97), tileCompression: view.getUint8(98),
+                minZoom: view.getUint8(100), maxZoom: view.getUint8(101)
+            }};
+            var root = buf.slice(u64(8), u64(8) + u64(16));
+            return self._decompress(root, header.internalCompression).then(function(root) {{
+                header.root = parseDirectory(root);
+                return header;
+            }});
+        }});
+    }}
+    
+    PMTiles.prototype._range = function(offset, length) {{
+        return fetch(this.url, {{headers: {{Range: 'bytes=' + offset + '-' + (offset + length - 1)}}}})
+            .then(function(response) {{
+                if (!response.ok) throw new Error(response.status + ' fetching ' + response.url);
+                return response.arrayBuffer().then(function(buf) {{
+                    // A server that ignores Range sends the whole archive
+                    return response.status === 206 ? buf : buf.slice(offset, offset + length);
+                }});
+            }});
+    }};
+    
+    // Compression types: 1 none, 2 gzip
+    PMTiles.prototype._decompress = function(buf, compression) {{
+        return compression === 2 ? gunzip(buf) : Promise.resolve(buf);
+    }};
+    
+    // The tile's (decompressed) bytes, or null if the archive has no such tile
+    PMTiles.prototype.getTile = function(z, x, y) {{
+        var id = tileId(z, x, y), self = this;
+        return this.header.then(function(header) {{
+            function search(entries) {{
+                var lo = 0, hi = entries.length - 1;
+                while (lo <= hi) {{
+                    var mid = (lo + hi) >> 1;
+                    if (entries[mid].tileId <= id) lo = mid + 1;
+                    else hi = mid - 1;
+                }}
+                var entry = entries[hi];
+                if (!entry) return null;
+                if (entry.runLength === 0) {{
+                    var key = entry.offset + ':' + entry.length;
+                    if (!self.leaves[key]) {{
+                        self.leaves[key] = self._range(header.leafOffset + entry.offset, entry.length)
+                            .then(function(buf) {{ return self._decompress(buf, header.internalCompression); }})
+                            .then(parseDirectory);
+                    }}
+                    return self.leaves[key].then(search);
+                }}
+                if (id >= entry.tileId + entry.runLength) return null;
+                return self._range(header.dataOffset + entry.offset, entry.length).then(function(buf) {{
+                    return self._decompress(buf, header.tileCompression);
+                }});
+            }}
+            return search(header.root);
+        }});
+    }};
+    
+    // Line features of a Mapbox Vector Tile:
+    // [{{id, properties, extent, lines: [[[x, y], ...], ...]}}] in tile units
+    function decodeTile(buf) {{
+        var bytes = new Uint8Array(buf), pos = {{i: 0}}, features = [];
+        while (pos.i < bytes.length) {{
+            var key = readVarint(bytes, pos);
+            if (key === (3 << 3 | 2)) {{
+                var end = readVarint(bytes, pos) + pos.i;
+                features = features.concat(decodeLayer(bytes, pos, end));
+            }} else {{
+                skipField(bytes, pos, key & 7);
+            }}
+        }}
+        return features;
+    }}
+    
+    function decodeLayer(bytes, pos, end) {{
+        var keys = [], values = [], spans = [], extent = 4096, text = new TextDecoder();
+        while (pos.i < end) {{
+            var key = readVarint(bytes, pos), field = key >> 3;
+            if (field === 5) {{
+                extent = readVarint(bytes, pos);
+            }} else if (field >= 2 && field <= 4 && (key & 7) === 2) {{
+                var length = readVarint(bytes, pos), start = pos.i;
+                pos.i += length;
+                if (field === 2) spans.push([start, pos.i]);
+                else if (field === 3) keys.push(text.decode(bytes.subarray(start, pos.i)));
+                else values.push(decodeValue(bytes, start, pos.i, text));
+            }} else {{
+                skipField(bytes, pos, key & 7);
+            }}
+        }}
+        return spans.map(function(span) {{
+            return decodeFeature(bytes, span[0], span[1], keys, values, extent);
+        }});
+    }}
+    
+    // String and integer values; other types decode as null
+    function decodeValue(bytes, start, end, text) {{
+        var pos = {{i: start}}, value = null;
+        while (pos.i < end) {{
+            var key = readVarint(bytes, pos), field = key >> 3;
+            if (field === 1) {{
+                var length = readVarint(bytes, pos);
+                value = text.decode(bytes.subarray(pos.i, pos.i + length));
+                pos.i += length;
+            }} else if (field === 4 || field === 5) {{
+                value = readVarint(bytes, pos);
+            }} else {{
+                skipField(bytes, pos, key & 7);
+            }}
+        }}
+        return value;
+    }}
+    
+    function decodeFeature(bytes, start, end, keys, values, extent) {{
+        var pos = {{i: start}}, feature = {{id: null, properties: {{}}, extent: extent, lines: []}};
+        while (pos.i < end) {{
+            var key = readVarint(bytes, pos), field = key >> 3;
+            if (field === 1) {{
+                feature.id = readVarint(bytes, pos);
+            }} else if (field === 2 || field === 4) {{
+                var stop = readVarint(bytes, pos) + pos.i, packed = [];
+                while (pos.i < stop) packed.push(readVarint(bytes, pos));
+                if (field === 2) {{
+                    for (var t = 0; t + 1 < packed.length; t += 2) {{
+                        feature.properties[keys[packed[t]]] = values[packed[t + 1]];
+                    }}
+                }} else {{
+                    feature.lines = decodeLines(packed);
+                }}
+            }} else {{
+                skipField(bytes, pos, key & 7);
+            }}
+        }}
+        return feature;
+    }}
+    
+    // MoveTo/LineTo commands with zigzag deltas into lines of [x, y]
+    function decodeLines(commands) {{
+        var lines = [], line = null, x = 0, y = 0, k = 0;
+        while (k < commands.length) {{
+            var command = commands[k++] & 7, count = commands[k - 1] >> 3;
+            if (command === 7) continue;  // ClosePath
+            for (var c = 0; c < count; c++) {{
+                var dx = commands[k++], dy = commands[k++];
+                x += (dx >>> 1) ^ -(dx & 1);
+                y += (dy >>> 1) ^ -(dy & 1);
+                if (command === 1) {{
+                    line = [];
+                    lines.push(line);
+                }}
+                line.push([x, y]);
+            }}
+        }}
+        return lines;
+    }}
+    
+    // Tracks drawn from the vector tiles, one canvas per map tile. Past the
+    // archive's max zoom, tiles are cut from their ancestor so lines stay
+    // sharp; below {TILES_MIN_ZOOM} Leaflet scales down tiles of zoom {TILES_MIN_ZOOM}.
+    var TrackTileLayer = L.GridLayer.extend({{
+        initialize: function(archive, options) {{
+            this._archive = archive;
+            this._features = {{}};  // Decoded archive tiles by 'z/x/y', for clicks
+            L.GridLayer.prototype.initialize.call(this, options);
+        }},
+        
+        onAdd: function(map) {{
+            L.GridLayer.prototype.onAdd.call(this, map);
+            map.on('click', this._onClick, this);
+        }},
+        
+        onRemove: function(map) {{
+            L.GridLayer.prototype.onRemove.call(this, map);
+            map.off('click', this._onClick, this);
+        }},
+        
+        // Decoded features of an archive tile, fetched once
+        _load: function(z, x, y) {{
+            var key = z + '/' + x + '/' + y;
+            if (!this._features[key]) {{
+                this._features[key] = this._archive.getTile(z, x, y).then(function(buf) {{
+                    return buf ? decodeTile(buf) : [];
+                }});
+            }}
+            return this._features[key];
+        }},
+        
+        createTile: function(coords, done) {{
+            var canvas = L.DomUtil.create('canvas', 'leaflet-tile');
+            var size = this.getTileSize(), ratio = window.devicePixelRatio || 1, self = this;
+            canvas.width = size.x * ratio;
+            canvas.height = size.y * ratio;
+            this._archive.header.then(function(header) {{
+                var dz = Math.max(coords.z - header.maxZoom, 0), scale = Math.pow(2, dz);
+                var x = Math.floor(coords.x / scale), y = Math.floor(coords.y / scale);
+                return self._load(coords.z - dz, x, y).then(function(features) {{
+                    var ctx = canvas.getContext('2d');
+                    ctx.lineWidth = 4 * ratio;
+                    ctx.lineJoin = ctx.lineCap = 'round';
+                    ctx.globalAlpha = 0.9;
+                    features.forEach(function(feature) {{
+                        var unit = canvas.width * scale / feature.extent;
+                        var ox = (coords.x - x * scale) * canvas.width;
+                        var oy = (coords.y - y * scale) * canvas.height;
+                        ctx.strokeStyle = feature.properties.color;
+                        ctx.beginPath();
+                        feature.lines.forEach(function(line) {{
+                            ctx.moveTo(line[0][0] * unit - ox, line[0][1] * unit - oy);
+                            for (var k = 1; k < line.length; k++) {{
+                                ctx.lineTo(line[k][0] * unit - ox, line[k][1] * unit - oy);
+                            }}
+                        }});
+                        ctx.stroke();
+                    }});
+                    done(null, canvas);
+                }});
+            }}).catch(function(error) {{ done(error, canvas); }});
+            return canvas;
+        }},
+        
+        // Open the popup of the track nearest a click, within a few pixels
+        _onClick: function(e) {{
+            var map = this._map, self = this;
+            if (startLayer && startLayer._hit(e)) return;
+            this._archive.header.then(function(header) {{
+                var zoom = Math.round(map.getZoom());
+                var z = Math.min(Math.max(zoom, header.minZoom), header.maxZoom);
+                var p = map.project(e.latlng, z), size = self.getTileSize().x;
+                var x = Math.floor(p.x / size), y = Math.floor(p.y / size);
+                var key = z + '/' + x + '/' + y;
+                if (!self._features[key]) return;
+                self._features[key].then(function(features) {{
+                    var best = null, bestDist = Infinity;
+                    features.forEach(function(feature) {{
+                        var unit = feature.extent / size;
+                        var px = (p.x - x * size) * unit, py = (p.y - y * size) * unit;
+                        var limit = 6 * unit / Math.pow(2, zoom - z);
+                        feature.lines.forEach(function(line) {{
+                            for (var k = 1; k < line.length; k++) {{
+                                var d = L.LineUtil.pointToSegmentDistance(
+                                    L.point(px, py), L.point(line[k - 1]), L.point(line[k]));
+                                if (d <= limit && d < bestDist) {{
+                                    best = feature;
+                                    bestDist = d;
+                                }}
+                            }}
+                        }});
+                    }});
+                    if (best && hikes[best.id]) {{
+                        L.popup({{maxWidth: 300}})
+                            .setLatLng(e.latlng)
+                            .setContent(trackPopup(hikes[best.id]))
+                            .openOn(map);
+                    }}
+                }});
+            }});
+        }}
+    }});
+    
+    // Draw the tracks from the vector tile archive, when the page uses one
+    function addTrackTiles(map) {{
+        if (!trackTilesUrl) return;
+        new TrackTileLayer(new PMTiles(trackTilesUrl), {{minNativeZoom: {TILES_MIN_ZOOM}}}).addTo(map);
+    }}
     
     document.addEventListener('DOMContentLoaded', function() {{
         // Wait for map to be fully loaded
@@ -320,72 +1224,76 @@ def create_interactive_map(data_dir):
             var mapId = document.querySelector('.folium-map').id;
             var map = window[mapId];
             
-            // Add click handler to all markers
-            map.eachLayer(function(layer) {{
-                if (layer instanceof L.Marker) {{
-                    layer.on('click', function(e) {{
-                        // Get current zoom level
-                        var currentZoom = map.getZoom();
-                        var targetZoom = 14;  // Target zoom level for detail view
-                        
-                        // Only zoom in if we're not already at or beyond target zoom
-                        if (currentZoom < targetZoom) {{
-                            map.setView(e.latlng, targetZoom, {{
-                                animate: true,
-                                duration: 0.5
-                            }});
-                        }} else {{
-                            // If already zoomed in, just center on the marker
-                            map.panTo(e.latlng, {{
-                                animate: true,
-                                duration: 0.5
-                            }});
-                        }}
-                        
-                        // Prevent event from bubbling (which could cause zoom out)
-                        L.DomEvent.stopPropagation(e);
-                    }});
-                }}
-            }});
+            // Swap visible tracks to the detail level for the current zoom.
+            // Tracks out of view keep their level until they are panned in.
+            function applyTrackLods() {{
+                var zoom = map.getZoom();
+                hikeIndex.search(map.getBounds().pad(0.5)).forEach(function(i) {{
+                    var track = trackLods[i];
+                    if (!track) return;
+                    var level = 0;
+                    for (var l = 1; l < track.levels.length; l++) {{
+                        if (zoom >= track.levels[l][0]) level = l;
+                    }}
+                    if (level === track.current) return;
+                    if (typeof track.levels[level][1] === 'string') {{
+                        track.levels[level][1] = decodePolyline(track.levels[level][1]);
+                    }}
+                    track.polyline.setLatLngs(track.levels[level][1]);
+                    track.current = level;
+                }});
+            }}
+            map.on('zoomend moveend', applyTrackLods);
+            applyTrackLods();
+            
+            // Fetch a hike's track file once and add it as a polyline (split output mode)
+            var trackLoads = [];
+            function loadTrack(i) {{
+                if (trackLoads[i]) return trackLoads[i];
+                trackLoads[i] = fetch(hikes[i].url).then(function(response) {{
+                    return response.json();
+                }}).then(function(data) {{
+                    addTrackPolyline(map, i, data.levels);
+                    applyTrackLods();
+                }});
+                return trackLoads[i];
+            }}
+            
+            // Load tracks that cross the view once zoomed in far enough
+            function loadVisibleTracks() {{
+                if (map.getZoom() < {SPLIT_TRACK_MIN_ZOOM}) return;
+                hikeIndex.search(map.getBounds().pad(0.2)).forEach(function(i) {{
+                    if (hikes[i].url) loadTrack(i);
+                }});
+            }}
+            map.on('moveend', loadVisibleTracks);
+            loadVisibleTracks();
             
             // Function to zoom to a specific hike by number
             function zoomToHike(hikeNumber) {{
-                if (hikeData[hikeNumber]) {{
-                    var data = hikeData[hikeNumber];
-                    // First fit bounds to show the entire trail
-                    if (data.bounds) {{
-                        map.fitBounds(data.bounds, {{
-                            padding: [50, 50],
-                            animate: true,
-                            duration: 1
-                        }});
-                        // Then zoom to a reasonable level if too far out
-                        setTimeout(function() {{
-                            if (map.getZoom() < 13) {{
-                                map.setView(data.location, 13, {{
-                                    animate: true,
-                                    duration: 0.5
-                                }});
-                            }}
-                        }}, 1100);
-                    }} else {{
-                        // Fallback to just centering on the location
-                        map.setView(data.location, 14, {{
+                var i = hikePositions[hikeNumber];
+                if (i === undefined) return;
+                var hike = hikes[i];
+                // Make sure the targeted track is fetched even if zoomed out
+                if (hike.url) loadTrack(i);
+                // First fit bounds to show the entire trail
+                map.fitBounds(hike.bounds, {{
+                    padding: [50, 50],
+                    animate: true,
+                    duration: 1
+                }});
+                // Then zoom to a reasonable level if too far out
+                setTimeout(function() {{
+                    if (map.getZoom() < 13) {{
+                        map.setView(starts[i], 13, {{
                             animate: true,
-                            duration: 1
+                            duration: 0.5
                         }});
                     }}
-                    
-                    // Open the popup for this hike's marker
-                    map.eachLayer(function(layer) {{
-                        if (layer instanceof L.Marker) {{
-                            var popup = layer.getPopup();
-                            if (popup && popup.getContent().includes('#' + hikeNumber + ':')) {{
-                                layer.openPopup();
-                            }}
-                        }}
-                    }});
-                }}
+                }}, 1100);
+                
+                // Open the popup for this hike's marker
+                openStartPopup(i);
             }}
             
             // Check for URL hash/anchor on page load
@@ -407,17 +1315,67 @@ def create_interactive_map(data_dir):
     </script>
     """
     
-    # Add the script to the map
-    base_map.get_root().html.add_child(Element(zoom_script))
+    # Add the script to the map. Element content is rendered as a Jinja
+    # template, and encoded polylines may contain '{{', so keep it verbatim.
+    base_map.get_root().html.add_child(Element("{% raw %}" + zoom_script + "{% endraw %}"))
+
+    # Style of the "Read Blog Post" button, once for every popup
+    base_map.get_root().header.add_child(Element("""
+    <style>
+    .leaflet-popup-content a.hike-blog-link {
+        display: inline-block; margin-top: 8px; padding: 6px 12px; background-color: #007bff;
+        color: white; text-decoration: none; border-radius: 4px; font-size: 13px;
+    }
+    </style>
+    """))
     
     # Save map
-    output_path = os.path.join(os.path.dirname(data_dir), 'hiking_map.html')
+    if split_dir:
+        output_path = os.path.join(split_dir, 'hiking_map.html')
+        # Remove track files of hikes that are no longer on the map
+        written_tracks = {f"{hike['activity_id']}.json" for hike in hikes}
+        for name in os.listdir(tracks_dir):
+            if name.endswith('.json') and name not in written_tracks:
+                os.remove(os.path.join(tracks_dir, name))
+    else:
+        output_path = os.path.join(os.path.dirname(data_dir), 'hiking_map.html')
+    if vector_tiles:
+        tiles_path = os.path.join(os.path.dirname(output_path), PMTILES_NAME)
+        tiles_stats = build_pmtiles(tiles_path, store,
+                                    [{'activity_id': hike['activity_id'],
+                                      'number': hike['hike_number'],
+                                      'name': hike['record']['name'],
+                                      'color': hike['record']['color']} for hike in hikes],
+                                    jobs)
+    if heatmap:
+        heatmap_dir = os.path.join(os.path.dirname(output_path), HEATMAP_DIR)
+        heatmap_stats = update_heatmap(store, [hike['activity_id'] for hike in hikes],
+                                       heatmap_dir, jobs)
     base_map.save(output_path)
     
     print(f"\nMap Statistics:")
     print(f"Total activities in CSV: {len(activities)}")
     print(f"Successfully plotted: {total_tracks}")
     print(f"Failed to process: {failed_tracks}")
+    if points_in_total:
+        print(f"Track points ({simplify}, tolerance {tolerance:g}): {points_in_total} -> "
+              f"{points_out_total} ({points_out_total / points_in_total:.1%})")
+    if manifest is not None:
+        print(f"Build manifest: {manifest.reused} activities reused, {manifest.rebuilt} rebuilt")
+    if vector_tiles:
+        if tiles_stats:
+            print(f"Vector tiles: {tiles_stats['tiles']} tiles ({tiles_stats['contents']} unique, "
+                  f"{tiles_stats['bytes'] / 1e6:.1f} MB) written to {tiles_path}")
+        else:
+            print(f"Vector tiles: {tiles_path} is up to date")
+    if heatmap:
+        print(f"Heatmap: {heatmap_stats['activities']} activities changed, "
+              f"{heatmap_stats['written']} tiles written, {heatmap_stats['removed']} removed "
+              f"in {heatmap_dir}")
+    if cache is not None:
+        cache_stats = cache.stats()
+        print(f"Track cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+              f"{cache_stats['evictions']} evictions ({cache_stats['size_bytes'] / 1e6:.1f} MB)")
     print(f"\nInteractive map saved to: {output_path}")
     print(f"Open the file in your web browser to view the interactive map!")
     
@@ -426,32 +1384,21 @@ def create_interactive_map(data_dir):
 
 def create_summary_stats(data_dir):
     """Create summary statistics of hiking activities"""
-    csv_path = os.path.join(data_dir, 'hiking_activities.csv')
-    
-    # Read CSV into pandas
-    df = pd.read_csv(csv_path)
-    
-    # Convert date column to datetime
-    df['Activity Date'] = pd.to_datetime(df['Activity Date'])
-    
-    # Calculate statistics
-    stats = {
-        'Total Hikes': len(df),
-        'Total Distance (km)': df['Distance'].sum(),
-        'Average Distance (km)': df['Distance'].mean(),
-        'Longest Hike (km)': df['Distance'].max(),
-        'Total Elevation Gain (m)': df['Elevation Gain'].sum() if 'Elevation Gain' in df.columns else 'N/A',
-        'Date Range': f"{df['Activity Date'].min().strftime('%Y-%m-%d')} to {df['Activity Date'].max().strftime('%Y-%m-%d')}"
-    }
+    # Distance, elevation and moving time come from the GPS tracks, with
+    # per-year, per-month and per-region rollups
+    stats = compute_stats(data_dir)
     
     # Save stats to JSON
     stats_path = os.path.join(os.path.dirname(data_dir), 'hiking_stats.json')
     with open(stats_path, 'w') as f:
-        json.dump(stats, f, indent=2, default=str)
+        json.dump(stats, f, indent=2, ensure_ascii=False)
     
     print("\nHiking Statistics:")
     for key, value in stats.items():
-        print(f"  {key}: {value}")
+        if isinstance(value, dict):
+            print(f"  {key}: {len(value)} groups")
+        else:
+            print(f"  {key}: {value}")
     
     print(f"\nStatistics saved to: {stats_path}")
     
@@ -459,6 +1406,43 @@ def create_summary_stats(data_dir):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create an interactive map of all hikes")
+    parser.add_argument('--heatmap', action='store_true',
+                        help="Add a heatmap layer of every GPS point, rendering new or changed "
+                             f"tiles into {HEATMAP_DIR}/ next to the map")
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help="Processes used to decode and simplify tracks (default: all cores)")
+    parser.add_argument('--markers', choices=MARKER_MODES, default=DEFAULT_MARKERS,
+                        help="Start markers drawn as clusters on one canvas, or one "
+                             f"icon per hike (default: {DEFAULT_MARKERS})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Re-simplify every track instead of using the track cache "
+                             "and build manifest")
+    parser.add_argument('--simplify', choices=sorted(SIMPLIFIERS) + ['decimate'],
+                        default=DEFAULT_SIMPLIFY,
+                        help=f"Track simplification method (default: {DEFAULT_SIMPLIFY})")
+    parser.add_argument('--split-output', metavar='DIR',
+                        help="Write a light HTML shell plus per-hike track files "
+                             "(DIR/tracks/) that are fetched as hikes come into view")
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help="Simplification tolerance in meters (default: "
+                             f"{DEFAULT_TOLERANCE_M:g}), or the keep-every-Nth factor for "
+                             f"'decimate' (default: {DEFAULT_DECIMATION_FACTOR})")
+    parser.add_argument('--vector-tiles', action='store_true',
+                        help=f"Draw tracks from a PMTiles archive of vector tiles ({PMTILES_NAME} "
+                             "next to the map, read with HTTP range requests) instead of "
+                             "embedding them in the page")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.simplify == 'decimate':
+        if args.tolerance is None:
+            args.tolerance = DEFAULT_DECIMATION_FACTOR
+        elif args.tolerance < 1:
+            parser.error("--tolerance must be at least 1 with --simplify decimate")
+    elif args.tolerance is None:
+        args.tolerance = DEFAULT_TOLERANCE_M
+    
     # Set data directory
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_dir = os.path.dirname(script_dir)
@@ -468,7 +1452,10 @@ if __name__ == "__main__":
     print(f"Data directory: {data_dir}")
     
     # Create the interactive map
-    map_path = create_interactive_map(data_dir)
+    map_path = create_interactive_map(data_dir, use_cache=not args.no_cache, jobs=args.jobs,
+                                      simplify=args.simplify, tolerance=args.tolerance,
+                                      split_dir=args.split_output, markers=args.markers,
+                                      vector_tiles=args.vector_tiles, heatmap=args.heatmap)
     
     # Generate statistics
     stats = create_summary_stats(data_dir)
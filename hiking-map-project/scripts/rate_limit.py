@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Token-bucket rate limiting for the geocoding upstreams
+Each caller reserves the next free token and then sleeps until it is
+due, so one bucket can be shared by worker threads and the event loop
+alike. A 429/504 can pause the whole bucket (Retry-After): callers that
+wake up inside the pause, including those that reserved their token
+before it, give the token up and reserve a new one after the pause, so
+no request of that service goes out until it is over.
+"""
+
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """Allow rate requests per second on average, with bursts of up to capacity"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        # Time at which the bucket would be full again; tokens are spent
+        # by moving it forward 1/rate per request
+        self.full_at = time.monotonic()
+        # No token may be used before this time (see defer)
+        self.paused_until = self.full_at
+
+    def reserve(self):
+        """Take a token and return how many seconds to wait before using it"""
+        with self.lock:
+            now = time.monotonic()
+            self.full_at = max(self.full_at, now) + 1.0 / self.rate
+            return max(0.0, self.full_at - now - self.capacity / self.rate)
+
+    def defer(self, seconds):
+        """Let no request through for the next seconds (e.g. after a 429)
+
+        Tokens already reserved for a time inside the pause are void; their
+        holders reserve again once they wake up.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.full_at = max(self.full_at, self.paused_until +
+                               (self.capacity - 1) / self.rate)
+
+    def paused(self):
+        """True while a defer() is in effect"""
+        return time.monotonic() < self.paused_until
+
+    def wait(self):
+        """Block the calling thread until a token is available"""
+        while True:
+            delay = self.reserve()
+            if delay:
+                time.sleep(delay)
+            if not self.paused():
+                return
+
+    async def acquire(self):
+        """Wait for a token without blocking the event loop"""
+        while True:
+            delay = self.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            if not self.paused():
+                return
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Record/replay stand-in for the Overpass and Nominatim APIs
+In record mode, requests are forwarded to the real services and every
+response is saved to a JSON file. In replay mode, the saved responses are
+served without touching the network, so auto_name_hikes (and its geocode
+cache) can be exercised offline and repeatably.
+
+Usage:
+    python3 scripts/replay_server.py record recordings.json
+    python3 scripts/replay_server.py replay recordings.json
+
+Then, in another shell:
+    export OVERPASS_URL=http://127.0.0.1:8765/overpass
+    export NOMINATIM_URL=http://127.0.0.1:8765/nominatim
+    python3 scripts/auto_name_hikes.py
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+UPSTREAMS = {
+    '/overpass': 'https://overpass-api.de/api/interpreter',
+    '/nominatim': 'https://nominatim.openstreetmap.org/reverse',
+}
+USER_AGENT = 'tourwithmark-hiking-map/1.0 (contact via tourwithmark.com)'
+
+
+def request_key(method, path, query, body):
+    """Stable key for a request: method, path, sorted query and body digest"""
+    query = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    digest = hashlib.sha256(body).hexdigest()[:16] if body else ''
+    return f"{method} {path}?{query} {digest}"
+
+
+class Recordings:
+    """Responses keyed by request_key, persisted as JSON"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.responses = json.load(f)
+
+    def get(self, key):
+        return self.responses.get(key)
+
+    def put(self, key, status, body):
+        with self.lock:
+            self.responses[key] = {'status': status, 'body': body.decode('utf-8')}
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.responses, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def make_handler(recordings, record):
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self, method):
+            url = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            if url.path not in UPSTREAMS:
+                self._reply(404, b'{"error": "unknown service"}')
+                return
+            key = request_key(method, url.path, url.query, body)
+            saved = recordings.get(key)
+            if saved is None and record:
+                status, response = self._forward(method, url, body)
+                if status == 200:
+                    recordings.put(key, status, response)
+                self._reply(status, response)
+            elif saved is None:
+                self._reply(404, b'{"error": "no recorded response"}')
+            else:
+                self._reply(saved['status'], saved['body'].encode('utf-8'))
+
+        def _forward(self, method, url, body):
+            upstream = UPSTREAMS[url.path] + (f"?{url.query}" if url.query else '')
+            req = urllib.request.Request(upstream, data=body or None, method=method,
+                                         headers={'User-Agent': USER_AGENT})
+            try:
+                with urllib.request.urlopen(req, timeout=30) as r:
+                    return r.status, r.read()
+            except urllib.error.HTTPError as e:
+                return e.code, e.read()
+            except (urllib.error.URLError, OSError) as e:
+                # Upstream unreachable or timed out: answer like a gateway would
+                reason = getattr(e, 'reason', e)
+                return 502, json.dumps({'error': f"upstream unreachable: {reason}"}).encode()
+
+        def _reply(self, status, body):
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay stand-in for Overpass and Nominatim")
+    parser.add_argument('mode', choices=['record', 'replay'])
+    parser.add_argument('recordings', help="JSON file of recorded responses")
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port),
+                                 make_handler(Recordings(args.recordings), args.mode == 'record'))
+    print(f"{args.mode.capitalize()}ing on http://127.0.0.1:{args.port} "
+          f"({', '.join(UPSTREAMS)}) with {args.recordings}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
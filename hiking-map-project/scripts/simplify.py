@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Shape-preserving track simplification
+Ramer-Douglas-Peucker and Visvalingam-Whyatt, vectorized with NumPy, with
+tolerances in meters. Points are [lat, lon] lists as used by plot_hikes.
+"""
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+DEFAULT_DECIMATION_FACTOR = 10
+
+
+def to_local_meters(points):
+    """Project [lat, lon] points onto a local equirectangular plane in meters"""
+    coords = np.asarray(points, dtype=np.float64)
+    lat0 = np.radians(coords[:, 0].mean())
+    y = np.radians(coords[:, 0]) * EARTH_RADIUS_M
+    x = np.radians(coords[:, 1]) * EARTH_RADIUS_M * np.cos(lat0)
+    return np.column_stack((x, y))
+
+
+def _segment_distances(xy, a, b):
+    """Distance from each point in xy to the segment a-b"""
+    ab = b - a
+    length_sq = ab @ ab
+    if length_sq == 0.0:
+        return np.hypot(*(xy - a).T)
+    t = np.clip(((xy - a) @ ab) / length_sq, 0.0, 1.0)
+    proj = a + t[:, None] * ab
+    return np.hypot(*(xy - proj).T)
+
+
+def rdp_mask(xy, tolerance):
+    """Boolean mask of points kept by Ramer-Douglas-Peucker"""
+    n = len(xy)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dists = _segment_distances(xy[start + 1:end], xy[start], xy[end])
+        i = int(np.argmax(dists))
+        if dists[i] > tolerance:
+            split = start + 1 + i
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def _triangle_areas(xy):
+    """Area of the triangle each interior point forms with its neighbors"""
+    a, b, c = xy[:-2], xy[1:-1], xy[2:]
+    return 0.5 * np.abs((b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) -
+                        (c[:, 0] - a[:, 0]) * (b[:, 1] - a[:, 1]))
+
+
+def visvalingam_mask(xy, tolerance):
+    """Boolean mask of points kept by Visvalingam-Whyatt
+
+    Points whose effective triangle area is below tolerance**2 are removed.
+    Each pass drops every point that is both under the threshold and a local
+    minimum among its neighbors, then recomputes areas for the survivors, so
+    the work per pass is vectorized instead of one heap pop per point.
+    """
+    threshold = tolerance ** 2
+    idx = np.arange(len(xy))
+    while len(idx) > 2:
+        areas = _triangle_areas(xy[idx])
+        padded = np.concatenate(([np.inf], areas, [np.inf]))
+        # Strict on the left so a run of equal areas drops every other point
+        local_min = (areas < padded[:-2]) & (areas <= padded[2:])
+        drop = (areas < threshold) & local_min
+        if not drop.any():
+            break
+        keep = np.ones(len(idx), dtype=bool)
+        keep[1:-1] = ~drop
+        idx = idx[keep]
+    mask = np.zeros(len(xy), dtype=bool)
+    mask[idx] = True
+    return mask
+
+
+def decimate_mask(n, factor=DEFAULT_DECIMATION_FACTOR):
+    """Boolean mask keeping every Nth point plus both endpoints"""
+    if factor < 1:
+        raise ValueError(f"Decimation factor must be at least 1, got {factor}")
+    keep = np.zeros(n, dtype=bool)
+    keep[::factor] = True
+    keep[0] = keep[-1] = True
+    return keep
+
+
+SIMPLIFIERS = {
+    'rdp': rdp_mask,
+    'vw': visvalingam_mask,
+}
+
+
+def simplify_track(points, method='rdp', tolerance=5.0):
+    """Simplify a list of [lat, lon] points
+
+    method is one of SIMPLIFIERS or 'decimate' (tolerance is then the
+    keep-every-Nth factor). Returns a new list of [lat, lon] points, or an
+    (n, 2) array if points is a NumPy array.
+    """
+    if len(points) < 3:
+        mask = np.ones(len(points), dtype=bool)
+    elif method == 'decimate':
+        mask = decimate_mask(len(points), int(tolerance))
+    else:
+        try:
+            simplifier = SIMPLIFIERS[method]
+        except KeyError:
+            raise ValueError(f"Unknown simplification method: {method}")
+        mask = simplifier(to_local_meters(points), tolerance)
+    if isinstance(points, np.ndarray):
+        return points[mask]
+    return [p for p, kept in zip(points, mask) if kept]
+
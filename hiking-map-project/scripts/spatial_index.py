@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Static packed R-tree
+Bounding boxes are packed with Sort-Tile-Recursive (STR) into fixed-size
+nodes once, then queried level by level with NumPy. There are no inserts
+or deletes; rebuild the tree when the data changes.
+"""
+
+import numpy as np
+
+DEFAULT_NODE_SIZE = 16
+
+
+class STRTree:
+    """Packed R-tree over (n, 4) [min_x, min_y, max_x, max_y] boxes"""
+
+    def __init__(self, boxes, node_size=DEFAULT_NODE_SIZE):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        self.node_size = node_size
+        self.order = self._str_order(boxes, node_size)
+        # levels[0] holds the item boxes in packed order, each level above
+        # holds the bounds of node_size consecutive entries of the one below
+        self.levels = [boxes[self.order]]
+        while len(self.levels[-1]) > 1:
+            self.levels.append(self._parent_boxes(self.levels[-1], node_size))
+
+    def __len__(self):
+        return len(self.order)
+
+    @staticmethod
+    def _str_order(boxes, node_size):
+        """Item order that tiles boxes into vertical slices, sorted by y within each"""
+        n = len(boxes)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        centers_x = (boxes[:, 0] + boxes[:, 2]) / 2
+        centers_y = (boxes[:, 1] + boxes[:, 3]) / 2
+        leaf_count = -(-n // node_size)
+        slice_size = node_size * int(np.ceil(np.sqrt(leaf_count)))
+        by_x = np.argsort(centers_x, kind='stable')
+        slices = [by_x[i:i + slice_size] for i in range(0, n, slice_size)]
+        return np.concatenate([s[np.argsort(centers_y[s], kind='stable')] for s in slices])
+
+    @staticmethod
+    def _parent_boxes(boxes, node_size):
+        starts = np.arange(0, len(boxes), node_size)
+        return np.column_stack((np.minimum.reduceat(boxes[:, 0], starts),
+                                np.minimum.reduceat(boxes[:, 1], starts),
+                                np.maximum.reduceat(boxes[:, 2], starts),
+                                np.maximum.reduceat(boxes[:, 3], starts)))
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """Return the indices of the boxes that intersect the query box"""
+        if not len(self.order):
+            return np.empty(0, dtype=np.int64)
+        nodes = np.arange(len(self.levels[-1]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            b = self.levels[depth][nodes]
+            nodes = nodes[(b[:, 0] <= max_x) & (b[:, 2] >= min_x) &
+                          (b[:, 1] <= max_y) & (b[:, 3] >= min_y)]
+            if depth:
+                children = (nodes[:, None] * self.node_size + np.arange(self.node_size)).ravel()
+                nodes = children[children < len(self.levels[depth - 1])]
+        return self.order[nodes]
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Sync the hiking map links in blog posts with trail_names.csv
+Works out the link blocks every post should carry (none for posts no hike
+points at), compares them with the blog_links index, and rewrites only the
+posts that differ, reading and writing them on a thread pool. When nothing
+changed this is a CSV read plus a stat per post.
+
+Usage:
+    python3 scripts/sync_links.py               # apply
+    python3 scripts/sync_links.py --dry-run     # print a unified diff instead
+    python3 scripts/sync_links.py --remove      # take every link out
+"""
+
+import argparse
+import difflib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from blog_links import BLOG_INDEX, desired_links, index_posts, needs_update, set_links
+from hike_db import HikeDB, write_if_changed
+
+DEFAULT_JOBS = 8
+
+
+def plan_sync(posts, trails, remove=False):
+    """Return (changes, unresolved)
+
+    changes maps post keys to the blocks they should carry, for posts whose
+    current links differ; unresolved lists Blog_URLs with no post.
+    """
+    desired, unresolved = ({}, []) if remove else desired_links(trails)
+    unresolved += [key for key in desired if key not in posts]
+    changes = {}
+    for key, post in posts.items():
+        blocks = desired.get(key, [])
+        if needs_update(post, blocks):
+            changes[key] = blocks
+    return changes, unresolved
+
+
+def _render(post, blocks):
+    with open(post['path'], 'r', encoding='utf-8', newline='') as f:
+        content = f.read()
+    return content, set_links(content, blocks)
+
+
+def sync_links(base_dir, trails, index_path=None, remove=False, dry_run=False,
+               jobs=DEFAULT_JOBS):
+    """Bring every post's links in line with trails (rows of trail_names.csv)
+
+    Returns (changed, unresolved): the post keys that were (or, with
+    dry_run, would be) rewritten, and Blog_URLs that match no post. A dry
+    run writes the unified diff to stdout.
+    """
+    posts = index_posts(base_dir, index_path)
+    changes, unresolved = plan_sync(posts, trails, remove)
+    if not changes:
+        return [], unresolved
+
+    keys = sorted(changes)
+    with ThreadPoolExecutor(max_workers=min(jobs, len(keys))) as pool:
+        edits = list(pool.map(lambda key: _render(posts[key], changes[key]), keys))
+        if dry_run:
+            for key, (old, new) in zip(keys, edits):
+                path = os.path.relpath(posts[key]['path'], base_dir)
+                sys.stdout.writelines(difflib.unified_diff(
+                    old.splitlines(keepends=True), new.splitlines(keepends=True),
+                    fromfile=f"a/{path}", tofile=f"b/{path}"))
+            return keys, unresolved
+        written = list(pool.map(lambda key, edit: write_if_changed(posts[key]['path'], edit[1]),
+                                keys, edits))
+
+    if index_path:
+        index_posts(base_dir, index_path)
+    return [key for key, w in zip(keys, written) if w], unresolved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync hiking map links in blog posts "
+                                                 "with trail_names.csv")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Print a unified diff of the changes instead of writing them")
+    parser.add_argument('--remove', action='store_true',
+                        help="Remove every hiking map link")
+    parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS, metavar='N',
+                        help=f"Threads used to read and write posts (default: {DEFAULT_JOBS})")
+    args = parser.parse_args(argv)
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    hiking_project_dir = os.path.dirname(script_dir)
+    project_dir = os.path.dirname(hiking_project_dir)  # tourwithmark_2025
+    data_dir = os.path.join(hiking_project_dir, 'data')
+
+    start = time.perf_counter()
+    db = HikeDB(data_dir)
+    trails = db.trails()
+    db.close()
+    changed, unresolved = sync_links(project_dir, trails, os.path.join(data_dir, BLOG_INDEX),
+                                     remove=args.remove, dry_run=args.dry_run, jobs=args.jobs)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    for blog_url in unresolved:
+        print(f"Could not find .qmd for: {blog_url}", file=sys.stderr)
+    verb = "Would update" if args.dry_run else "Updated"
+    for key in changed:
+        print(f"{verb} {key}/index.qmd", file=sys.stderr if args.dry_run else sys.stdout)
+    if not changed:
+        print(f"Blog links up to date ({elapsed_ms:.0f} ms)")
+    return changed
+
+
+if __name__ == "__main__":
+    main()
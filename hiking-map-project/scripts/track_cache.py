@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+On-disk cache of decoded GPS tracks
+Entries are keyed by the content hash of the source file plus the parser
+version and decimation settings, so edits to trail_names.csv never force a
+re-parse of unchanged GPX/FIT files.
+"""
+
+import hashlib
+import json
+import os
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 MB
+
+
+def hash_file(filepath, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class TrackCache:
+    """Size-bounded, least-recently-used cache of decoded track points"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def key_for(self, filepath, parser_version, settings, file_hash=None):
+        """Build a cache key from file content, parser version and settings"""
+        material = json.dumps({
+            'file': file_hash or hash_file(filepath),
+            'parser': parser_version,
+            'settings': settings,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def get(self, key):
+        """Return cached points for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                points = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path, None)
+        self.hits += 1
+        return points
+
+    def put(self, key, points):
+        """Store points under key, evicting old entries if over budget"""
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(points, f, separators=(',', ':'))
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        self._total_bytes += os.path.getsize(path) - old_size
+        if self._total_bytes > self.max_bytes:
+            self._evict()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size_bytes': self._total_bytes,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _entries(self):
+        """Yield (path, size, last_used) for every cache entry"""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith('.json'):
+                st = entry.stat()
+                yield entry.path, st.st_size, st.st_mtime
+
+    def _evict(self):
+        """Drop least recently used entries until under the size budget"""
+        for path, size, _ in sorted(self._entries(), key=lambda e: e[2]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._total_bytes -= size
+            self.evictions += 1
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Columnar store of decoded GPS tracks
+Each activity's GPX/FIT file is decoded once into typed columns (lat, lon,
+elevation, time, heart rate). Columns are .npy files opened as
+numpy.memmap, and an offsets index maps every activity to its row range,
+so reading a track is a slice of the mapped file rather than a re-parse.
+
+Usage:
+    python3 scripts/track_store.py              # ingest new/changed activities
+    python3 scripts/track_store.py --rebuild    # re-decode everything
+"""
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import gpxpy
+import numpy as np
+
+from fit_decoder import SEMICIRCLES_TO_DEGREES, decode_fit
+from hike_db import export_pending
+from track_cache import hash_file
+
+# Bump when decoding changes, so every activity is re-ingested
+STORE_VERSION = 1
+
+# column -> dtype; missing values are NaN for elevation and 0 otherwise
+COLUMNS = {
+    'lat': np.float64,        # degrees
+    'lon': np.float64,        # degrees
+    'elevation': np.float32,  # meters
+    'time': np.int64,         # Unix seconds
+    'heart_rate': np.uint8,   # bpm
+}
+
+
+def decode_activity(filepath):
+    """Decode a GPX or FIT/FIT.gz file into column arrays (safe to run in a worker process)
+
+    Returns (columns, segments) where segments lists the row offsets at
+    which a new GPX track segment starts (empty for a single segment).
+    """
+    if filepath.endswith('.gpx'):
+        return _decode_gpx(filepath)
+    if filepath.endswith('.fit.gz') or filepath.endswith('.fit'):
+        track = decode_fit(filepath)
+        columns = {
+            'lat': np.array(track['lat'], dtype=np.float64) * SEMICIRCLES_TO_DEGREES,
+            'lon': np.array(track['lon'], dtype=np.float64) * SEMICIRCLES_TO_DEGREES,
+            'elevation': np.array(track['altitude'], dtype=np.float32),
+            'time': np.array(track['time'], dtype=np.int64),
+            'heart_rate': np.array(track['heart_rate'], dtype=np.uint8),
+        }
+        return columns, []
+    raise ValueError(f"Unsupported track file: {filepath}")
+
+
+def _gpx_heart_rate(point):
+    """Heart rate from a Garmin TrackPointExtension, 0 if absent"""
+    for extension in point.extensions:
+        for element in extension.iter():
+            if element.tag.rsplit('}', 1)[-1] == 'hr' and element.text:
+                return int(float(element.text))
+    return 0
+
+
+def _decode_gpx(filepath):
+    """Decode a GPX file, keeping every track segment"""
+    with open(filepath, 'r') as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    rows = []
+    segments = []
+    for track in gpx.tracks:
+        for segment in track.segments:
+            if not segment.points:
+                continue
+            if rows:
+                segments.append(len(rows))
+            for point in segment.points:
+                rows.append((point.latitude, point.longitude,
+                             point.elevation if point.elevation is not None else np.nan,
+                             int(point.time.timestamp()) if point.time else 0,
+                             _gpx_heart_rate(point)))
+    columns = {name: np.array([row[i] for row in rows], dtype=dtype)
+               for i, (name, dtype) in enumerate(COLUMNS.items())}
+    return columns, segments
+
+
+class TrackStore:
+    """Memory-mapped columns of every ingested activity plus an offsets index
+
+    The index (index.json) maps activity ID -> {'file', 'stamp', 'hash',
+    'start', 'count', 'segments'}. Column files are written as
+    <column>.<generation>.npy and the index is swapped in last, so readers
+    never see a half-written store.
+    """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, 'index.json')
+        self.generation = 0
+        self.activities = {}
+        self._columns = None
+        os.makedirs(store_dir, exist_ok=True)
+        try:
+            with open(self.index_path, 'r') as f:
+                data = json.load(f)
+            if data.get('version') == STORE_VERSION:
+                self.generation = data['generation']
+                self.activities = data['activities']
+        except (OSError, ValueError):
+            pass
+
+    def __contains__(self, activity_id):
+        return activity_id in self.activities
+
+    def __len__(self):
+        return len(self.activities)
+
+    def columns(self):
+        """Return {column: memmap} for the whole store, opening it on first use"""
+        if self._columns is None:
+            self._columns = {}
+            for name, dtype in COLUMNS.items():
+                path = self._column_path(name, self.generation)
+                if os.path.exists(path):
+                    self._columns[name] = np.load(path, mmap_mode='r')
+                else:
+                    self._columns[name] = np.empty(0, dtype=dtype)
+        return self._columns
+
+    def track(self, activity_id):
+        """Return {column: array view} for one activity, or None if not stored"""
+        entry = self.activities.get(activity_id)
+        if entry is None:
+            return None
+        start, end = entry['start'], entry['start'] + entry['count']
+        return {name: column[start:end] for name, column in self.columns().items()}
+
+    def positions(self, activity_id):
+        """Return a list of (n, 2) [lat, lon] arrays, one per track segment"""
+        track = self.track(activity_id)
+        if track is None:
+            return None
+        latlon = np.column_stack((track['lat'], track['lon']))
+        segments = [s for s in np.split(latlon, self.activities[activity_id]['segments'])
+                    if len(s)]
+        return segments
+
+    def source_hash(self, activity_id):
+        """Content hash of the file an activity was ingested from"""
+        entry = self.activities.get(activity_id)
+        return entry['hash'] if entry else None
+
+    def ingest(self, files, jobs=None, rebuild=False):
+        """Bring the store up to date with {activity_id: filepath}
+
+        Only files whose size/mtime and then content hash changed are
+        decoded; activities not in files are dropped. Files that fail to
+        decode are left out, along with any entry from before they
+        changed, and retried on the next ingest. Returns
+        (decoded, failed, removed) counts.
+        """
+        kept = {}
+        pending = {}
+        stamps_changed = False
+        for activity_id, filepath in files.items():
+            st = os.stat(filepath)
+            stamp = [st.st_size, st.st_mtime_ns]
+            entry = self.activities.get(activity_id)
+            if not rebuild and entry and entry['file'] == filepath and entry['stamp'] == stamp:
+                kept[activity_id] = entry
+                continue
+            file_hash = hash_file(filepath)
+            if not rebuild and entry and entry['hash'] == file_hash:
+                kept[activity_id] = dict(entry, file=filepath, stamp=stamp)
+                stamps_changed = True
+                continue
+            pending[activity_id] = (filepath, stamp, file_hash)
+        removed = len(set(self.activities) - set(files))
+
+        decoded = _decode_all({aid: filepath for aid, (filepath, _, _) in pending.items()}, jobs)
+        failed = len(pending) - len(decoded)
+        # A changed file that no longer decodes must not keep its old entry
+        stale = any(activity_id in self.activities
+                    for activity_id in pending if activity_id not in decoded)
+
+        if not decoded and not removed and not stale:
+            if stamps_changed:
+                self.activities.update(kept)
+                self._save_index()
+            return 0, failed, 0
+
+        # Write the next generation: kept rows copied from the current
+        # columns, decoded rows appended, in the order of files
+        old_columns = self.columns()
+        generation = self.generation + 1
+        activities = {}
+        parts = {name: [] for name in COLUMNS}
+        offset = 0
+        for activity_id in files:
+            if activity_id in kept:
+                entry = kept[activity_id]
+                start = entry['start']
+                for name in COLUMNS:
+                    parts[name].append(old_columns[name][start:start + entry['count']])
+                segments = entry['segments']
+                count = entry['count']
+            elif activity_id in decoded:
+                columns, segments = decoded[activity_id]
+                for name in COLUMNS:
+                    parts[name].append(columns[name])
+                count = len(columns['lat'])
+                filepath, stamp, file_hash = pending[activity_id]
+                entry = {'file': filepath, 'stamp': stamp, 'hash': file_hash}
+            else:
+                continue
+            activities[activity_id] = dict(entry, start=offset, count=count, segments=segments)
+            offset += count
+
+        for name, dtype in COLUMNS.items():
+            data = np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=dtype)
+            tmp_path = self._column_path(name, generation) + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.save(f, data.astype(dtype, copy=False))
+            os.replace(tmp_path, self._column_path(name, generation))
+
+        old_generation = self.generation
+        self._columns = None
+        self.generation = generation
+        self.activities = activities
+        self._save_index()
+        for name in COLUMNS:
+            try:
+                os.remove(self._column_path(name, old_generation))
+            except OSError:
+                pass
+        return len(decoded), failed, removed
+
+    def _column_path(self, name, generation):
+        return os.path.join(self.store_dir, f"{name}.{generation}.npy")
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': STORE_VERSION, 'generation': self.generation,
+                       'activities': self.activities}, f, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+
+def _decode_all(files, jobs=None):
+    """Decode {activity_id: filepath}, in parallel when jobs != 1
+
+    Returns {activity_id: (columns, segments)} for the files that decoded.
+    """
+    decoded = {}
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(files) <= 1:
+        for activity_id, filepath in files.items():
+            try:
+                decoded[activity_id] = decode_activity(filepath)
+            except Exception as e:
+                print(f"Error decoding {filepath}: {e}")
+        return decoded
+
+    with ProcessPoolExecutor(max_workers=min(jobs, len(files))) as pool:
+        futures = {pool.submit(decode_activity, filepath): activity_id
+                   for activity_id, filepath in files.items()}
+        for future in as_completed(futures):
+            activity_id = futures[future]
+            try:
+                decoded[activity_id] = future.result()
+            except Exception as e:
+                print(f"Error decoding {files[activity_id]}: {e}")
+    return decoded
+
+
+def activity_files(data_dir):
+    """Return {activity_id: filepath} for activities in hiking_activities.csv with a GPS file"""
+    activities_dir = os.path.join(data_dir, 'activities')
+    files = {}
+    export_pending(data_dir)
+    with open(os.path.join(data_dir, 'hiking_activities.csv'), 'r', newline='') as f:
+        for row in csv.DictReader(f):
+            if not row['Filename']:
+                continue
+            filepath = os.path.join(activities_dir, os.path.basename(row['Filename']))
+            if os.path.exists(filepath):
+                files[row['Activity ID']] = filepath
+    return files
+
+
+def open_store(data_dir, jobs=None, rebuild=False):
+    """Open data_dir's track store, ingesting new or changed activities first"""
+    store = TrackStore(os.path.join(data_dir, '.track_store'))
+    decoded, failed, removed = store.ingest(activity_files(data_dir), jobs, rebuild)
+    if decoded or failed or removed:
+        print(f"Track store: {decoded} decoded, {failed} failed, {removed} removed "
+              f"({len(store)} activities)")
+    return store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode GPS files into the columnar track store")
+    parser.add_argument('--jobs', type=int, default=None, metavar='N',
+                        help="Processes used to decode files (default: all cores)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Re-decode every activity instead of only new or changed ones")
+    args = parser.parse_args()
+    if args.jobs is not None and args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    data_dir = os.path.join(os.path.dirname(script_dir), 'data')
+
+    store = open_store(data_dir, args.jobs, args.rebuild)
+    rows = len(store.columns()['lat'])
+    print(f"Track store: {len(store)} activities, {rows} points in {store.store_dir}")
@@ -6,13 +6,13 @@ This script extracts new hiking activities and regenerates the map
 
 import os
 import sys
-import csv
-import shutil
 from datetime import datetime
 
 # Add parent directory to path to import plot_hikes
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import plot_hikes
+from hike_db import HikeDB
+from ingest_export import ingest_export, print_counts
 
 
 def update_hiking_data():
@@ -28,7 +28,6 @@ def update_hiking_data():
     strava_dir = '/Users/markgingrass/Downloads/strava-data'
     project_dir = os.path.join(strava_dir, 'hiking-map-project')
     data_dir = os.path.join(project_dir, 'data')
-    activities_dir = os.path.join(data_dir, 'activities')
     
     # Source files
     source_csv = os.path.join(strava_dir, 'activities.csv')
@@ -39,67 +38,20 @@ def update_hiking_data():
         print("Please ensure your Strava export is in the correct location")
         return False
     
-    # Backup existing data
-    backup_dir = os.path.join(project_dir, f'backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}')
-    if os.path.exists(os.path.join(data_dir, 'hiking_activities.csv')):
-        print(f"Creating backup in {backup_dir}")
-        shutil.copytree(data_dir, backup_dir)
-        print("Backup created successfully")
-    
-    # Clear existing activity files
-    if os.path.exists(activities_dir):
-        shutil.rmtree(activities_dir)
-    os.makedirs(activities_dir, exist_ok=True)
-    
-    # Extract hiking activities
-    print("\nExtracting hiking activities from Strava data...")
-    
-    hiking_count = 0
-    total_count = 0
-    hiking_rows = []
-    
-    with open(source_csv, 'r') as f:
-        reader = csv.reader(f)
-        header = next(reader)
-        
-        for row in reader:
-            total_count += 1
-            if len(row) > 3 and 'hike' in row[3].lower():
-                hiking_rows.append(row)
-                hiking_count += 1
-    
-    print(f"Found {hiking_count} hiking activities out of {total_count} total activities")
-    
-    # Write new hiking CSV
+    # Count the hikes we had before, to report what changed
     hiking_csv = os.path.join(data_dir, 'hiking_activities.csv')
-    with open(hiking_csv, 'w', newline='') as f:
-        writer = csv.writer(f)
-        writer.writerow(header)
-        writer.writerows(hiking_rows)
-    
-    print(f"Wrote {hiking_count} hiking activities to CSV")
-    
-    # Copy activity files
-    print("\nCopying activity files...")
-    copied = 0
-    missing = 0
-    
-    for row in hiking_rows:
-        if len(row) > 12 and row[12]:  # Filename column
-            filename = row[12]
-            source_path = os.path.join(strava_dir, filename)
-            
-            if os.path.exists(source_path):
-                dest_path = os.path.join(activities_dir, os.path.basename(filename))
-                shutil.copy2(source_path, dest_path)
-                copied += 1
-            else:
-                missing += 1
-                print(f"  Warning: Could not find {filename}")
-    
-    print(f"Copied {copied} activity files")
-    if missing > 0:
-        print(f"Missing {missing} files (this is normal for very old activities)")
+    old_count = None
+    if os.path.exists(hiking_csv):
+        db = HikeDB(data_dir)
+        old_count = len(db.activities())
+        db.close()
+    
+    # Stream the hikes out of activities.csv and link in their GPS files;
+    # files already ingested from this export are only stat'ed
+    print("\nIngesting hiking activities from Strava data...")
+    counts = ingest_export(strava_dir, data_dir)
+    hiking_count = counts['hikes']
+    print_counts(counts)
     
     # Regenerate the map
     print("\n" + "=" * 60)
@@ -109,12 +61,8 @@ def update_hiking_data():
     map_path = plot_hikes.create_interactive_map(data_dir)
     stats = plot_hikes.create_summary_stats(data_dir)
     
-    # Compare with backup if it exists
-    if os.path.exists(backup_dir):
-        old_csv = os.path.join(backup_dir, 'hiking_activities.csv')
-        with open(old_csv, 'r') as f:
-            old_count = sum(1 for line in f) - 1  # Subtract header
-        
+    # Compare with the previous hike count
+    if old_count is not None:
         new_hikes = hiking_count - old_count
         if new_hikes > 0:
             print(f"\n🎉 Added {new_hikes} new hikes to your map!")
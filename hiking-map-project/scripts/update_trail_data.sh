@@ -17,9 +17,9 @@ echo "Step 1: Regenerating hiking map..."
 python3 "$SCRIPT_DIR/plot_hikes.py"
 echo ""
 
-# Step 2: Add hiking map links to blog posts
-echo "Step 2: Adding hiking map links to blog posts..."
-python3 "$SCRIPT_DIR/add_hiking_map_links.py"
+# Step 2: Sync hiking map links in blog posts (only changed posts are rewritten)
+echo "Step 2: Syncing hiking map links in blog posts..."
+python3 "$SCRIPT_DIR/sync_links.py"
 echo ""
 
 # Step 3: Show git status
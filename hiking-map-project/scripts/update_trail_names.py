@@ -3,23 +3,20 @@
 Helper script to update trail names in the mapping file
 """
 
-import csv
 import os
 import sys
 
+from hike_db import HikeDB, export_pending
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
 def list_unmapped_trails():
     """List all trails that don't have proper names yet"""
     
-    # Path to trail names file
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_dir = os.path.dirname(script_dir)
-    trail_names_path = os.path.join(project_dir, 'data', 'trail_names.csv')
-    
     # Read current mappings
-    trails = []
-    with open(trail_names_path, 'r') as f:
-        reader = csv.DictReader(f)
-        trails = list(reader)
+    db = HikeDB(DATA_DIR)
+    trails = db.trails()
+    db.close()
     
     # Count statistics
     total = len(trails)
@@ -44,44 +41,25 @@ def list_unmapped_trails():
 def update_trail_name(hike_number, trail_name, location='', notes='', blog_url=''):
     """Update the trail name for a specific hike number"""
     
-    # Path to trail names file
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    project_dir = os.path.dirname(script_dir)
-    trail_names_path = os.path.join(project_dir, 'data', 'trail_names.csv')
-    
-    # Read current mappings
-    trails = []
-    with open(trail_names_path, 'r') as f:
-        reader = csv.DictReader(f)
-        trails = list(reader)
+    fields = {'Trail_Name': trail_name}
+    if location:
+        fields['Location'] = location
+    if notes:
+        fields['Notes'] = notes
+    if blog_url:
+        fields['Blog_URL'] = blog_url
     
-    # Find and update the trail
-    updated = False
-    for trail in trails:
-        if trail['Hike_Number'] == str(hike_number):
-            trail['Trail_Name'] = trail_name
-            if location:
-                trail['Location'] = location
-            if notes:
-                trail['Notes'] = notes
-            if blog_url:
-                trail['Blog_URL'] = blog_url
-            updated = True
-            print(f"Updated #{hike_number}: {trail_name}")
-            break
+    # Update the one row in the database; trail_names.csv is written once,
+    # when the command exits
+    db = HikeDB(DATA_DIR)
+    updated = db.update_trail(hike_number, **fields)
+    db.close()
     
     if not updated:
         print(f"Error: Hike #{hike_number} not found")
         return False
     
-    # Write back to file
-    with open(trail_names_path, 'w', newline='') as f:
-        fieldnames = ['Hike_Number', 'Activity_ID', 'Date', 'Original_Name', 
-                      'Trail_Name', 'Distance_km', 'Location', 'Notes', 'Blog_URL']
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(trails)
-    
+    print(f"Updated #{hike_number}: {trail_name}")
     return True
 
 def interactive_mode():
@@ -175,4 +153,8 @@ def main():
         print('  python update_trail_names.py 12 "Paris Mountain" "Greenville, SC" "Great views!"')
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    finally:
+        # However many hikes were updated, write trail_names.csv once
+        export_pending(DATA_DIR)
\ No newline at end of file
@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Vector tile (MVT in a PMTiles archive) export of all hiking tracks
+Every stored track is projected to Web Mercator tile coordinates and
+simplified per zoom (half a screen pixel at that zoom), cut into Mapbox
+Vector Tiles from MIN_ZOOM to MAX_ZOOM and written to one PMTiles v3
+archive. A static host can serve the archive as is: the map page reads the
+header, directories and tiles it needs with HTTP range requests.
+
+Tracks are tiled in parallel, one hike per task, and tiles are encoded
+and gzipped in parallel. Features carry the hike's number, name and
+color, and their id is the hike's position in the page's `hikes` array.
+The archive's metadata records a hash of its inputs, so an unchanged set
+of hikes is not re-tiled. The protobuf and PMTiles encodings are written
+out here to avoid extra dependencies.
+"""
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from build_manifest import hash_fields
+from simplify import rdp_mask
+
+# Bump when tiling changes what ends up in the archive, so it is rebuilt
+TILES_VERSION = 1
+
+MIN_ZOOM = 5
+MAX_ZOOM = 16
+EXTENT = 4096            # Tile coordinate units per tile side
+BUFFER = 64              # Units of track kept beyond each tile edge
+TOLERANCE_PX = 0.5       # Per-zoom simplification tolerance in screen pixels
+TILE_SIZE_PX = 256
+LAYER_NAME = 'tracks'
+PMTILES_NAME = 'tracks.pmtiles'
+
+# PMTiles v3 constants
+HEADER_SIZE = 127
+ROOT_DIR_MAX = 16384 - HEADER_SIZE
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+TILE_TYPE_MVT = 1
+
+# MVT geometry commands
+MOVE_TO = 1
+LINE_TO = 2
+GEOM_LINESTRING = 2
+
+
+# -- Protobuf ------------------------------------------------------------------
+
+def _varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _field_bytes(number, payload):
+    """A length-delimited field (wire type 2)"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _field_varint(number, value):
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(values):
+    return b''.join(_varint(v) for v in values)
+
+
+# -- Tiling ----------------------------------------------------------------------
+
+def project(points, zoom):
+    """[lat, lon] points -> Web Mercator coordinates in tile units at zoom"""
+    points = np.asarray(points, dtype=np.float64)
+    scale = EXTENT * 2.0 ** zoom
+    lat = np.radians(np.clip(points[:, 0], -85.0511, 85.0511))
+    x = (points[:, 1] + 180.0) / 360.0 * scale
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / math.pi) / 2.0 * scale
+    return np.column_stack((x, y))
+
+
+def zoom_levels(segments, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """Return {zoom: [integer (n, 2) tile-unit arrays]} for a track's segments
+
+    Each zoom is simplified from the next finer one, with a tolerance of
+    TOLERANCE_PX screen pixels; points that round to the same unit are merged.
+    """
+    tolerance = TOLERANCE_PX * EXTENT / TILE_SIZE_PX
+    levels = {}
+    lines = [project(segment, max_zoom) for segment in segments if len(segment)]
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        if zoom < max_zoom:
+            lines = [line / 2.0 for line in lines]
+        lines = [line[rdp_mask(line, tolerance)] if len(line) > 2 else line for line in lines]
+        rounded = []
+        for line in lines:
+            q = np.round(line).astype(np.int64)
+            q = q[np.r_[True, np.any(np.diff(q, axis=0) != 0, axis=1)]]
+            rounded.append(q)
+        levels[zoom] = rounded
+    return levels
+
+
+def _line_commands(runs, origin):
+    """MVT geometry commands for line runs (integer world units) in a tile"""
+    commands = []
+    cx = cy = 0
+    for run in runs:
+        local = run - origin
+        commands.append(MOVE_TO | 1 << 3)
+        x, y = (int(v) for v in local[0])
+        commands += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        commands.append(LINE_TO | (len(local) - 1) << 3)
+        for x, y in local[1:].tolist():
+            commands += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return commands
+
+
+def tile_track(segments, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """Return {(z, x, y): packed geometry bytes} for one track (safe to run in a worker)
+
+    A tile gets every line segment whose bounding box, grown by BUFFER,
+    touches it; consecutive segments form one run of the feature's
+    multi-linestring.
+    """
+    tiles = {}
+    for zoom, lines in zoom_levels(segments, min_zoom, max_zoom).items():
+        runs = {}
+        for line in lines:
+            if len(line) < 2:
+                continue
+            a, b = line[:-1], line[1:]
+            lo = (np.minimum(a, b) - BUFFER) // EXTENT
+            hi = (np.maximum(a, b) + BUFFER) // EXTENT
+            # Most segments touch one tile; expand the others over their range
+            pairs = []
+            for i in range(len(a)):
+                for tx in range(lo[i, 0], hi[i, 0] + 1):
+                    for ty in range(lo[i, 1], hi[i, 1] + 1):
+                        pairs.append((tx, ty, i))
+            pairs.sort()
+            start = 0
+            for k in range(1, len(pairs) + 1):
+                if (k == len(pairs) or pairs[k][:2] != pairs[k - 1][:2]
+                        or pairs[k][2] != pairs[k - 1][2] + 1):
+                    tx, ty = pairs[start][:2]
+                    first, last = pairs[start][2], pairs[k - 1][2]
+                    runs.setdefault((tx, ty), []).append(line[first:last + 2])
+                    start = k
+        limit = 1 << zoom
+        for (tx, ty), tile_runs in runs.items():
+            if 0 <= tx < limit and 0 <= ty < limit:
+                origin = np.array([tx * EXTENT, ty * EXTENT])
+                tiles[(zoom, tx, ty)] = _packed(_line_commands(tile_runs, origin))
+    return tiles
+
+
+def encode_tile(features):
+    """Gzipped MVT for [(feature id, {attribute: str}, packed geometry)]"""
+    keys, values, encoded = {}, {}, []
+    for feature_id, attributes, geometry in features:
+        tags = []
+        for key, value in attributes.items():
+            if value in ('', None):
+                continue
+            tags += [keys.setdefault(key, len(keys)), values.setdefault(str(value), len(values))]
+        encoded.append(_field_varint(1, feature_id) +
+                       _field_bytes(2, _packed(tags)) +
+                       _field_varint(3, GEOM_LINESTRING) +
+                       _field_bytes(4, geometry))
+    layer = (_field_varint(15, 2) + _field_bytes(1, LAYER_NAME.encode()) +
+             b''.join(_field_bytes(2, f) for f in encoded) +
+             b''.join(_field_bytes(3, k.encode()) for k in keys) +
+             b''.join(_field_bytes(4, _field_bytes(1, v.encode())) for v in values) +
+             _field_varint(5, EXTENT))
+    return gzip.compress(_field_bytes(3, layer), compresslevel=6, mtime=0)
+
+
+def _encode_tiles(batch):
+    return [(tile_id, encode_tile(features)) for tile_id, features in batch]
+
+
+# -- PMTiles -------------------------------------------------------------------
+
+def zxy_to_tile_id(z, x, y):
+    """PMTiles tile ID: tiles of lower zooms first, then the Hilbert index"""
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    s = 1 << z >> 1
+    while s:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x, y = s - 1 - x, s - 1 - y
+            x, y = y, x
+        x &= s - 1
+        y &= s - 1
+        s >>= 1
+    return tile_id
+
+
+def _serialize_directory(entries):
+    """Entries are [tile_id, offset, length, run_length], sorted by tile_id"""
+    out = [_varint(len(entries))]
+    last_id = 0
+    for entry in entries:
+        out.append(_varint(entry[0] - last_id))
+        last_id = entry[0]
+    out += [_varint(entry[3]) for entry in entries]
+    out += [_varint(entry[2]) for entry in entries]
+    for i, entry in enumerate(entries):
+        prev = entries[i - 1] if i else None
+        contiguous = prev is not None and entry[1] == prev[1] + prev[2]
+        out.append(_varint(0 if contiguous else entry[1] + 1))
+    return b''.join(out)
+
+
+def _directories(entries):
+    """Return (root directory, leaf directories), splitting into leaves if needed"""
+    root = _serialize_directory(entries)
+    if len(root) <= ROOT_DIR_MAX:
+        return root, b''
+    leaf_size = 4096
+    while True:
+        leaves = bytearray()
+        root_entries = []
+        for i in range(0, len(entries), leaf_size):
+            leaf = _serialize_directory(entries[i:i + leaf_size])
+            # run_length 0 marks a pointer to a leaf directory
+            root_entries.append([entries[i][0], len(leaves), len(leaf), 0])
+            leaves += leaf
+        root = _serialize_directory(root_entries)
+        if len(root) <= ROOT_DIR_MAX:
+            return root, bytes(leaves)
+        leaf_size *= 2
+
+
+def read_metadata(path):
+    """The metadata JSON of a PMTiles archive, or None if it can't be read"""
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE or header[:7] != b'PMTiles':
+                return None
+            offset, length = struct.unpack_from('<QQ', header, 24)
+            f.seek(offset)
+            return json.loads(f.read(length))
+    except (OSError, ValueError):
+        return None
+
+
+def write_pmtiles(path, tiles, bounds, metadata, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+    """Write {tile_id: gzipped MVT bytes} as a clustered PMTiles v3 archive
+
+    bounds are [[south, west], [north, east]]. Identical tiles are stored
+    once, and runs of them share one directory entry.
+    """
+    entries = []
+    data = bytearray()
+    stored = {}
+    for tile_id in sorted(tiles):
+        blob = tiles[tile_id]
+        digest = hashlib.sha256(blob).digest()
+        if digest not in stored:
+            stored[digest] = (len(data), len(blob))
+            data += blob
+        offset, length = stored[digest]
+        last = entries[-1] if entries else None
+        if last and last[1] == offset and last[0] + last[3] == tile_id:
+            last[3] += 1
+        else:
+            entries.append([tile_id, offset, length, 1])
+
+    root, leaves = _directories(entries)
+    meta = json.dumps(metadata, separators=(',', ':')).encode()
+    root_offset = HEADER_SIZE
+    meta_offset = root_offset + len(root)
+    leaves_offset = meta_offset + len(meta)
+    data_offset = leaves_offset + len(leaves)
+
+    (south, west), (north, east) = bounds
+    center_zoom = (min_zoom + max_zoom) // 2
+    header = b'PMTiles' + struct.pack(
+        '<B11QBBBBBBiiiiBii', 3,
+        root_offset, len(root), meta_offset, len(meta), leaves_offset, len(leaves),
+        data_offset, len(data), len(tiles), len(entries), len(stored),
+        1, COMPRESSION_NONE, COMPRESSION_GZIP, TILE_TYPE_MVT, min_zoom, max_zoom,
+        round(west * 1e7), round(south * 1e7), round(east * 1e7), round(north * 1e7),
+        center_zoom, round((west + east) / 2 * 1e7), round((south + north) / 2 * 1e7))
+    assert len(header) == HEADER_SIZE
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for part in (header, root, meta, leaves, data):
+            f.write(part)
+    os.replace(tmp_path, path)
+    return {'tiles': len(tiles), 'entries': len(entries), 'contents': len(stored),
+            'bytes': data_offset + len(data)}
+
+
+# -- Build -----------------------------------------------------------------------
+
+def build_pmtiles(path, store, hikes, jobs=None):
+    """Tile the stored tracks of hikes into a PMTiles archive at path
+
+    hikes are dicts with 'activity_id', 'number', 'name' and 'color', in
+    page order. Returns the counts from write_pmtiles, or None when the
+    archive was already built from the same hikes.
+    """
+    build = hash_fields({
+        'version': TILES_VERSION,
+        'zooms': [MIN_ZOOM, MAX_ZOOM],
+        'hikes': [dict(hike, source=store.source_hash(hike['activity_id'])) for hike in hikes],
+    })
+    existing = read_metadata(path)
+    if existing and existing.get('build') == build:
+        return None
+
+    jobs = jobs or os.cpu_count() or 1
+    features = {}
+    bounds = [[90.0, 180.0], [-90.0, -180.0]]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        tracks = [store.positions(hike['activity_id']) or [] for hike in hikes]
+        for track in tracks:
+            for segment in track:
+                bounds[0] = np.minimum(bounds[0], segment.min(axis=0)).tolist()
+                bounds[1] = np.maximum(bounds[1], segment.max(axis=0)).tolist()
+        for position, (hike, tiles) in enumerate(zip(hikes, pool.map(tile_track, tracks))):
+            attributes = {'number': hike['number'], 'name': hike['name'], 'color': hike['color']}
+            for (z, x, y), geometry in tiles.items():
+                features.setdefault(zxy_to_tile_id(z, x, y), []).append(
+                    (position, attributes, geometry))
+
+        # Encode and compress tiles in batches, similar amounts of work per task
+        items = sorted(features.items())
+        batch_size = max(1, -(-len(items) // (jobs * 4)))
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        tiles = dict(pair for batch in pool.map(_encode_tiles, batches) for pair in batch)
+
+    metadata = {
+        'name': 'hiking tracks',
+        'build': build,
+        'format': 'pbf',
+        'minzoom': MIN_ZOOM,
+        'maxzoom': MAX_ZOOM,
+        'vector_layers': [{'id': LAYER_NAME, 'minzoom': MIN_ZOOM, 'maxzoom': MAX_ZOOM,
+                           'fields': {'number': 'String', 'name': 'String', 'color': 'String'}}],
+    }
+    return write_pmtiles(path, tiles, bounds, metadata)
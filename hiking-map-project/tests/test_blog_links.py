@@ -0,0 +1,18 @@
+"""Legacy hiking map link blocks are removed, the author's own callouts are not"""
+
+from blog_links import create_hiking_map_link, find_links, strip_links
+
+CALLOUT = ('<div style="background-color: #f0f8ff; padding: 10px;">\n'
+           'Trail closed in winter, see <a href="/about.html">about</a>.\n</div>\n')
+
+
+def test_callout_with_same_styling_is_kept():
+    content = f"# Post\n\n{CALLOUT}\nSome text.\n"
+    assert strip_links(content) == content
+    assert find_links(content) == ([], 0)
+
+
+def test_legacy_block_is_removed_next_to_callout():
+    content = f"# Post\n\n{CALLOUT}\n{create_hiking_map_link(87, 'Silver Steps Trail')}\n"
+    assert strip_links(content) == f"# Post\n\n{CALLOUT}\n"
+    assert find_links(content) == ([], 1)
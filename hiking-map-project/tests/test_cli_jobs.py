@@ -0,0 +1,18 @@
+"""Every --jobs option rejects values below 1 before doing any work"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+
+
+@pytest.mark.parametrize('script', ['track_store.py', 'heatmap.py', 'auto_name_hikes.py'])
+@pytest.mark.parametrize('jobs', ['0', '-2'])
+def test_jobs_below_one_rejected(script, jobs):
+    result = subprocess.run([sys.executable, os.path.join(SCRIPTS_DIR, script), '--jobs', jobs],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 2
+    assert '--jobs must be at least 1' in result.stderr
@@ -0,0 +1,36 @@
+"""A heatmap rebuild must not leave tiles of removed activities behind"""
+
+import os
+
+from heatmap import MAX_ZOOM, activity_tiles, update_heatmap
+from track_store import TrackStore
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><trkseg>
+<trkpt lat="{lat}" lon="{lon}"></trkpt>
+<trkpt lat="{lat}" lon="{lon2}"></trkpt>
+</trkseg></trk>
+</gpx>
+"""
+
+
+def test_rebuild_clears_removed_activities(tmp_path):
+    files = {}
+    for activity_id, lat, lon in (('1', 47.5, -121.8), ('2', 46.0, -120.0)):
+        files[activity_id] = str(tmp_path / f"{activity_id}.gpx")
+        with open(files[activity_id], 'w') as f:
+            f.write(GPX.format(lat=lat, lon=lon, lon2=lon + 0.001))
+    store = TrackStore(str(tmp_path / 'store'))
+    store.ingest(files, jobs=1)
+    out_dir = str(tmp_path / 'heatmap')
+    update_heatmap(store, ['1', '2'], out_dir, jobs=1)
+
+    x, y = activity_tiles(store.positions('2'))[0]
+    removed_tile = os.path.join(out_dir, str(MAX_ZOOM), str(x), f"{y}.png")
+    assert os.path.exists(removed_tile)
+
+    update_heatmap(store, ['1'], out_dir, jobs=1, rebuild=True)
+    assert not os.path.exists(removed_tile)
+    x, y = activity_tiles(store.positions('1'))[0]
+    assert os.path.exists(os.path.join(out_dir, str(MAX_ZOOM), str(x), f"{y}.png"))
@@ -0,0 +1,84 @@
+"""HikeDB defers CSV exports to one flush, and commands flush before exiting"""
+
+import csv
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from hike_db import HIKING_CSV, TRAIL_FIELDS, TRAIL_NAMES_CSV, HikeDB, export_pending
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _write_csvs(data_dir):
+    with open(os.path.join(data_dir, TRAIL_NAMES_CSV), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRAIL_FIELDS)
+        for number in (1, 2):
+            writer.writerow([number, f'10{number}', '2024-01-0{number}', f'Hike {number}',
+                             '', '5.0', '', '', ''])
+    with open(os.path.join(data_dir, HIKING_CSV), 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Activity ID', 'Activity Name', 'Filename'])
+        writer.writerows([['101', 'Hike 1', ''], ['102', 'Hike 2', '']])
+
+
+def _trails(data_dir):
+    with open(os.path.join(data_dir, TRAIL_NAMES_CSV), newline='') as f:
+        return {row['Hike_Number']: row for row in csv.DictReader(f)}
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    _write_csvs(str(tmp_path))
+    return str(tmp_path)
+
+
+def test_updates_are_exported_once(data_dir):
+    db = HikeDB(data_dir)
+    db.update_trail(1, Trail_Name='Rattlesnake Ledge')
+    db.update_trail(2, Trail_Name='Mount Si')
+    assert _trails(data_dir)['1']['Trail_Name'] == ''
+    assert db.pending() == [TRAIL_NAMES_CSV]
+    assert db.flush() == [TRAIL_NAMES_CSV]
+    assert db.flush() == []
+    db.close()
+    assert _trails(data_dir)['2']['Trail_Name'] == 'Mount Si'
+
+
+def test_hand_edit_keeps_pending_rows(data_dir):
+    db = HikeDB(data_dir)
+    db.update_trail(1, Trail_Name='Rattlesnake Ledge')
+    db.close()
+    path = os.path.join(data_dir, TRAIL_NAMES_CSV)
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    rows[2][TRAIL_FIELDS.index('Notes')] = 'Edited by hand'
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    # Make sure the size/mtime stamp changes
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+
+    assert export_pending(data_dir) == [TRAIL_NAMES_CSV]
+    trails = _trails(data_dir)
+    assert trails['1']['Trail_Name'] == 'Rattlesnake Ledge'
+    assert trails['2']['Notes'] == 'Edited by hand'
+
+
+def test_update_trail_names_writes_csv_on_exit(tmp_path):
+    # A copy of the scripts, so the command's data/ is a scratch directory
+    shutil.copytree(os.path.join(PROJECT_DIR, 'scripts'), tmp_path / 'scripts',
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    os.makedirs(tmp_path / 'data')
+    _write_csvs(str(tmp_path / 'data'))
+    result = subprocess.run([sys.executable, str(tmp_path / 'scripts' / 'update_trail_names.py'),
+                             '2', 'Mount Si', 'North Bend, WA'],
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    trails = _trails(str(tmp_path / 'data'))
+    assert trails['2']['Trail_Name'] == 'Mount Si'
+    assert trails['2']['Location'] == 'North Bend, WA'
+    assert trails['1']['Trail_Name'] == ''
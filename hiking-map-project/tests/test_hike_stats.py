@@ -0,0 +1,65 @@
+"""hike_stats totals combine track-based and CSV-fallback hikes"""
+
+import csv
+import os
+
+import pytest
+
+from hike_db import TRAIL_FIELDS
+from hike_stats import compute_stats, track_stats
+from track_store import open_store
+
+HEADER = ['Activity ID', 'Activity Date', 'Activity Name', 'Filename',
+          'Moving Time', 'Distance', 'Elevation Gain', 'Elevation Loss']
+
+
+def _gpx(points):
+    trkpts = ''.join(f'<trkpt lat="{lat}" lon="-121.8"><ele>{ele}</ele>'
+                     f'<time>2023-05-01T10:{i // 3:02d}:{i % 3 * 20:02d}Z</time></trkpt>\n'
+                     for i, (lat, ele) in enumerate(points))
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">\n'
+            f'<trk><trkseg>\n{trkpts}</trkseg></trk>\n</gpx>\n')
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    os.makedirs(tmp_path / 'activities')
+    # 40 points 0.001° (111 m) apart, 20 s each: walking pace, flat
+    (tmp_path / 'activities' / '1.gpx').write_text(
+        _gpx([(47.5 + i * 0.001, 100.0) for i in range(40)]))
+    with open(tmp_path / 'hiking_activities.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        writer.writerow(['1', 'May 1, 2023, 10:00:00 AM', 'Track hike', 'activities/1.gpx',
+                         '0', '0', '0', '0'])
+        writer.writerow(['2', 'Jun 2, 2024, 9:00:00 AM', 'No GPS', '',
+                         '3600', '5000', '300', '250'])
+    with open(tmp_path / 'trail_names.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRAIL_FIELDS)
+        writer.writerow(['1', '1', '2023-05-01', 'Track hike', '', '4.3', '', '', ''])
+        writer.writerow(['2', '2', '2024-06-02', 'No GPS', '', '5.0', 'Mount Si', '', ''])
+    return str(tmp_path)
+
+
+def test_totals_and_rollups(data_dir):
+    store = open_store(data_dir, jobs=1)
+    track = track_stats(store)['1']
+    # Smoothing trims a little off the ends of the 4.3 km line
+    assert 3800 < track['distance_m'] < 4400
+    assert track['elevation_gain_m'] == pytest.approx(0.0)
+    assert track['moving_time_s'] > 0
+
+    stats = compute_stats(data_dir, store)
+    distance_km = round(track['distance_m'] / 1000 + 5.0, 1)
+    assert stats['Total Hikes'] == 2
+    assert stats['Total Distance (km)'] == distance_km
+    assert stats['Total Elevation Gain (m)'] == 300
+    assert stats['Total Moving Time (h)'] == round((track['moving_time_s'] + 3600) / 3600, 1)
+    assert stats['Longest Hike (km)'] == 5.0
+    assert stats['Date Range'] == '2023-05-01 to 2024-06-02'
+    assert sorted(stats['By Year']) == ['2023', '2024']
+    assert stats['By Year']['2024']['Distance (km)'] == 5.0
+    # A hike without a Location is grouped by the 1° cell of its start
+    assert sorted(stats['By Region']) == ['47°N 122°W', 'Mount Si']
@@ -0,0 +1,67 @@
+"""Nearby hikes must share cached Overpass responses per geohash cell"""
+
+import asyncio
+
+import numpy as np
+
+import auto_name_hikes
+from geocode_cache import GeocodeCache, geohash_bounds, geohash_cells
+
+
+def test_cells_cover_bbox():
+    bbox = (47.5, -121.9, 47.56, -121.8)
+    bounds = [geohash_bounds(cell) for cell in geohash_cells(bbox, 5)]
+    assert min(b[0] for b in bounds) <= bbox[0] and max(b[2] for b in bounds) >= bbox[2]
+    assert min(b[1] for b in bounds) <= bbox[1] and max(b[3] for b in bounds) >= bbox[3]
+
+
+def test_nearby_hikes_share_cells(tmp_path, monkeypatch):
+    fetched = []
+
+    async def fetch(south, west, north, east):
+        fetched.append((south, west, north, east))
+        await asyncio.sleep(0.01)
+        # One trail crossing the whole area, one in its south-west corner only
+        return [{'name': 'Long Trail', 'lines': [[[south, west], [north, east]]]},
+                {'name': 'Corner Loop', 'lines': [[[south + 1e-4, west + 1e-4]]]}]
+
+    monkeypatch.setattr(auto_name_hikes, 'fetch_overpass_bbox', fetch)
+    cache = GeocodeCache(str(tmp_path / 'cache.sqlite'))
+    tracks = [{'lat': np.array([47.50, 47.52]), 'lon': np.array([-121.87, -121.85])},
+              {'lat': np.array([47.505, 47.525]), 'lon': np.array([-121.865, -121.845])},
+              {'lat': np.array([47.51, 47.56]), 'lon': np.array([-121.80, -121.70])}]
+
+    def bbox(track):
+        return auto_name_hikes.track_bbox([track], auto_name_hikes.MATCH_DISTANCE_M)
+
+    async def match_all():
+        return await asyncio.gather(*(auto_name_hikes.query_overpass_bbox(bbox(track), cache)
+                                      for track in tracks))
+
+    # Cold cache: never more than one request per hike, and fewer when
+    # hikes overlap
+    first = asyncio.run(match_all())
+    assert len(fetched) <= len(tracks)
+    assert len(geohash_cells(bbox(tracks[0]), auto_name_hikes.OVERPASS_CELL_PRECISION)) > 1
+    assert all(trails for trails in first)
+    assert sum(trail['name'] == 'Long Trail' for trail in first[0]) == 1
+
+    # Warm cache: no requests, same trails
+    count = len(fetched)
+    assert asyncio.run(match_all()) == first
+    assert len(fetched) == count
+    cache.close()
+
+
+def test_trails_cached_only_in_cells_they_touch(tmp_path, monkeypatch):
+    async def fetch(south, west, north, east):
+        return [{'name': 'Corner Loop', 'lines': [[[south + 1e-4, west + 1e-4]]]}]
+
+    monkeypatch.setattr(auto_name_hikes, 'fetch_overpass_bbox', fetch)
+    cache = GeocodeCache(str(tmp_path / 'cache.sqlite'))
+    box = (47.5, -121.9, 47.56, -121.8)
+    cells = geohash_cells(box, auto_name_hikes.OVERPASS_CELL_PRECISION)
+    assert asyncio.run(auto_name_hikes.query_overpass_bbox(box, cache))
+    cached = [cell for cell in cells if cache.get('overpass_cell', cell)]
+    assert cached == [cells[0]]
+    cache.close()
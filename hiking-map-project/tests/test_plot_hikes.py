@@ -0,0 +1,84 @@
+"""Track payload encoding and command line of the map build"""
+
+import csv
+import os
+import subprocess
+import sys
+
+import pytest
+
+from plot_hikes import create_interactive_map, encode_polyline
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                      'scripts', 'plot_hikes.py')
+
+
+def _decode(text, precision=5):
+    """Reference decoder, mirroring the one shipped in the page"""
+    values, value, shift = [], 0, 0
+    for char in text:
+        chunk = ord(char) - 63
+        value |= (chunk & 0x1f) << shift
+        shift += 5
+        if chunk < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value, shift = 0, 0
+    coords, lat, lon = [], 0, 0
+    for dlat, dlon in zip(values[::2], values[1::2]):
+        lat, lon = lat + dlat, lon + dlon
+        coords.append([lat / 10 ** precision, lon / 10 ** precision])
+    return coords
+
+
+def test_encode_polyline_known_vector():
+    # The worked example of Google's polyline algorithm documentation
+    points = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    assert encode_polyline(points) == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+def test_encode_polyline_round_trip():
+    points = [[47.12345, -121.98765], [47.12346, -121.98765], [-33.5, 151.25], [0.0, 0.0]]
+    assert _decode(encode_polyline(points)) == points
+    assert encode_polyline([]) == ''
+
+
+@pytest.mark.parametrize('jobs', ['0', '-2'])
+def test_jobs_below_one_rejected(jobs):
+    # Rejected while parsing, before any data is read or the map is written
+    result = subprocess.run([sys.executable, SCRIPT, '--jobs', jobs],
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 2
+    assert '--jobs must be at least 1' in result.stderr
+
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><trkseg>
+<trkpt lat="{lat}" lon="-121.80"><ele>100</ele></trkpt>
+<trkpt lat="{lat2}" lon="-121.81"><ele>110</ele></trkpt>
+<trkpt lat="{lat3}" lon="-121.80"><ele>120</ele></trkpt>
+</trkseg></trk>
+</gpx>
+"""
+
+
+def test_split_build_counts_only_kept_fragments(tmp_path, capsys):
+    data_dir = tmp_path / 'data'
+    os.makedirs(data_dir / 'activities')
+    with open(data_dir / 'hiking_activities.csv', 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Activity ID', 'Activity Date', 'Activity Name', 'Activity Type',
+                         'Filename', 'Distance', 'Moving Time', 'Elevation Gain'])
+        for activity_id, lat in (('101', 47.5), ('102', 46.5)):
+            (data_dir / 'activities' / f'{activity_id}.gpx').write_text(
+                GPX.format(lat=lat, lat2=lat + 0.01, lat3=lat + 0.02))
+            writer.writerow([activity_id, 'May 1, 2023, 10:00:00 AM', f'Hike {activity_id}',
+                             'Hike', f'activities/{activity_id}.gpx', '2000', '3600', '20'])
+    split_dir = str(tmp_path / 'site')
+    create_interactive_map(str(data_dir), jobs=1, split_dir=split_dir)
+    os.remove(os.path.join(split_dir, 'tracks', '102.json'))
+    capsys.readouterr()
+
+    create_interactive_map(str(data_dir), jobs=1, split_dir=split_dir)
+    assert 'Build manifest: 1 activities reused, 1 rebuilt' in capsys.readouterr().out
+    assert os.path.exists(os.path.join(split_dir, 'tracks', '102.json'))
@@ -0,0 +1,43 @@
+"""TokenBucket.defer must hold back requests that were already waiting"""
+
+import asyncio
+import time
+
+from rate_limit import TokenBucket
+
+
+def test_defer_holds_back_queued_requests():
+    bucket = TokenBucket(rate=10.0, capacity=1)
+    start = time.monotonic()
+    fired = []
+    window = []
+
+    async def request():
+        await bucket.acquire()
+        fired.append(time.monotonic() - start)
+
+    async def refuse():
+        # A 429 arrives while every request is already queued on its token
+        await asyncio.sleep(0.25)
+        window.append(time.monotonic() - start)
+        bucket.defer(1.0)
+
+    async def main():
+        await asyncio.gather(refuse(), *(request() for _ in range(12)))
+
+    asyncio.run(main())
+    paused_from = window[0]
+    paused_to = paused_from + 1.0
+    assert len(fired) == 12
+    assert not [t for t in fired if paused_from < t < paused_to]
+    # Requests after the pause are still spaced at the bucket's rate
+    after = sorted(t for t in fired if t >= paused_to)
+    assert all(b - a >= 0.09 for a, b in zip(after, after[1:]))
+
+
+def test_wait_respects_defer():
+    bucket = TokenBucket(rate=100.0, capacity=1)
+    bucket.defer(0.2)
+    start = time.monotonic()
+    bucket.wait()
+    assert time.monotonic() - start >= 0.2
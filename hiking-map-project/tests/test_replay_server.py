@@ -0,0 +1,27 @@
+"""An unreachable upstream is answered with 502, not a dropped connection"""
+
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import replay_server
+
+
+def test_unreachable_upstream_answers_502(tmp_path, monkeypatch):
+    path = next(iter(replay_server.UPSTREAMS))
+    # Nothing listens on port 1
+    monkeypatch.setitem(replay_server.UPSTREAMS, path, 'http://127.0.0.1:1/')
+    recordings = replay_server.Recordings(str(tmp_path / 'recordings.json'))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), replay_server.make_handler(recordings, True))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}{path}?q=1", timeout=10)
+        assert error.value.code == 502
+        assert recordings.get(replay_server.request_key('GET', path, 'q=1', b'')) is None
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,18 @@
+"""Decimation keeps every Nth point and rejects factors below 1"""
+
+import numpy as np
+import pytest
+
+from simplify import DEFAULT_DECIMATION_FACTOR, decimate_mask, simplify_track
+
+
+def test_decimate_default_factor():
+    keep = decimate_mask(101)
+    assert keep.sum() == 101 // DEFAULT_DECIMATION_FACTOR + 1
+    assert keep[0] and keep[-1]
+
+
+def test_decimate_rejects_factor_below_one():
+    points = np.column_stack([np.linspace(47.0, 47.1, 50), np.linspace(-122.0, -121.9, 50)])
+    with pytest.raises(ValueError):
+        simplify_track(points, 'decimate', 0)
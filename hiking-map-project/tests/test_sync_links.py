@@ -0,0 +1,13 @@
+"""--jobs below 1 is rejected before any post is read"""
+
+import pytest
+
+from sync_links import main
+
+
+@pytest.mark.parametrize('jobs', ['0', '-2'])
+def test_jobs_below_one_rejected(jobs, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        main(['--dry-run', '--jobs', jobs])
+    assert exit_info.value.code == 2
+    assert '--jobs must be at least 1' in capsys.readouterr().err
@@ -0,0 +1,47 @@
+"""TrackCache keys on content and settings and evicts least recently used entries"""
+
+import os
+
+from track_cache import TrackCache
+
+POINTS = [[47.5 + i / 1000, -121.8] for i in range(50)]
+
+
+def _age(cache, key, seconds):
+    path = cache._path(key)
+    mtime = os.stat(path).st_mtime - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_key_depends_on_content_and_settings(tmp_path):
+    track = tmp_path / 'track.gpx'
+    track.write_text('one')
+    cache = TrackCache(str(tmp_path / 'cache'))
+    key = cache.key_for(str(track), 1, {'tolerance': 3.0})
+    assert key == cache.key_for(str(track), 1, {'tolerance': 3.0})
+    assert key != cache.key_for(str(track), 1, {'tolerance': 5.0})
+    assert key != cache.key_for(str(track), 2, {'tolerance': 3.0})
+    track.write_text('two')
+    assert key != cache.key_for(str(track), 1, {'tolerance': 3.0})
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TrackCache(str(tmp_path / 'cache'))
+    cache.put('old', POINTS)
+    cache.put('used', POINTS)
+    _age(cache, 'old', 100)
+    _age(cache, 'used', 200)
+    assert cache.get('used') == POINTS  # Touching it makes 'old' the oldest
+    cache.max_bytes = cache.stats()['size_bytes']
+
+    cache.put('new', POINTS)
+    assert cache.get('old') is None
+    assert cache.get('used') == POINTS and cache.get('new') == POINTS
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['size_bytes'] <= cache.max_bytes
+
+
+def test_size_survives_reopen(tmp_path):
+    cache = TrackCache(str(tmp_path / 'cache'))
+    cache.put('a', POINTS)
+    assert TrackCache(str(tmp_path / 'cache')).stats()['size_bytes'] == cache.stats()['size_bytes']
@@ -0,0 +1,39 @@
+"""A changed GPS file that fails to decode must not keep its old track"""
+
+import os
+
+from track_store import TrackStore
+
+GPX = """<?xml version="1.0" encoding="UTF-8"?>
+<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">
+<trk><trkseg>
+<trkpt lat="47.50" lon="-121.80"><ele>100</ele></trkpt>
+<trkpt lat="47.51" lon="-121.81"><ele>110</ele></trkpt>
+<trkpt lat="47.52" lon="-121.82"><ele>120</ele></trkpt>
+</trkseg></trk>
+</gpx>
+"""
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+    # Make sure the size/mtime stamp changes between writes
+    os.utime(path, ns=(os.stat(path).st_mtime_ns + 10 ** 9,) * 2)
+
+
+def test_failed_decode_drops_stale_entry(tmp_path):
+    good = str(tmp_path / 'good.gpx')
+    broken = str(tmp_path / 'broken.gpx')
+    _write(good, GPX)
+    _write(broken, GPX)
+    store = TrackStore(str(tmp_path / 'store'))
+    assert store.ingest({'1': good, '2': broken}, jobs=1) == (2, 0, 0)
+
+    # Only the broken file changes, so nothing else forces a rewrite
+    _write(broken, 'not a gpx file')
+    decoded, failed, removed = store.ingest({'1': good, '2': broken}, jobs=1)
+    assert (decoded, failed) == (0, 1)
+    assert '2' not in store.activities
+    assert len(store.track('1')['lat']) == 3
+    assert '2' not in TrackStore(str(tmp_path / 'store')).activities
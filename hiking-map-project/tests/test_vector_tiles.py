@@ -0,0 +1,87 @@
+"""PMTiles archives written by vector_tiles read back tile for tile"""
+
+import gzip
+import json
+import struct
+
+from vector_tiles import HEADER_SIZE, read_metadata, write_pmtiles, zxy_to_tile_id
+
+
+def _varints(data, pos, count):
+    values = []
+    for _ in range(count):
+        value = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        values.append(value)
+    return values, pos
+
+
+def _directory(data):
+    """Reference reader of a PMTiles v3 directory: [[tile_id, offset, length, run], ...]"""
+    (count,), pos = _varints(data, 0, 1)
+    deltas, pos = _varints(data, pos, count)
+    runs, pos = _varints(data, pos, count)
+    lengths, pos = _varints(data, pos, count)
+    offsets, pos = _varints(data, pos, count)
+    entries, tile_id = [], 0
+    for i in range(count):
+        tile_id += deltas[i]
+        if offsets[i] == 0 and i:
+            offset = entries[-1][1] + entries[-1][2]
+        else:
+            offset = offsets[i] - 1
+        entries.append([tile_id, offset, lengths[i], runs[i]])
+    return entries
+
+
+def _read_tile(archive, tile_id):
+    fields = struct.unpack_from('<B11Q', archive, 7)
+    root_offset, root_length, _, _, leaves_offset, _, data_offset = fields[1:8]
+    entries = _directory(archive[root_offset:root_offset + root_length])
+    while True:
+        entry = max((e for e in entries if e[0] <= tile_id), key=lambda e: e[0], default=None)
+        if entry is None:
+            return None
+        if entry[3] == 0:
+            start = leaves_offset + entry[1]
+            entries = _directory(archive[start:start + entry[2]])
+            continue
+        if tile_id >= entry[0] + entry[3]:
+            return None
+        start = data_offset + entry[1]
+        return archive[start:start + entry[2]]
+
+
+def test_tile_ids_follow_the_spec():
+    assert [zxy_to_tile_id(0, 0, 0), zxy_to_tile_id(1, 0, 0), zxy_to_tile_id(1, 0, 1),
+            zxy_to_tile_id(1, 1, 1), zxy_to_tile_id(1, 1, 0)] == [0, 1, 2, 3, 4]
+    assert zxy_to_tile_id(2, 0, 0) == 5
+
+
+def test_round_trip_with_runs_and_leaves(tmp_path):
+    path = str(tmp_path / 'tracks.pmtiles')
+    shared = gzip.compress(b'shared')
+    # Every other ID, so no two unique tiles form a run: enough entries to
+    # overflow the root directory into leaves
+    tiles = {tile_id: gzip.compress(str(tile_id).encode()) for tile_id in range(100, 20100, 2)}
+    tiles.update({tile_id: shared for tile_id in range(30000, 30010)})
+    metadata = {'name': 'tracks', 'hikes': 2}
+    stats = write_pmtiles(path, tiles, [[47.0, -122.0], [48.0, -121.0]], metadata)
+
+    with open(path, 'rb') as f:
+        archive = f.read()
+    assert archive[:7] == b'PMTiles' and archive[7] == 3
+    assert struct.unpack_from('<Q', archive, 48)[0] > 0  # leaf directories were needed
+    assert stats['tiles'] == len(tiles) and stats['contents'] == len(tiles) - 9
+    assert len(archive) == stats['bytes'] >= HEADER_SIZE
+    assert read_metadata(path) == json.loads(json.dumps(metadata))
+    for tile_id in (100, 102, 10000, 20098, 30000, 30009):
+        assert _read_tile(archive, tile_id) == tiles[tile_id]
+    for tile_id in (101, 20100, 30010):
+        assert _read_tile(archive, tile_id) is None